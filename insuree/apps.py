@@ -21,12 +21,23 @@ DEFAULT_CFG = {
     "gql_mutation_update_insurees_perms": ["101103"],
     "gql_mutation_delete_insurees_perms": ["101104"],
     "insuree_photos_root_path": None,
+    "insuree_photo_storage": "insuree.photo_storage.PhotoStorage",
+    "insuree_photo_sizes": {"thumbnail": 128, "medium": 512},  # largest side (in pixels) of each photo variant
+    "insuree_photo_variants_cache_timeout": 86400,  # (seconds) for the variants of photos stored in database
     "excluded_insuree_chfids": ['999999999'],  # fake insurees (and bound families) used, for example, in 'funding'
     "renewal_photo_age_adult": 60,  # age (in months) of a picture due for renewal for adults
     "renewal_photo_age_child": 12,  # age (in months) of a picture due for renewal for children
     "insuree_number_validator": None,  # Insuree number *function* that validates the insuree number
     "insuree_number_length": None,  # Insuree number length to validate
     "insuree_number_modulo_root": None,  # modulo base for checksum on last digit, requires length to be set too
+    # filter the row security and parent location through insuree_LocationAncestry instead of joining tblLocations
+    "use_location_ancestry": False,
+    "user_districts_cache_timeout": 60,  # (seconds) cross-request cache of the user districts used by row security
+    "total_count_exact_threshold": 1000,  # totalCount above which the ESTIMATE/CACHED strategies apply
+    "total_count_cache_timeout": 300,  # (seconds) counts kept by the CACHED strategy
+    "reference_cache_timeout": 300,  # (seconds) max age of the reference lists cached by each process
+    "report_cache_timeout": 0,  # (seconds) reports results cache, see report_cache (0: disabled)
+    "bulk_chunk_size": 1000,  # max rows per INSERT/UPDATE/IN-lookup in batch services (MSSQL caps at 2100 params)
 }
 
 
@@ -53,12 +64,22 @@ class InsureeConfig(AppConfig):
     validation_code_invalid_insuree_number_checksum = 4
     validation_code_invalid_insuree_number_exception = 5
     insuree_photos_root_path = None
+    insuree_photo_storage = "insuree.photo_storage.PhotoStorage"
+    insuree_photo_sizes = {"thumbnail": 128, "medium": 512}
+    insuree_photo_variants_cache_timeout = 86400
     excluded_insuree_chfids = ['999999999']
     renewal_photo_age_adult = 60
     renewal_photo_age_child = 12
     insuree_number_validator = None
     insuree_number_length = None
     insuree_number_modulo_root = None
+    use_location_ancestry = False
+    user_districts_cache_timeout = 60
+    total_count_exact_threshold = 1000
+    total_count_cache_timeout = 300
+    reference_cache_timeout = 300
+    report_cache_timeout = 0
+    bulk_chunk_size = 1000
 
     def _configure_permissions(self, cfg):
         InsureeConfig.gql_query_insurees_perms = cfg["gql_query_insurees_perms"]
@@ -84,6 +105,45 @@ class InsureeConfig(AppConfig):
         InsureeConfig.renewal_photo_age_adult = cfg["renewal_photo_age_adult"]
         InsureeConfig.renewal_photo_age_child = cfg["renewal_photo_age_child"]
 
+    def _configure_bulk(self, cfg):
+        InsureeConfig.bulk_chunk_size = cfg["bulk_chunk_size"]
+        InsureeConfig.total_count_exact_threshold = cfg["total_count_exact_threshold"]
+        InsureeConfig.total_count_cache_timeout = cfg["total_count_cache_timeout"]
+
+    def _configure_location_ancestry(self, cfg):
+        from django.db.models.signals import post_save
+        from .services import on_location_saved
+        InsureeConfig.use_location_ancestry = cfg["use_location_ancestry"]
+        post_save.connect(on_location_saved, sender="location.Location", dispatch_uid="insuree_location_ancestry")
+
+    def _configure_reference_cache(self, cfg):
+        from django.db.models.signals import post_save, post_delete
+        from .reference_cache import REFERENCE_MODELS, invalidate_reference
+        InsureeConfig.reference_cache_timeout = cfg["reference_cache_timeout"]
+        for model in REFERENCE_MODELS:
+            for signal in (post_save, post_delete):
+                signal.connect(invalidate_reference, sender=model, dispatch_uid="insuree_reference_cache")
+
+    def _configure_report_cache(self, cfg):
+        from core.service_signals import ServiceSignalBindType
+        from core.signals import bind_service_signal
+        from django.db.models.signals import post_save, post_delete
+        from .report_cache import REPORT_BULK_SIGNALS, REPORT_MODELS, invalidate_report_cache
+        InsureeConfig.report_cache_timeout = cfg["report_cache_timeout"]
+        for model in REPORT_MODELS:
+            for signal in (post_save, post_delete):
+                signal.connect(invalidate_report_cache, sender=model, dispatch_uid="insuree_report_cache")
+        for signal_name in REPORT_BULK_SIGNALS:
+            bind_service_signal(signal_name, invalidate_report_cache, bind_type=ServiceSignalBindType.AFTER)
+
+    def _configure_user_districts_cache(self, cfg):
+        from django.db.models.signals import post_save, post_delete
+        from .services import on_user_district_changed
+        InsureeConfig.user_districts_cache_timeout = cfg["user_districts_cache_timeout"]
+        for signal in (post_save, post_delete):
+            signal.connect(on_user_district_changed, sender="location.UserDistrict",
+                           dispatch_uid="insuree_user_districts_cache")
+
     def ready(self):
         from core.models import ModuleConfiguration
         cfg = ModuleConfiguration.get_or_default(MODULE_NAME, DEFAULT_CFG)
@@ -91,6 +151,11 @@ class InsureeConfig(AppConfig):
         self._configure_fake_insurees(cfg)
         self._configure_renewal(cfg)
         self._configure_photo_root(cfg)
+        self._configure_bulk(cfg)
+        self._configure_location_ancestry(cfg)
+        self._configure_user_districts_cache(cfg)
+        self._configure_reference_cache(cfg)
+        self._configure_report_cache(cfg)
 
     # Getting these at runtime for easier testing
     @classmethod
@@ -108,10 +173,26 @@ class InsureeConfig(AppConfig):
         return int(value) if value else None
 
     def set_dataloaders(self, dataloaders):
-        from .dataloaders import InsureeLoader, FamilyLoader
+        from .dataloaders import InsureeLoader, FamilyLoader, InsureeClientMutationIdLoader, \
+            FamilyClientMutationIdLoader, GenderLoader, RelationLoader, ProfessionLoader, EducationLoader, \
+            IdentificationTypeLoader, FamilyTypeLoader, ConfirmationTypeLoader, InsureePhotoLoader, \
+            InsureePhotoContentLoader, HealthFacilityLoader
 
         dataloaders["insuree_loader"] = InsureeLoader()
         dataloaders["family_loader"] = FamilyLoader()
+        dataloaders["insuree_client_mutation_id_loader"] = InsureeClientMutationIdLoader()
+        dataloaders["family_client_mutation_id_loader"] = FamilyClientMutationIdLoader()
+        dataloaders["gender_loader"] = GenderLoader()
+        dataloaders["relation_loader"] = RelationLoader()
+        dataloaders["profession_loader"] = ProfessionLoader()
+        dataloaders["education_loader"] = EducationLoader()
+        dataloaders["identification_type_loader"] = IdentificationTypeLoader()
+        dataloaders["family_type_loader"] = FamilyTypeLoader()
+        dataloaders["confirmation_type_loader"] = ConfirmationTypeLoader()
+        dataloaders["insuree_photo_loader"] = InsureePhotoLoader()
+        dataloaders["insuree_photo_content_loader"] = InsureePhotoContentLoader()
+        # provided by recent location modules (whatever the order of the modules), not by the older ones
+        dataloaders.setdefault("health_facility_loader", HealthFacilityLoader())
 
     @classmethod
     def __get_from_settings_or_default(cls, attribute_name, default=None):
@@ -125,3 +206,6 @@ class InsureeConfig(AppConfig):
             InsureeConfig.insuree_photos_root_path = from_config
         elif from_env := os.getenv("PHOTO_ROOT_PATH", None):
             InsureeConfig.insuree_photos_root_path = from_env
+        InsureeConfig.insuree_photo_storage = cfg["insuree_photo_storage"]
+        InsureeConfig.insuree_photo_sizes = cfg["insuree_photo_sizes"]
+        InsureeConfig.insuree_photo_variants_cache_timeout = cfg["insuree_photo_variants_cache_timeout"]
@@ -1,18 +1,117 @@
 from promise.dataloader import DataLoader
 from promise import Promise
+from location.models import HealthFacility
 
-from .models import Insuree, Family
+from .apps import InsureeConfig
+from .models import Insuree, Family, InsureeMutation, FamilyMutation, Gender, Relation, Profession, Education, \
+    IdentificationType, FamilyType, ConfirmationType, InsureePhoto
+from .reference_cache import get_references
 
 
-class InsureeLoader(DataLoader):
+class ModelLoader(DataLoader):
+    """
+    Loads model instances by primary key, in one query per batch (of at most bulk_chunk_size keys)
+    """
+    model = None
+
+    def get_queryset(self):
+        return self.model.objects.all()
+
+    def batch_load_fn(self, keys):
+        objects = {}
+        for i in range(0, len(keys), InsureeConfig.bulk_chunk_size):
+            objects.update(
+                (obj.pk, obj) for obj in self.get_queryset().filter(pk__in=keys[i:i + InsureeConfig.bulk_chunk_size]))
+        return Promise.resolve([objects.get(key) for key in keys])
+
+
+class InsureeLoader(ModelLoader):
+    model = Insuree
+
+
+class FamilyLoader(ModelLoader):
+    model = Family
+
+
+class HealthFacilityLoader(ModelLoader):
+    # only registered when the location module doesn't provide its own health_facility_loader
+    model = HealthFacility
+
+
+class ReferenceLoader(DataLoader):
+    """
+    Serves the reference tables from the process cache, without any query once it is loaded
+    """
+    model = None
+
     def batch_load_fn(self, keys):
-        insurees = {
-            insuree.id: insuree for insuree in Insuree.objects.filter(id__in=keys)
-        }
-        return Promise.resolve([insurees.get(insuree_id) for insuree_id in keys])
+        references = {obj.pk: obj for obj in get_references(self.model)}
+        return Promise.resolve([references.get(key) for key in keys])
+
+
+class GenderLoader(ReferenceLoader):
+    model = Gender
+
+
+class RelationLoader(ReferenceLoader):
+    model = Relation
+
+
+class ProfessionLoader(ReferenceLoader):
+    model = Profession
 
 
-class FamilyLoader(DataLoader):
+class EducationLoader(ReferenceLoader):
+    model = Education
+
+
+class IdentificationTypeLoader(ReferenceLoader):
+    model = IdentificationType
+
+
+class FamilyTypeLoader(ReferenceLoader):
+    model = FamilyType
+
+
+class ConfirmationTypeLoader(ReferenceLoader):
+    model = ConfirmationType
+
+
+class InsureePhotoLoader(ModelLoader):
+    # without the (deferred) base64 content
+    model = InsureePhoto
+
+
+class InsureePhotoContentLoader(ModelLoader):
+    model = InsureePhoto
+
+    def get_queryset(self):
+        return InsureePhoto.objects.with_photo()
+
+
+class PendingMutationIdLoader(DataLoader):
+    """
+    client_mutation_id of the first pending (received) mutation of each object, in a single query per page
+    """
+    mutation_model = None
+    object_field = None
+
     def batch_load_fn(self, keys):
-        families = {family.id: family for family in Family.objects.filter(id__in=keys)}
-        return Promise.resolve([families.get(family_id) for family_id in keys])
+        client_mutation_ids = {}
+        pending = self.mutation_model.objects \
+            .filter(**{f"{self.object_field}__in": keys}, mutation__status=0) \
+            .order_by("id") \
+            .values_list(self.object_field, "mutation__client_mutation_id")
+        for object_id, client_mutation_id in pending:
+            client_mutation_ids.setdefault(object_id, client_mutation_id)
+        return Promise.resolve([client_mutation_ids.get(object_id) for object_id in keys])
+
+
+class InsureeClientMutationIdLoader(PendingMutationIdLoader):
+    mutation_model = InsureeMutation
+    object_field = "insuree_id"
+
+
+class FamilyClientMutationIdLoader(PendingMutationIdLoader):
+    mutation_model = FamilyMutation
+    object_field = "family_id"
@@ -0,0 +1,142 @@
+"""
+Batch detection of the insurees likely registered twice, scored by blocks of insurees sharing the phonetic key
+of their last name, their year of birth and their village.
+"""
+import logging
+from difflib import SequenceMatcher
+from itertools import combinations, groupby, islice
+from multiprocessing import Pool
+
+from django.db import transaction
+from django.db.models import F
+from django.db.models.functions import Coalesce, ExtractYear
+
+from .apps import InsureeConfig
+from .models import Insuree, InsureeDuplicate
+from .phonetic import phonetic_key
+
+logger = logging.getLogger(__name__)
+
+BLOCK_FIELDS = ("last_name_key", "birth_year", "village_id")
+SCORED_FIELDS = ("id", "last_name", "other_names", "dob", "gender_id")
+
+
+def _ratio(a, b):
+    a, b = (a or "").strip().upper(), (b or "").strip().upper()
+    if not a or not b:
+        return 0.0
+    return SequenceMatcher(None, a, b).ratio()
+
+
+def score_pair(insuree, other):
+    """
+    Similarity (0 to 1) of two insurees of the same block, as dicts of SCORED_FIELDS
+    """
+    score = 0.4 * _ratio(insuree["last_name"], other["last_name"])
+    score += 0.4 * _ratio(insuree["other_names"], other["other_names"])
+    if insuree["dob"] is not None and insuree["dob"] == other["dob"]:
+        score += 0.1
+    if insuree["gender_id"] is not None and insuree["gender_id"] == other["gender_id"]:
+        score += 0.1
+    return round(score, 4)
+
+
+def score_block(args):
+    """
+    Candidate pairs (lowest id first) of a block scoring at least min_score, runs in the worker processes
+    """
+    block, min_score = args
+    pairs = []
+    for insuree, other in combinations(sorted(block, key=lambda i: i["id"]), 2):
+        score = score_pair(insuree, other)
+        if score >= min_score:
+            pairs.append((insuree["id"], other["id"], score))
+    return pairs
+
+
+def iter_blocks(chunk_size=None, max_block_size=None):
+    """
+    Blocks (lists of dicts of SCORED_FIELDS) of more than one valid insuree with the same last name key,
+    year of birth and village. Blocks larger than max_block_size (usually a too common name, scoring them
+    would be quadratic) are skipped.
+    """
+    rows = Insuree.objects \
+        .filter(validity_to__isnull=True, last_name_key__isnull=False) \
+        .annotate(birth_year=ExtractYear("dob"), village_id=Coalesce("current_village_id", "family__location_id")) \
+        .order_by(*[F(field).asc(nulls_last=True) for field in BLOCK_FIELDS]) \
+        .values(*SCORED_FIELDS, *BLOCK_FIELDS) \
+        .iterator(chunk_size=chunk_size or InsureeConfig.bulk_chunk_size)
+    for key, block in groupby(rows, key=lambda row: tuple(row[field] for field in BLOCK_FIELDS)):
+        block = [{field: row[field] for field in SCORED_FIELDS} for row in block]
+        if len(block) < 2:
+            continue
+        if max_block_size and len(block) > max_block_size:
+            logger.info("Skipping the block %s of %s insurees", key, len(block))
+            continue
+        yield block
+
+
+def find_duplicates(processes=None, chunk_size=None, min_score=0.8, max_block_size=500):
+    """
+    Candidate pairs (insuree_id, duplicate_id, score) over all the valid insurees, yielded as the blocks are scored.
+    processes: number of worker processes (default: one per CPU, 1 scores in the current process)
+    """
+    tasks = ((block, min_score) for block in iter_blocks(chunk_size, max_block_size))
+    if processes == 1:
+        for pairs in map(score_block, tasks):
+            yield from pairs
+        return
+    with Pool(processes) as pool:
+        # the workers only get plain data, they never touch the database
+        for pairs in pool.imap_unordered(score_block, tasks, chunksize=16):
+            yield from pairs
+
+
+def recompute_name_keys(all_insurees=False, chunk_size=None):
+    """
+    Computes the phonetic keys of the insurees that have none (created by another application or before the keys
+    were introduced), or of all the insurees (after a change of the phonetic rules). Returns the number of insurees.
+    """
+    chunk_size = chunk_size or InsureeConfig.bulk_chunk_size
+    queryset = Insuree.objects.all()
+    if not all_insurees:
+        queryset = queryset.filter(last_name_key__isnull=True, last_name__isnull=False)
+    count = 0
+    chunk = []
+    for insuree in queryset.only("id", "last_name", "other_names").iterator(chunk_size=chunk_size):
+        insuree.last_name_key = phonetic_key(insuree.last_name)
+        insuree.other_names_key = phonetic_key(insuree.other_names)
+        chunk.append(insuree)
+        if len(chunk) >= chunk_size:
+            count += _update_name_keys(chunk)
+    return count + _update_name_keys(chunk)
+
+
+def _update_name_keys(insurees):
+    count = len(insurees)
+    if insurees:
+        Insuree.objects.bulk_update(insurees, ["last_name_key", "other_names_key"])
+        insurees.clear()
+    return count
+
+
+def save_duplicates(pairs, detection_date, chunk_size=None):
+    """
+    Replaces the InsureeDuplicate rows by the pairs (any iterable, e.g. find_duplicates), inserted by chunks.
+    Returns the number of pairs.
+    """
+    chunk_size = chunk_size or InsureeConfig.bulk_chunk_size
+    pairs = iter(pairs)
+    count = 0
+    with transaction.atomic():
+        InsureeDuplicate.objects.all().delete()
+        while True:
+            chunk = [
+                InsureeDuplicate(insuree_id=insuree_id, duplicate_id=duplicate_id, score=score,
+                                 detection_date=detection_date)
+                for insuree_id, duplicate_id, score in islice(pairs, chunk_size)
+            ]
+            if not chunk:
+                return count
+            InsureeDuplicate.objects.bulk_create(chunk)
+            count += len(chunk)
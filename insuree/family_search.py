@@ -0,0 +1,46 @@
+"""
+Family search conditions on members and other multi-valued relations, as EXISTS subqueries that never
+multiply the family rows (no DISTINCT or id__in dedup pass needed).
+"""
+from django.db.models import Exists, OuterRef
+
+from .models import Family, FamilyMutation, Insuree
+
+MEMBERS_PREFIX = "members__"
+HEAD_INSUREE_PREFIX = "head_insuree__"
+
+
+def _strip_prefix(filters, prefix):
+    return {k[len(prefix):]: v for k, v in filters.items() if k.startswith(prefix)}
+
+
+def members_filter(filters):
+    """
+    Families having at least one (valid) member matching all the members__ filters
+    """
+    return Exists(Insuree.objects.filter(
+        family_id=OuterRef("pk"), validity_to__isnull=True, **_strip_prefix(filters, MEMBERS_PREFIX)))
+
+
+def head_insuree_filter(filters):
+    """
+    Families whose (valid) head insuree matches all the head_insuree__ filters
+    """
+    return Exists(Insuree.objects.filter(
+        id=OuterRef("head_insuree_id"), validity_to__isnull=True, **_strip_prefix(filters, HEAD_INSUREE_PREFIX)))
+
+
+def client_mutation_filter(client_mutation_id):
+    """
+    Families touched by the mutation client_mutation_id
+    """
+    return Exists(FamilyMutation.objects.filter(
+        family_id=OuterRef("pk"), mutation__client_mutation_id=client_mutation_id))
+
+
+def family_filter(*filters):
+    """
+    Families matching arbitrary filters (typically the additional filters provided by other modules),
+    which may traverse multi-valued relations
+    """
+    return Exists(Family.objects.filter(*filters, id=OuterRef("pk")))
@@ -4,9 +4,10 @@ import pathlib
 import base64
 import graphene
 
-from insuree.services import validate_insuree_number, InsureeService, FamilyService
+from insuree.services import validate_insuree_number, InsureeService, FamilyService, fetch_by_uuids
 
 from .apps import InsureeConfig
+from core.models import MutationLog
 from core.schema import OpenIMISMutation
 from django.contrib.auth.models import AnonymousUser
 from django.core.exceptions import ValidationError, PermissionDenied
@@ -69,6 +70,10 @@ class FamilyHeadInsureeInputType(InsureeBase, InputObjectType):
     pass
 
 
+class FamilyMemberInsureeInputType(InsureeBase, InputObjectType):
+    pass
+
+
 class FamilyBase:
     id = graphene.Int(required=False, read_only=True)
     uuid = graphene.String(required=False)
@@ -99,6 +104,10 @@ class UpdateFamilyInputType(FamilyInputType):
     pass
 
 
+class FamilyEnrollmentInputType(FamilyBase, InputObjectType):
+    members = graphene.List(FamilyMemberInsureeInputType, required=False)
+
+
 def create_file(date, insuree_id, photo_bin):
     date_iso = date.isoformat()
     root = InsureeConfig.insuree_photos_root_path
@@ -162,6 +171,45 @@ class CreateFamilyMutation(OpenIMISMutation):
             ]
 
 
+class CreateFamiliesMutation(OpenIMISMutation):
+    """
+    Create several new families at once, with their head insuree and members
+    """
+    _mutation_module = "insuree"
+    _mutation_class = "CreateFamiliesMutation"
+
+    class Input(OpenIMISMutation.Input):
+        families = graphene.List(FamilyEnrollmentInputType, required=True)
+
+    @classmethod
+    def async_mutate(cls, user, **data):
+        try:
+            if type(user) is AnonymousUser or not user.id:
+                raise ValidationError(
+                    _("mutation.authentication_required"))
+            if not user.has_perms(InsureeConfig.gql_mutation_create_families_perms):
+                raise PermissionDenied(_("unauthorized"))
+            client_mutation_id = data.get("client_mutation_id")
+            families = FamilyService(user).bulk_create(data["families"])
+            mutation_log_id = MutationLog.objects \
+                .filter(client_mutation_id=client_mutation_id, user=user) \
+                .order_by("-request_date_time") \
+                .values_list("id", flat=True) \
+                .first() if client_mutation_id else None
+            if mutation_log_id:
+                FamilyMutation.objects.bulk_create(
+                    [FamilyMutation(family=family, mutation_id=mutation_log_id) for family in families],
+                    batch_size=InsureeConfig.bulk_chunk_size
+                )
+            return None
+        except Exception as exc:
+            logger.exception("insuree.mutation.failed_to_create_families")
+            return [{
+                'message': _("insuree.mutation.failed_to_create_families"),
+                'detail': str(exc)}
+            ]
+
+
 class UpdateFamilyMutation(OpenIMISMutation):
     """
     Update an existing family, with its head insuree
@@ -209,18 +257,18 @@ class DeleteFamiliesMutation(OpenIMISMutation):
         if not user.has_perms(InsureeConfig.gql_mutation_delete_families_perms):
             raise PermissionDenied(_("unauthorized"))
         errors = []
+        families = {}
+        fetched = fetch_by_uuids(Family.objects.all(), data["uuids"])
         for family_uuid in data["uuids"]:
-            family = Family.objects \
-                .prefetch_related('members') \
-                .filter(uuid=family_uuid) \
-                .first()
+            family = fetched.get(str(family_uuid).lower())
             if family is None:
                 errors.append({
                     'title': family_uuid,
                     'list': [{'message': _("insuree.mutation.failed_to_delete_family") % {'uuid': family_uuid}}]
                 })
                 continue
-            errors += FamilyService(user).set_deleted(family, data["delete_members"])
+            families[family.id] = family
+        errors += FamilyService(user).bulk_set_deleted(list(families.values()), data["delete_members"])
         if len(errors) == 1:
             errors = errors[0]['list']
         return errors
@@ -308,11 +356,10 @@ class DeleteInsureesMutation(OpenIMISMutation):
         if not user.has_perms(InsureeConfig.gql_mutation_delete_insurees_perms):
             raise PermissionDenied(_("unauthorized"))
         errors = []
+        insurees = {}
+        fetched = fetch_by_uuids(Insuree.objects.select_related('family'), data["uuids"])
         for insuree_uuid in data["uuids"]:
-            insuree = Insuree.objects \
-                .prefetch_related('family') \
-                .filter(uuid=insuree_uuid) \
-                .first()
+            insuree = fetched.get(str(insuree_uuid).lower())
             if insuree is None:
                 errors.append({
                     'title': insuree_uuid,
@@ -320,14 +367,15 @@ class DeleteInsureesMutation(OpenIMISMutation):
                         "insuree.validation.id_does_not_exist") % {'id': insuree_uuid}}]
                 })
                 continue
-            if insuree.family and insuree.family.head_insuree.id == insuree.id:
+            if insuree.family and insuree.family.head_insuree_id == insuree.id:
                 errors.append({
                     'title': insuree_uuid,
                     'list': [{'message': _(
                         "insuree.validation.delete_head_insuree") % {'id': insuree_uuid}}]
                 })
                 continue
-            errors += InsureeService(user).set_deleted(insuree)
+            insurees[insuree.id] = insuree
+        errors += InsureeService(user).bulk_set_deleted(list(insurees.values()))
         if len(errors) == 1:
             errors = errors[0]['list']
         return errors
@@ -350,29 +398,26 @@ class RemoveInsureesMutation(OpenIMISMutation):
         if not user.has_perms(InsureeConfig.gql_mutation_delete_insurees_perms):
             raise PermissionDenied(_("unauthorized"))
         errors = []
+        insurees = {}
+        fetched = fetch_by_uuids(Insuree.objects.select_related('family'), data["uuids"])
         for insuree_uuid in data["uuids"]:
-            insuree = Insuree.objects \
-                .prefetch_related('family') \
-                .filter(uuid=insuree_uuid) \
-                .first()
+            insuree = fetched.get(str(insuree_uuid).lower())
             if insuree is None:
-                errors += {
+                errors.append({
                     'title': insuree_uuid,
                     'list': [{'message': _(
                         "insuree.validation.id_does_not_exist") % {'id': insuree_uuid}}]
-                }
+                })
                 continue
-            if insuree.family.head_insuree.id == insuree.id:
+            if insuree.family and insuree.family.head_insuree_id == insuree.id:
                 errors.append({
                     'title': insuree_uuid,
                     'list': [{'message': _(
                         "insuree.validation.remove_head_insuree") % {'id': insuree_uuid}}]
                 })
                 continue
-            insuree_service = InsureeService(user)
-            if data['cancel_policies']:
-                errors += insuree_service.cancel_policies(insuree)
-            errors += insuree_service.remove(insuree)
+            insurees[insuree.id] = insuree
+        errors += InsureeService(user).bulk_remove(list(insurees.values()), data['cancel_policies'])
         if len(errors) == 1:
             errors = errors[0]['list']
         return errors
@@ -426,6 +471,8 @@ class ChangeInsureeFamilyMutation(OpenIMISMutation):
     class Input(OpenIMISMutation.Input):
         family_uuid = graphene.String()
         insuree_uuid = graphene.String()
+        insuree_uuids = graphene.List(graphene.String, required=False,
+                                      description="Moves several insurees at once (instead of insureeUuid)")
         cancel_policies = graphene.Boolean(default_value=False)
 
     @classmethod
@@ -435,13 +482,25 @@ class ChangeInsureeFamilyMutation(OpenIMISMutation):
             raise PermissionDenied(_("unauthorized"))
         try:
             family = Family.objects.get(uuid=data['family_uuid'])
-            insuree = Insuree.objects.get(uuid=data['insuree_uuid'])
-            insuree.save_history()
-            insuree.family = family
-            insuree.save()
-            if data['cancel_policies']:
-                return InsureeService(user).cancel_policies(insuree)
-            return None
+            insuree_uuids = data.get('insuree_uuids') or [data.get('insuree_uuid')]
+            fetched = fetch_by_uuids(Insuree.objects.all(), insuree_uuids)
+            errors = []
+            insurees = {}
+            for insuree_uuid in insuree_uuids:
+                insuree = fetched.get(str(insuree_uuid).lower())
+                if insuree is None:
+                    errors.append({
+                        'title': insuree_uuid,
+                        'list': [{'message': _(
+                            "insuree.validation.id_does_not_exist") % {'id': insuree_uuid}}]
+                    })
+                    continue
+                insurees[insuree.id] = insuree
+            errors += InsureeService(user).bulk_change_family(
+                list(insurees.values()), family, data['cancel_policies'])
+            if len(errors) == 1:
+                errors = errors[0]['list']
+            return errors or None
         except Exception as exc:
             logger.exception("insuree.mutation.failed_to_change_insuree_family")
             return [{
@@ -1,16 +1,66 @@
+import base64
+
 import graphene
 from graphene_django import DjangoObjectType
+from graphql.language.ast import FragmentSpread, InlineFragment
 
 from .apps import InsureeConfig
 from .models import Insuree, InsureePhoto, Education, Profession, Gender, IdentificationType, \
-    Family, FamilyType, ConfirmationType, Relation, InsureePolicy, FamilyMutation, InsureeMutation
+    Family, FamilyType, ConfirmationType, Relation, InsureePolicy, FamilyMutation, InsureeMutation, \
+    InsureeDuplicate
 from location.schema import LocationGQLType
 from policy.gql_queries import PolicyGQLType
 from core import prefix_filterset, filter_validity, ExtendedConnection
 from django.utils.translation import gettext as _
 from django.core.exceptions import PermissionDenied
-
-from .services import load_photo_file
+from django.urls import reverse
+from django.utils.http import urlencode
+
+from .photo_storage import inline_variant
+from .services import load_photo_file, load_photo_variant_file
+
+
+def selected_paths(info):
+    """
+    Dotted paths of the fields selected below the resolved field (fragments included),
+    for example {"edges", "edges.node", "edges.node.photo", "edges.node.photo.date"}
+    """
+    paths = set()
+
+    def walk(selection_set, prefix):
+        if not selection_set:
+            return
+        for selection in selection_set.selections:
+            if isinstance(selection, FragmentSpread):
+                walk(info.fragments[selection.name.value].selection_set, prefix)
+            elif isinstance(selection, InlineFragment):
+                walk(selection.selection_set, prefix)
+            else:
+                path = prefix + selection.name.value
+                paths.add(path)
+                walk(selection.selection_set, path + ".")
+
+    for field_ast in info.field_asts:
+        walk(field_ast.selection_set, "")
+    return paths
+
+
+def get_dataloader(info, name):
+    # some contexts (tests, REST calls) come without dataloaders
+    return getattr(info.context, "dataloaders", {}).get(name)
+
+
+def load_related(info, loader, key, default):
+    """
+    Resolves a foreign key through the dataloader (batching the lookups of a whole page),
+    default is the (lazy) related object, used when the dataloaders are not available
+    """
+    if key is None:
+        return None
+    dataloader = get_dataloader(info, loader)
+    if dataloader:
+        return dataloader.load(key)
+    return default()
 
 
 class GenderGQLType(DjangoObjectType):
@@ -22,17 +72,35 @@ class GenderGQLType(DjangoObjectType):
 
 
 class PhotoGQLType(DjangoObjectType):
-    photo = graphene.String()
+    photo = graphene.String(size=graphene.String(description="Photo variant (see insuree_photo_sizes), full size if omitted"))
+    url = graphene.String(
+        size=graphene.String(),
+        description="Streaming (cacheable, range-enabled) endpoint for the photo content")
 
-    def resolve_photo(self, info):
+    def resolve_photo(self, info, size=None):
         if not info.context.user.has_perms(InsureeConfig.gql_query_insuree_photo_perms):
             raise PermissionDenied(_("unauthorized"))
         if self.photo:
+            if size:
+                return base64.b64encode(inline_variant(self.photo, size)).decode("utf-8")
             return self.photo
         elif InsureeConfig.insuree_photos_root_path and self.folder and self.filename:
+            if size:
+                return load_photo_variant_file(self.folder, self.filename, size)
             return load_photo_file(self.folder, self.filename)
         return None
 
+    def resolve_url(self, info, size=None):
+        if not info.context.user.has_perms(InsureeConfig.gql_query_insuree_photo_perms):
+            raise PermissionDenied(_("unauthorized"))
+        if not self.uuid:
+            return None
+        # the deferred base64 column isn't loaded only to tell if there is a content, the endpoint answers 404 if not
+        if not self.filename and "photo" not in self.get_deferred_fields() and not self.photo:
+            return None
+        url = reverse("insuree_photo", kwargs={"photo_uuid": self.uuid})
+        return "%s?%s" % (url, urlencode({"size": size})) if size else url
+
     class Meta:
         model = InsureePhoto
         filter_fields = {
@@ -114,16 +182,47 @@ class InsureeGQLType(DjangoObjectType):
     def resolve_health_facility(self, info):
         if not info.context.user.has_perms(InsureeConfig.gql_query_insuree_perms):
             raise PermissionDenied(_("unauthorized"))
-        if "health_facililty" in info.context.dataloaders and self.health_facility_id:
-            return info.context.dataloaders["health_facility"].load(
-                self.health_facility_id
-            )
-        return self.health_facility
+        return load_related(info, "health_facility_loader", self.health_facility_id, lambda: self.health_facility)
+
+    def resolve_gender(self, info):
+        if not info.context.user.has_perms(InsureeConfig.gql_query_insuree_perms):
+            raise PermissionDenied(_("unauthorized"))
+        return load_related(info, "gender_loader", self.gender_id, lambda: self.gender)
+
+    def resolve_relationship(self, info):
+        if not info.context.user.has_perms(InsureeConfig.gql_query_insuree_perms):
+            raise PermissionDenied(_("unauthorized"))
+        return load_related(info, "relation_loader", self.relationship_id, lambda: self.relationship)
+
+    def resolve_profession(self, info):
+        if not info.context.user.has_perms(InsureeConfig.gql_query_insuree_perms):
+            raise PermissionDenied(_("unauthorized"))
+        return load_related(info, "profession_loader", self.profession_id, lambda: self.profession)
+
+    def resolve_education(self, info):
+        if not info.context.user.has_perms(InsureeConfig.gql_query_insuree_perms):
+            raise PermissionDenied(_("unauthorized"))
+        return load_related(info, "education_loader", self.education_id, lambda: self.education)
+
+    def resolve_type_of_id(self, info):
+        if not info.context.user.has_perms(InsureeConfig.gql_query_insuree_perms):
+            raise PermissionDenied(_("unauthorized"))
+        return load_related(info, "identification_type_loader", self.type_of_id_id, lambda: self.type_of_id)
 
     def resolve_photo(self, info):
         if not info.context.user.has_perms(InsureeConfig.gql_query_insuree_perms):
             raise PermissionDenied(_("unauthorized"))
-        return self.photo
+        if not self.photo_id or Insuree.photo.field.is_cached(self):
+            return self.photo
+        # the base64 content is only loaded if the photo field itself is requested
+        with_content = "photo" in selected_paths(info)
+        dataloader = get_dataloader(info, "insuree_photo_content_loader" if with_content else "insuree_photo_loader")
+        if dataloader:
+            return dataloader.load(self.photo_id)
+        queryset = InsureePhoto.objects.filter(id=self.photo_id)
+        if with_content:
+            queryset = queryset.with_photo()
+        return queryset.first()
 
     class Meta:
         model = Insuree
@@ -151,6 +250,9 @@ class InsureeGQLType(DjangoObjectType):
     def resolve_client_mutation_id(self, info):
         if not info.context.user.has_perms(InsureeConfig.gql_query_insuree_perms):
             raise PermissionDenied(_("unauthorized"))
+        dataloader = get_dataloader(info, "insuree_client_mutation_id_loader")
+        if dataloader:
+            return dataloader.load(self.id)
         insuree_mutation = self.mutations.select_related(
             'mutation').filter(mutation__status=0).first()
         return insuree_mutation.mutation.client_mutation_id if insuree_mutation else None
@@ -166,14 +268,23 @@ class FamilyGQLType(DjangoObjectType):
     def resolve_location(self, info):
         if not info.context.user.has_perms(InsureeConfig.gql_query_families_perms):
             raise PermissionDenied(_("unauthorized"))
-        if "location_loader" in info.context.dataloaders:
-            return info.context.dataloaders["location_loader"].load(self.location_id)
+        return load_related(info, "location_loader", self.location_id, lambda: self.location)
 
     def resolve_head_insuree(self, info):
         if not info.context.user.has_perms(InsureeConfig.gql_query_families_perms):
             raise PermissionDenied(_("unauthorized"))
-        if "insuree_loader" in info.context.dataloaders:
-            return info.context.dataloaders["insuree_loader"].load(self.head_insuree_id)
+        return load_related(info, "insuree_loader", self.head_insuree_id, lambda: self.head_insuree)
+
+    def resolve_family_type(self, info):
+        if not info.context.user.has_perms(InsureeConfig.gql_query_families_perms):
+            raise PermissionDenied(_("unauthorized"))
+        return load_related(info, "family_type_loader", self.family_type_id, lambda: self.family_type)
+
+    def resolve_confirmation_type(self, info):
+        if not info.context.user.has_perms(InsureeConfig.gql_query_families_perms):
+            raise PermissionDenied(_("unauthorized"))
+        return load_related(info, "confirmation_type_loader", self.confirmation_type_id,
+                            lambda: self.confirmation_type)
 
     class Meta:
         model = Family
@@ -196,6 +307,9 @@ class FamilyGQLType(DjangoObjectType):
     def resolve_client_mutation_id(self, info):
         if not info.context.user.has_perms(InsureeConfig.gql_query_families_perms):
             raise PermissionDenied(_("unauthorized"))
+        dataloader = get_dataloader(info, "family_client_mutation_id_loader")
+        if dataloader:
+            return dataloader.load(self.id)
         family_mutation = self.mutations.select_related(
             'mutation').filter(mutation__status=0).first()
         return family_mutation.mutation.client_mutation_id if family_mutation else None
@@ -205,6 +319,13 @@ class FamilyGQLType(DjangoObjectType):
         return Family.get_queryset(queryset, info)
 
 
+class InsureeNumberValidityGQLType(graphene.ObjectType):
+    insuree_number = graphene.String()
+    is_valid = graphene.Boolean()
+    error_code = graphene.Int()
+    error_message = graphene.String()
+
+
 class InsureePolicyGQLType(DjangoObjectType):
     class Meta:
         model = InsureePolicy
@@ -224,6 +345,22 @@ class InsureePolicyGQLType(DjangoObjectType):
         return InsureePolicy.get_queryset(queryset, info)
 
 
+class InsureeDuplicateGQLType(DjangoObjectType):
+    class Meta:
+        model = InsureeDuplicate
+        filter_fields = {
+            "score": ["exact", "lt", "lte", "gt", "gte"],
+            "detection_date": ["exact", "lt", "lte", "gt", "gte"],
+            **prefix_filterset("insuree__", InsureeGQLType._meta.filter_fields),
+        }
+        interfaces = (graphene.relay.Node,)
+        connection_class = ExtendedConnection
+
+    @classmethod
+    def get_queryset(cls, queryset, info):
+        return InsureeDuplicate.get_queryset(queryset, info)
+
+
 class FamilyMutationGQLType(DjangoObjectType):
     class Meta:
         model = FamilyMutation
@@ -0,0 +1,100 @@
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Q
+
+from insuree.family_search import members_filter
+from insuree.models import Family, Insuree
+from insuree.services import reload_pks
+
+
+class Command(BaseCommand):
+    help = "Compares, on a generated dataset, the former families search plan (join on the members then " \
+           "id__in dedup) with the EXISTS based one. The data is generated in a transaction that is rolled back."
+
+    def add_arguments(self, parser):
+        parser.add_argument("nb_families", nargs=1, type=int)
+        parser.add_argument("nb_members", nargs=1, type=int)
+        parser.add_argument(
+            '--repeat',
+            type=int,
+            default=5,
+            help='Number of runs of each query, the median duration is reported (default 5)',
+        )
+        parser.add_argument(
+            '--last-names',
+            type=int,
+            default=20,
+            help='Number of distinct last names, the fewer the more members match in each family (default 20)',
+        )
+        parser.add_argument(
+            '--explain',
+            action='store_true',
+            dest='explain',
+            help='Also print the query plans',
+        )
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            self._generate(options["nb_families"][0], options["nb_members"][0], options["last_names"])
+            last_name = "Benchmark000"
+            member_filters = {"members__last_name": last_name}
+            plans = {
+                "join + id__in": Family.objects.filter(id__in=Family.objects.filter(
+                    Q(members__validity_to__isnull=True), validity_to__isnull=True, **member_filters,
+                ).values_list("id")),
+                "exists": Family.objects.filter(members_filter(member_filters), validity_to__isnull=True),
+            }
+            results = {}
+            for name, queryset in plans.items():
+                durations = []
+                for _ in range(options["repeat"]):
+                    started = time.perf_counter()
+                    results[name] = {family.id for family in queryset.all()}
+                    durations.append(time.perf_counter() - started)
+                self.stdout.write("%-15s %6d families, median %.1f ms (min %.1f ms)" % (
+                    name, len(results[name]), statistics.median(durations) * 1000, min(durations) * 1000))
+                if options["explain"]:
+                    self.stdout.write(queryset.explain())
+            if len(set(map(frozenset, results.values()))) != 1:
+                self.stderr.write("The plans returned different families!")
+            transaction.set_rollback(True)
+
+    def _generate(self, nb_families, nb_members, nb_last_names):
+        from core import datetime
+        now = datetime.datetime.now()
+        started = time.perf_counter()
+
+        def insuree(number, head):
+            return Insuree(
+                chf_id="BM%09d" % number,
+                last_name="Benchmark%03d" % random.randrange(nb_last_names),
+                other_names="Member",
+                gender_id="M",
+                dob="1980-01-01",
+                head=head,
+                card_issued=False,
+                validity_from=now,
+                audit_user_id=-1,
+            )
+
+        heads = [insuree(i * (nb_members + 1), True) for i in range(nb_families)]
+        Insuree.objects.bulk_create(heads, batch_size=1000)
+        reload_pks(Insuree, heads, 1000)
+        families = [Family(head_insuree=head, validity_from=now, audit_user_id=-1) for head in heads]
+        Family.objects.bulk_create(families, batch_size=1000)
+        reload_pks(Family, families, 1000)
+        members = []
+        for i, family in enumerate(families):
+            family.head_insuree.family = family
+            for m in range(1, nb_members + 1):
+                member = insuree(i * (nb_members + 1) + m, False)
+                member.family = family
+                members.append(member)
+        Insuree.objects.bulk_update(heads, ["family"], batch_size=1000)
+        Insuree.objects.bulk_create(members, batch_size=1000)
+        self.stdout.write("Generated %s families and %s insurees in %.1fs" % (
+            len(families), len(heads) + len(members), time.perf_counter() - started))
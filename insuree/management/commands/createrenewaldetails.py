@@ -0,0 +1,38 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from insuree.services import create_insuree_renewal_details
+
+
+class Command(BaseCommand):
+    help = "Creates the photo renewal details (tblPolicyRenewalDetails) of all the valid policy renewals, by " \
+           "chunks of renewals, for instance after a renewal run done outside of openIMIS."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=None,
+            help='Number of renewals per query (default: bulk_chunk_size)',
+        )
+        parser.add_argument(
+            '--renewal-date-from',
+            default=None,
+            help='Only the renewals from that date on (YYYY-MM-DD)',
+        )
+
+    def handle(self, *args, **options):
+        from policy.models import PolicyRenewal
+        renewals = PolicyRenewal.objects.filter(validity_to__isnull=True).order_by("id")
+        if options["renewal_date_from"]:
+            renewals = renewals.filter(renewal_date__gte=options["renewal_date_from"])
+        started = time.perf_counter()
+        total = renewals.count()
+
+        def progress(processed, created):
+            self.stdout.write("%s/%s renewals, %s details created (%.1fs)" % (
+                processed, total, created, time.perf_counter() - started))
+
+        created = create_insuree_renewal_details(renewals, options["chunk_size"], progress)
+        self.stdout.write(self.style.SUCCESS("Created %s photo renewal details" % created))
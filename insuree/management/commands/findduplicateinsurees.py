@@ -0,0 +1,59 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from insuree.duplicates import find_duplicates, recompute_name_keys, save_duplicates
+
+
+class Command(BaseCommand):
+    help = "Looks for the insurees likely registered twice (similar names, same year of birth and village) and " \
+           "replaces the insuree_InsureeDuplicate table (queried by insureeDuplicates) with the pairs found."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--processes',
+            type=int,
+            default=None,
+            help='Number of worker processes scoring the pairs (default: one per CPU)',
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=None,
+            help='Number of rows fetched/written per query (default: bulk_chunk_size)',
+        )
+        parser.add_argument(
+            '--min-score',
+            type=float,
+            default=0.8,
+            help='Minimum similarity, between 0 and 1, of the reported pairs (default 0.8)',
+        )
+        parser.add_argument(
+            '--max-block-size',
+            type=int,
+            default=500,
+            help='Blocks (same name key, year of birth and village) larger than this are skipped (default 500)',
+        )
+        parser.add_argument(
+            '--recompute-keys',
+            action='store_true',
+            dest='recompute_keys',
+            help='Recompute the phonetic keys of all the insurees (not only the missing ones), '
+                 'required after a change of the phonetic rules',
+        )
+
+    def handle(self, *args, **options):
+        from core import datetime
+        started = time.perf_counter()
+        count = recompute_name_keys(options["recompute_keys"], options["chunk_size"])
+        if count:
+            self.stdout.write("Computed the phonetic keys of %s insurees" % count)
+        pairs = find_duplicates(
+            processes=options["processes"],
+            chunk_size=options["chunk_size"],
+            min_score=options["min_score"],
+            max_block_size=options["max_block_size"],
+        )
+        count = save_duplicates(pairs, datetime.datetime.now(), options["chunk_size"])
+        self.stdout.write(self.style.SUCCESS("Found %s candidate duplicate pairs in %.1fs" % (
+            count, time.perf_counter() - started)))
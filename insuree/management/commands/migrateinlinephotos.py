@@ -0,0 +1,153 @@
+import binascii
+import json
+import os
+import time
+from os import path
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from insuree.apps import InsureeConfig
+from insuree.models import InsureePhoto
+from insuree.photo_storage import get_photo_storage
+
+
+class Command(BaseCommand):
+    help = "Moves the photos stored inline (base64) in tblPhotos.photo to the insuree_photos_root_path storage, " \
+           "filling PhotoFolder/PhotoFileName and clearing the column. Rows are processed by chunks, in PhotoID " \
+           "order: the files of a chunk are written first, then its rows are updated in a short transaction, so " \
+           "that it can run on a live database. Photos without insuree are reported and left inline. Progress is " \
+           "saved in a checkpoint file and an interrupted run resumes where it stopped."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=500,
+            help='Number of photos moved per transaction (default 500)',
+        )
+        parser.add_argument(
+            '--checkpoint-file',
+            default=None,
+            help='File keeping the progress, by default _migration/inline_photos.json in the photos root path',
+        )
+        parser.add_argument(
+            '--restart',
+            action='store_true',
+            dest='restart',
+            help='Ignore the checkpoint and start again from the first photo',
+        )
+        parser.add_argument(
+            '--max-rows',
+            type=int,
+            default=None,
+            help='Stop after this number of migrated photos (to spread the migration over several runs)',
+        )
+        parser.add_argument(
+            '--sleep',
+            type=float,
+            default=0,
+            help='Pause (in seconds) between chunks, to limit the load on the database',
+        )
+
+    def handle(self, *args, **options):
+        if not InsureeConfig.insuree_photos_root_path:
+            raise CommandError("insuree_photos_root_path is not configured, there is nowhere to move the photos to")
+        storage = get_photo_storage()
+        chunk_size = options["chunk_size"]
+        checkpoint_file = options["checkpoint_file"] or path.join(
+            InsureeConfig.insuree_photos_root_path, "_migration", "inline_photos.json")
+        checkpoint = {"last_id": 0, "migrated": 0, "bytes": 0}
+        if not options["restart"] and path.exists(checkpoint_file):
+            with open(checkpoint_file) as f:
+                checkpoint = json.load(f)
+            self.stdout.write("Resuming after photo %s (%s already migrated)" % (
+                checkpoint["last_id"], checkpoint["migrated"]))
+
+        to_migrate = InsureePhoto.objects.filter(photo__isnull=False).exclude(photo="")
+        remaining = to_migrate.filter(id__gt=checkpoint["last_id"]).count()
+        self.stdout.write("%s photos to migrate" % remaining)
+
+        started = time.monotonic()
+        migrated = 0
+        migrated_bytes = 0
+        failed = 0
+        while options["max_rows"] is None or migrated < options["max_rows"]:
+            limit = chunk_size if options["max_rows"] is None else min(chunk_size, options["max_rows"] - migrated)
+            photos = list(
+                to_migrate
+                .filter(id__gt=checkpoint["last_id"])
+                .order_by("id")
+                .only("id", "insuree_id", "date", "validity_from", "folder", "filename", "photo")[:limit]
+            )
+            if not photos:
+                break
+            # the files are written first, outside of any transaction: no row is locked during the I/O
+            written = {}
+            for photo in photos:
+                if not photo.insuree_id:
+                    # no insuree folder to store it in, left inline
+                    self.stderr.write("Photo %s has no insuree, skipped" % photo.id)
+                    failed += 1
+                    continue
+                if photo.filename and path.exists(storage.full_path(photo.folder, photo.filename)):
+                    written[photo.id] = (photo.folder, photo.filename, False)
+                    continue
+                try:
+                    folder, filename = storage.save(photo.date or photo.validity_from, photo.insuree_id, photo.photo)
+                except (ValueError, binascii.Error):
+                    # left inline, a run with --restart will report it again
+                    self.stderr.write("Photo %s is not valid base64, skipped" % photo.id)
+                    failed += 1
+                    continue
+                written[photo.id] = (folder, filename, True)
+            contents = {photo.id: photo.photo for photo in photos}
+            moved, chunk_bytes = [], 0
+            try:
+                with transaction.atomic():
+                    # only the rows still holding the content that was written are updated
+                    for photo in InsureePhoto.objects.with_photo().select_for_update() \
+                            .filter(id__in=written.keys()).only("id", "photo"):
+                        if photo.photo != contents[photo.id]:
+                            continue
+                        chunk_bytes += len(photo.photo)
+                        photo.folder, photo.filename, _ = written[photo.id]
+                        photo.photo = None
+                        moved.append(photo)
+                    InsureePhoto.objects.bulk_update(moved, ["folder", "filename", "photo"])
+            except Exception:
+                self._delete_files(storage, written.values())
+                raise
+            moved_ids = {photo.id for photo in moved}
+            self._delete_files(storage, [file for photo_id, file in written.items() if photo_id not in moved_ids])
+            # the skipped photos are not counted, they are still inline
+            migrated += len(moved)
+            migrated_bytes += chunk_bytes
+            checkpoint["last_id"] = photos[-1].id
+            checkpoint["migrated"] += len(moved)
+            checkpoint["bytes"] += chunk_bytes
+            self._save_checkpoint(checkpoint_file, checkpoint)
+            elapsed = max(time.monotonic() - started, 0.001)
+            self.stdout.write("Migrated %s/%s photos (up to PhotoID %s): %.1f photos/s, %.2f MB/s" % (
+                migrated, remaining, checkpoint["last_id"], migrated / elapsed,
+                migrated_bytes / elapsed / 1024 / 1024))
+            if options["sleep"]:
+                time.sleep(options["sleep"])
+
+        self.stdout.write(self.style.SUCCESS("Done, %s photos (%.1f MB of base64) processed in %.1fs, %s skipped" % (
+            migrated, migrated_bytes / 1024 / 1024, time.monotonic() - started, failed)))
+
+    @staticmethod
+    def _delete_files(storage, files):
+        # files written by this run but not referenced: a (content-addressed) file can be shared by another row
+        for folder, filename, created in files:
+            if created and not InsureePhoto.objects.filter(folder=folder, filename=filename).exists():
+                storage.delete(folder, filename)
+
+    @staticmethod
+    def _save_checkpoint(checkpoint_file, checkpoint):
+        os.makedirs(path.dirname(checkpoint_file) or ".", exist_ok=True)
+        tmp_file = checkpoint_file + ".tmp"
+        with open(tmp_file, "w") as f:
+            json.dump(checkpoint, f)
+        os.replace(tmp_file, checkpoint_file)
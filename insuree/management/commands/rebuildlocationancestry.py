@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from insuree.services import rebuild_location_ancestry
+
+
+class Command(BaseCommand):
+    help = "Recomputes the insuree_LocationAncestry table from tblLocations. Locations saved through openIMIS " \
+           "keep it up to date, this is needed after locations were created or moved by another application " \
+           "(or by SQL scripts), before relying on it with use_location_ancestry."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=None,
+            help='Number of rows per INSERT (default: bulk_chunk_size)',
+        )
+
+    def handle(self, *args, **options):
+        count = rebuild_location_ancestry(options["chunk_size"])
+        self.stdout.write(self.style.SUCCESS("Location ancestry rebuilt, %s rows" % count))
@@ -0,0 +1,45 @@
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def populate_location_ancestry(apps, schema_editor):
+    Location = apps.get_model('location', 'Location')
+    LocationAncestry = apps.get_model('insuree', 'LocationAncestry')
+    parents = dict(Location.objects.values_list('id', 'parent_id'))
+    rows = []
+    for location_id in parents:
+        ancestor_id, depth = location_id, 0
+        while ancestor_id is not None and depth <= len(parents):
+            rows.append(LocationAncestry(location_id=location_id, ancestor_id=ancestor_id, depth=depth))
+            ancestor_id, depth = parents.get(ancestor_id), depth + 1
+    LocationAncestry.objects.bulk_create(rows, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('location', '0013_auto_20230317_1534'),
+        ('insuree', '0015_set_managed_to_true_in_all_models'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LocationAncestry',
+            fields=[
+                ('id', models.AutoField(db_column='LocationAncestryId', primary_key=True, serialize=False)),
+                ('depth', models.SmallIntegerField(db_column='Depth')),
+                ('ancestor', models.ForeignKey(db_column='AncestorId', on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='location.location')),
+                ('location', models.ForeignKey(db_column='LocationId', on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='location.location')),
+            ],
+            options={
+                'db_table': 'insuree_LocationAncestry',
+                'managed': True,
+                'unique_together': {('location', 'ancestor')},
+            },
+        ),
+        migrations.AddIndex(
+            model_name='locationancestry',
+            index=models.Index(fields=['ancestor', 'depth', 'location'], name='insuree_ancestry_lookup_idx'),
+        ),
+        migrations.RunPython(populate_location_ancestry, migrations.RunPython.noop),
+    ]
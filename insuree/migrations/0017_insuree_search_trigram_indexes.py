@@ -0,0 +1,52 @@
+import logging
+
+from django.db import migrations
+
+logger = logging.getLogger(__name__)
+
+# the expressions are those of Django's icontains/istartswith lookups on PostgreSQL, UPPER("column"::text),
+# so that the existing filters benefit from the indexes as well
+SEARCH_COLUMNS = ["CHFID", "LastName", "OtherNames", "Phone", "Email", "passport"]
+
+
+def index_name(column):
+    return "insuree_%s_trgm_idx" % column.lower()
+
+
+def create_trigram_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        # MSSQL: the insurees search falls back to prefix lookups, served by regular indexes
+        return
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm'")
+        if cursor.fetchone() is None:
+            logger.warning("The pg_trgm extension is not available on this server (postgresql-contrib), the insurees "
+                           "search will not be indexed. Install it and rerun this migration to get the indexes.")
+            return
+    # any other failure (missing privileges,...) stops the migration
+    schema_editor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    for column in SEARCH_COLUMNS:
+        # concurrently: tblInsuree stays writable while the indexes are built
+        schema_editor.execute(
+            'CREATE INDEX CONCURRENTLY IF NOT EXISTS "%s" ON "tblInsuree" USING gin (UPPER("%s"::text) gin_trgm_ops)'
+            % (index_name(column), column))
+
+
+def drop_trigram_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    for column in SEARCH_COLUMNS:
+        schema_editor.execute('DROP INDEX CONCURRENTLY IF EXISTS "%s"' % index_name(column))
+
+
+class Migration(migrations.Migration):
+    # CREATE INDEX CONCURRENTLY cannot run in a transaction
+    atomic = False
+
+    dependencies = [
+        ('insuree', '0016_locationancestry'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_trigram_indexes, drop_trigram_indexes),
+    ]
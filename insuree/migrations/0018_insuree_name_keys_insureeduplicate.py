@@ -0,0 +1,37 @@
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('insuree', '0017_insuree_search_trigram_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='insuree',
+            name='last_name_key',
+            field=models.CharField(blank=True, db_column='LastNameKey', db_index=True, max_length=8, null=True),
+        ),
+        migrations.AddField(
+            model_name='insuree',
+            name='other_names_key',
+            field=models.CharField(blank=True, db_column='OtherNamesKey', max_length=8, null=True),
+        ),
+        migrations.CreateModel(
+            name='InsureeDuplicate',
+            fields=[
+                ('id', models.AutoField(db_column='InsureeDuplicateId', primary_key=True, serialize=False)),
+                ('score', models.FloatField(db_column='Score')),
+                ('detection_date', models.DateTimeField(db_column='DetectionDate')),
+                ('duplicate', models.ForeignKey(db_column='DuplicateInsureeId', on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='insuree.insuree')),
+                ('insuree', models.ForeignKey(db_column='InsureeId', on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='insuree.insuree')),
+            ],
+            options={
+                'db_table': 'insuree_InsureeDuplicate',
+                'managed': True,
+                'unique_together': {('insuree', 'duplicate')},
+            },
+        ),
+    ]
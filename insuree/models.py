@@ -4,6 +4,7 @@ import uuid
 import core
 from core import models as core_models
 from django.conf import settings
+from django.core.cache import cache
 from django.db import models
 from graphql import ResolveInfo
 from insuree.apps import InsureeConfig
@@ -25,6 +26,19 @@ class Gender(models.Model):
         db_table = 'tblGender'
 
 
+class InsureePhotoQuerySet(models.QuerySet):
+    def with_photo(self):
+        """
+        Also loads the (base64) photo column, deferred by default
+        """
+        return self.defer(None)
+
+
+class InsureePhotoManager(models.Manager.from_queryset(InsureePhotoQuerySet)):
+    def get_queryset(self):
+        return super().get_queryset().defer("photo")
+
+
 class InsureePhoto(core_models.VersionedModel):
     id = models.AutoField(db_column='PhotoID', primary_key=True)
     uuid = models.CharField(db_column='PhotoUUID',
@@ -46,6 +60,15 @@ class InsureePhoto(core_models.VersionedModel):
         db_column='AuditUserID', blank=True, null=True)
     # rowid = models.TextField(db_column='RowID', blank=True, null=True)
 
+    objects = InsureePhotoManager()
+
+    def save_history(self, **kwargs):
+        # the history copy is inserted with all its fields, the deferred ones have to be loaded first
+        deferred_fields = self.get_deferred_fields()
+        if self.id and deferred_fields:
+            self.refresh_from_db(fields=deferred_fields)
+        return super().save_history(**kwargs)
+
     def full_file_path(self):
         if not InsureeConfig.insuree_photos_root_path or not self.filename:
             return None
@@ -85,6 +108,79 @@ class ConfirmationType(models.Model):
         db_table = 'tblConfirmationTypes'
 
 
+class LocationAncestry(models.Model):
+    """
+    Closure of the tblLocations parent relationship: one row per (location, ancestor) pair, the location itself
+    being its own ancestor at depth 0. Kept in sync when locations are saved (see update_location_ancestry)
+    and rebuilt by the rebuildlocationancestry command, it replaces the location__parent__parent... joins of
+    the row security and parent location filters when use_location_ancestry is enabled.
+    """
+    id = models.AutoField(db_column='LocationAncestryId', primary_key=True)
+    location = models.ForeignKey(location_models.Location, models.DO_NOTHING,
+                                 db_column='LocationId', related_name='+')
+    ancestor = models.ForeignKey(location_models.Location, models.DO_NOTHING,
+                                 db_column='AncestorId', related_name='+')
+    depth = models.SmallIntegerField(db_column='Depth')
+
+    class Meta:
+        managed = True
+        db_table = 'insuree_LocationAncestry'
+        unique_together = ('location', 'ancestor')
+        indexes = [
+            models.Index(fields=['ancestor', 'depth', 'location'], name='insuree_ancestry_lookup_idx'),
+        ]
+
+
+USER_DISTRICTS_VERSION_KEY = "insuree_user_districts_version"
+
+
+def get_user_district_ids(user):
+    """
+    Ids of the districts of the user (cfr UserDistrict.get_user_districts), kept in the Django cache for
+    user_districts_cache_timeout seconds and on the user object, as long as the cache version is the same.
+    The cache is invalidated (see invalidate_user_districts) when user districts or districts are saved.
+    """
+    if hasattr(user, "_u"):
+        user = user._u
+    version = cache.get(USER_DISTRICTS_VERSION_KEY, 0)
+    cached = getattr(user, "_insuree_district_ids", None)
+    # a long-lived user object doesn't keep the districts of a previous version
+    if cached is not None and cached[0] == version:
+        return cached[1]
+    key = "insuree_user_districts_%s_%s_%s" % (version, type(user).__name__, user.id)
+    district_ids = cache.get(key)
+    if district_ids is None:
+        district_ids = [d.location_id for d in UserDistrict.get_user_districts(user)]
+        cache.set(key, district_ids, InsureeConfig.user_districts_cache_timeout)
+    user._insuree_district_ids = (version, district_ids)
+    return district_ids
+
+
+def invalidate_user_districts():
+    # a new version makes all the cached entries unreachable, they expire on their own
+    cache.set(USER_DISTRICTS_VERSION_KEY, uuid.uuid4().hex, None)
+
+
+def district_filter(location_field, district_ids):
+    """
+    Q limiting <location_field> (a village) to the villages of the given districts
+    """
+    if InsureeConfig.use_location_ancestry:
+        return models.Q(**{f"{location_field}__in": LocationAncestry.objects.filter(
+            ancestor_id__in=district_ids, depth=2).values("location_id")})
+    return models.Q(**{f"{location_field}__parent__parent_id__in": district_ids})
+
+
+def parent_location_filter(location_field, parent_uuid, depth):
+    """
+    Q limiting <location_field> to the locations <depth> levels below the location parent_uuid
+    """
+    if InsureeConfig.use_location_ancestry:
+        return models.Q(**{f"{location_field}__in": LocationAncestry.objects.filter(
+            ancestor__uuid=parent_uuid, depth=depth).values("location_id")})
+    return models.Q(**{f"{location_field}__{'parent__' * depth}uuid": parent_uuid})
+
+
 class Family(core_models.VersionedModel, core_models.ExtendableModel):
     id = models.AutoField(db_column='FamilyID', primary_key=True)
     uuid = models.CharField(db_column='FamilyUUID',
@@ -136,9 +232,9 @@ class Family(core_models.VersionedModel, core_models.ExtendableModel):
                 members__chf_id__in=InsureeConfig.excluded_insuree_chfids
             )
         if settings.ROW_SECURITY:
-            dist = UserDistrict.get_user_districts(user._u)
+            district_ids = get_user_district_ids(user)
             return queryset.filter(
-                location__parent__parent_id__in=[l.location_id for l in dist]
+                district_filter("location", district_ids)
             )
         return queryset
 
@@ -258,6 +354,21 @@ class Insuree(core_models.VersionedModel, core_models.ExtendableModel):
     offline = models.BooleanField(db_column='isOffline', blank=True, null=True)
     audit_user_id = models.IntegerField(db_column='AuditUserID')
     # row_id = models.BinaryField(db_column='RowID', blank=True, null=True)
+    # phonetic keys of the names (see insuree.phonetic), for the duplicates detection
+    last_name_key = models.CharField(db_column='LastNameKey', max_length=8, blank=True, null=True, db_index=True)
+    other_names_key = models.CharField(db_column='OtherNamesKey', max_length=8, blank=True, null=True)
+
+    def update_name_keys(self):
+        from .phonetic import phonetic_key
+        self.last_name_key = phonetic_key(self.last_name)
+        self.other_names_key = phonetic_key(self.other_names)
+
+    def save(self, *args, **kwargs):
+        self.update_name_keys()
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None and ({"last_name", "other_names"} & set(update_fields)):
+            kwargs["update_fields"] = list(update_fields) + ["last_name_key", "other_names_key"]
+        return super().save(*args, **kwargs)
 
     def is_head_of_family(self):
         return self.family and self.family.head_insuree == self
@@ -287,9 +398,9 @@ class Insuree(core_models.VersionedModel, core_models.ExtendableModel):
         # (aka the 'preferred/reference' HF for an insuree)
         # ... so not to be used as 'strict filtering'
         if settings.ROW_SECURITY:
-            dist = UserDistrict.get_user_districts(user._u)
+            district_ids = get_user_district_ids(user)
             return queryset.filter(
-                models.Q(family__location__parent__parent_id__in=[l.location.id for l in dist]) |
+                district_filter("family__location", district_ids) |
                 models.Q(family__isnull=True)
             )
         return queryset
@@ -329,9 +440,9 @@ class InsureePolicy(core_models.VersionedModel):
         if settings.ROW_SECURITY and user.is_anonymous:
             return queryset.filter(id=-1)
         if settings.ROW_SECURITY:
-            dist = UserDistrict.get_user_districts(user._u)
+            district_ids = get_user_district_ids(user)
             return queryset.filter(
-                insuree__family__location__parent__parent_id__in=[l.location_id for l in dist]
+                district_filter("insuree__family__location", district_ids)
             )
         return queryset
 
@@ -340,6 +451,35 @@ class InsureePolicy(core_models.VersionedModel):
         db_table = 'tblInsureePolicy'
 
 
+class InsureeDuplicate(models.Model):
+    """
+    Pair of insurees likely to be the same person, found by the findduplicateinsurees command
+    (insuree is the one with the lowest id)
+    """
+    id = models.AutoField(db_column='InsureeDuplicateId', primary_key=True)
+    insuree = models.ForeignKey(Insuree, models.DO_NOTHING, db_column='InsureeId', related_name='+')
+    duplicate = models.ForeignKey(Insuree, models.DO_NOTHING, db_column='DuplicateInsureeId', related_name='+')
+    score = models.FloatField(db_column='Score')
+    detection_date = models.DateTimeField(db_column='DetectionDate')
+
+    @classmethod
+    def get_queryset(cls, queryset, user):
+        if queryset is None:
+            queryset = cls.objects.all()
+        # GraphQL calls with an info object while Rest calls with the user itself
+        if isinstance(user, ResolveInfo):
+            user = user.context.user
+        # both insurees must still be valid and visible by the user
+        insurees = Insuree.get_queryset(None, user).values("id")
+        return queryset.filter(insuree_id__in=insurees, duplicate_id__in=insurees,
+                               insuree__validity_to__isnull=True, duplicate__validity_to__isnull=True)
+
+    class Meta:
+        managed = True
+        db_table = 'insuree_InsureeDuplicate'
+        unique_together = ('insuree', 'duplicate')
+
+
 class InsureeMutation(core_models.UUIDModel, core_models.ObjectMutation):
     insuree = models.ForeignKey(Insuree, models.DO_NOTHING, related_name='mutations')
     mutation = models.ForeignKey(core_models.MutationLog, models.DO_NOTHING, related_name='insurees')
@@ -0,0 +1,239 @@
+import base64
+import datetime
+import hashlib
+import json
+import logging
+import operator
+from functools import reduce
+
+import graphene
+from core.schema import OrderedDjangoFilterConnectionField
+from django.core.cache import cache
+from django.core.exceptions import FieldDoesNotExist
+from django.db import connections
+from django.db.models import F, Q
+from graphene.relay import PageInfo
+from graphene_django.utils import maybe_queryset
+from graphql_relay import cursor_to_offset, offset_to_cursor
+
+from .apps import InsureeConfig
+
+try:
+    from core.data_masking.masking_decorator import anonymize_gql
+except ImportError:
+    anonymize_gql = None
+
+logger = logging.getLogger(__name__)
+
+
+class CountStrategy(graphene.Enum):
+    EXACT = "exact"
+    ESTIMATE = "estimate"
+    CACHED = "cached"
+
+    @property
+    def description(self):
+        if self == CountStrategy.ESTIMATE:
+            return "exact up to total_count_exact_threshold, query planner estimate above (PostgreSQL only, " \
+                   "cached count on other databases)"
+        if self == CountStrategy.CACHED:
+            return "exact up to total_count_exact_threshold, count cached for total_count_cache_timeout above"
+        return "exact count (default)"
+
+
+def _planner_estimate(queryset):
+    sql, params = queryset.query.sql_with_params()
+    with connections[queryset.db].cursor() as cursor:
+        cursor.execute("EXPLAIN (FORMAT JSON) " + sql, params)
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]["Plan"]["Plan Rows"])
+
+
+def count_queryset(queryset, strategy=CountStrategy.EXACT.value):
+    """
+    Number of rows of the queryset, exact or, for large results, estimated by the query planner
+    or cached (keyed by the SQL, so by the filters and the row security) depending on the strategy
+    """
+    queryset = queryset.order_by()
+    if strategy not in (CountStrategy.ESTIMATE.value, CountStrategy.CACHED.value):
+        return queryset.count()
+    threshold = InsureeConfig.total_count_exact_threshold
+    # bounded count: never reads more than threshold + 1 rows
+    count = queryset.values("pk")[:threshold + 1].count()
+    if count <= threshold:
+        return count
+    if strategy == CountStrategy.ESTIMATE.value and connections[queryset.db].vendor == "postgresql":
+        try:
+            return max(_planner_estimate(queryset), count)
+        except Exception:
+            logger.warning("Could not get the planner estimate, counting instead", exc_info=True)
+    sql, params = queryset.query.sql_with_params()
+    key = "insuree_count_%s" % hashlib.md5(("%s %s" % (sql, params)).encode("utf-8")).hexdigest()
+    return cache.get_or_set(key, queryset.count, InsureeConfig.total_count_cache_timeout)
+
+
+def _json_default(value):
+    if isinstance(value, (datetime.date, datetime.time)):
+        # full precision, microseconds included
+        return value.isoformat()
+    return str(value)
+
+
+def encode_keyset_cursor(values):
+    return base64.b64encode(json.dumps(values, default=_json_default).encode("utf-8")).decode("ascii")
+
+
+def decode_keyset_cursor(cursor, length):
+    try:
+        values = json.loads(base64.b64decode(cursor).decode("utf-8"))
+    except ValueError:
+        values = None
+    if not isinstance(values, list) or len(values) != length:
+        raise ValueError("Invalid keyset cursor %s (the orderBy must not change between pages)" % cursor)
+    return values
+
+
+def _nullable(model, path):
+    # a column reached through a nullable foreign key can be null as well
+    for name in path.split("__"):
+        try:
+            field = model._meta.pk if name == "pk" else model._meta.get_field(name)
+        except FieldDoesNotExist:
+            # annotation (search rank,...)
+            return True
+        if field.null:
+            return True
+        model = field.related_model
+    return False
+
+
+def _nulls_last(db, descending):
+    # where the database puts the NULLs when the order doesn't say, as the offset pagination does:
+    # PostgreSQL (and Oracle) sort them as the largest values, MSSQL, MySQL and SQLite as the smallest
+    return (connections[db].vendor in ("postgresql", "oracle")) != descending
+
+
+class KeysetOrderedConnectionField(OrderedDjangoFilterConnectionField):
+    """
+    Adds a keyset (aka seek) pagination mode, enabled with the keyset argument: the cursors hold the values of
+    the orderBy columns (plus the primary key, to make the order total) of the row and the next page is selected
+    by comparing these columns to the cursor instead of skipping (OFFSET) all the previous rows.
+    Page 5000 costs the same as page 1, provided an index matches the order.
+    Only forward pagination (first/after) is supported and the totalCount is only computed if selected.
+    The count_strategy argument allows to get a cheaper, approximate, totalCount (see CountStrategy).
+    """
+
+    @classmethod
+    def resolve_connection(cls, connection, args, iterable, max_limit=None, **kwargs):
+        strategy = args.get("count_strategy") or CountStrategy.EXACT.value
+        if args.get("keyset"):
+            build = cls._keyset_connection
+        elif strategy != CountStrategy.EXACT.value and args.get("last") is None and not args.get("before"):
+            # the page doesn't depend on the count anymore, it is only computed for the totalCount
+            build = cls._offset_connection
+        else:
+            return super().resolve_connection(connection, args, iterable, max_limit=max_limit, **kwargs)
+        if anonymize_gql:
+            return anonymize_gql()(build)(connection, args, iterable, max_limit, **kwargs)
+        return build(connection, args, iterable, max_limit, **kwargs)
+
+    @classmethod
+    def _offset_connection(cls, connection, args, iterable, max_limit, **kwargs):
+        queryset = maybe_queryset(iterable)
+        after = args.get("after")
+        # as in graphene_django, the offset argument is added to the after cursor
+        start = (cursor_to_offset(after) + 1 if after else 0) + (args.get("offset") or 0)
+        first = cls._first(connection, args, max_limit)
+        rows = list(queryset[start:start + first + 1]) if first else list(queryset[start:])
+        return cls._page(connection, args, queryset, rows, first, start > 0,
+                         lambda i, row: offset_to_cursor(start + i))
+
+    @staticmethod
+    def _first(connection, args, max_limit):
+        # page size, limited to max_limit (RELAY_CONNECTION_MAX_LIMIT) like graphene_django does
+        first = args.get("first")
+        if max_limit and first and first > max_limit:
+            raise ValueError("Requesting %s records on the `%s` connection exceeds the `first` limit of %s records."
+                             % (first, connection._meta.name, max_limit))
+        return first or max_limit
+
+    @classmethod
+    def _keyset_connection(cls, connection, args, iterable, max_limit, **kwargs):
+        if args.get("last") is not None or args.get("before") or args.get("offset"):
+            raise ValueError("Keyset pagination only supports first and after")
+        first = cls._first(connection, args, max_limit)
+        queryset = maybe_queryset(iterable)
+        columns = cls._keyset_columns(queryset)
+        # the NULLs keep the database default position, so that the rows come in the same order as with offsets
+        queryset = queryset \
+            .annotate(**{f"keyset_{i}": F(name) for i, (name, _, _, _) in enumerate(columns)}) \
+            .order_by(*[f"-keyset_{i}" if descending else f"keyset_{i}"
+                        for i, (_, descending, _, _) in enumerate(columns)])
+        after = args.get("after")
+        page = queryset
+        if after:
+            page = page.filter(cls._after(columns, decode_keyset_cursor(after, len(columns))))
+        rows = list(page[:first + 1]) if first else list(page)
+        return cls._page(connection, args, queryset, rows, first, bool(after), lambda i, row: encode_keyset_cursor(
+            [getattr(row, f"keyset_{c}") for c in range(len(columns))]))
+
+    @staticmethod
+    def _page(connection, args, queryset, rows, first, has_previous_page, cursor):
+        # rows holds (at most) one more row than the page, telling if there is a next page
+        edges = [connection.Edge(node=row, cursor=cursor(i, row)) for i, row in enumerate(rows[:first])]
+        result = connection(
+            edges=edges,
+            page_info=PageInfo(
+                start_cursor=edges[0].cursor if edges else None,
+                end_cursor=edges[-1].cursor if edges else None,
+                has_previous_page=has_previous_page,
+                has_next_page=bool(first) and len(rows) > first,
+            ),
+        )
+        result.iterable = queryset
+        result.length = _LazyCount(queryset, args.get("count_strategy") or CountStrategy.EXACT.value)
+        return result
+
+    @staticmethod
+    def _keyset_columns(queryset):
+        columns = []
+        for order in queryset.query.order_by:
+            if not isinstance(order, str) or order == "?":
+                raise ValueError("Keyset pagination cannot be used with a random or computed order")
+            name, descending = order.lstrip("-"), order.startswith("-")
+            columns.append((name, descending, _nullable(queryset.model, name), _nulls_last(queryset.db, descending)))
+        if not any(name in ("id", "pk", queryset.model._meta.pk.name) for name, _, _, _ in columns):
+            columns.append((queryset.model._meta.pk.name, False, False, False))
+        return columns
+
+    @staticmethod
+    def _after(columns, values):
+        # (a, b, id) > (va, vb, vid), column by column, honouring the direction and the position of the NULLs
+        conditions = []
+        ties = Q()
+        for i, ((_, descending, nullable, nulls_last), value) in enumerate(zip(columns, values)):
+            column = f"keyset_{i}"
+            if value is None:
+                following = None if nulls_last else Q(**{f"{column}__isnull": False})
+                same = Q(**{f"{column}__isnull": True})
+            else:
+                following = Q(**{f"{column}__{'lt' if descending else 'gt'}": value})
+                if nullable and nulls_last:
+                    following |= Q(**{f"{column}__isnull": True})
+                same = Q(**{column: value})
+            if following is not None:
+                conditions.append(ties & following)
+            ties &= same
+        return reduce(operator.or_, conditions)
+
+
+class _LazyCount:
+    # the totalCount (ExtendedConnection) is coerced with int(), the count query only runs if it is selected
+    def __init__(self, queryset, strategy):
+        self.queryset = queryset
+        self.strategy = strategy
+
+    def __int__(self):
+        return count_queryset(self.queryset, self.strategy)
@@ -0,0 +1,61 @@
+"""
+Phonetic key (a simplified Metaphone) of names, stored as tblInsuree.LastNameKey/OtherNamesKey: changing the
+rules requires to recompute them (findduplicateinsurees --recompute-keys).
+"""
+import re
+import unicodedata
+
+KEY_LENGTH = 8
+
+VOWELS = "AEIOUY"
+
+# applied in this order, on the upper case, accent-less, letters only name
+RULES = [
+    (re.compile(r"^KN|^GN|^PN|^WR|^PS"), lambda m: m.group(0)[1]),
+    (re.compile(r"^X"), "S"),
+    (re.compile(r"X"), "KS"),
+    (re.compile(r"^WH"), "W"),
+    (re.compile(r"SCH"), "SK"),
+    (re.compile(r"TCH"), "X"),
+    (re.compile(r"SH|CH|CZ"), "X"),
+    (re.compile(r"PH"), "F"),
+    (re.compile(r"TH"), "0"),
+    (re.compile(r"DG(?=[EIY])"), "J"),
+    (re.compile(r"GH(?=[^AEIOUY]|$)"), ""),
+    (re.compile(r"G(?=[EI])"), "J"),
+    (re.compile(r"CK"), "K"),
+    (re.compile(r"C(?=[EIY])"), "S"),
+    (re.compile(r"C"), "K"),
+    (re.compile(r"Q"), "K"),
+    (re.compile(r"Z"), "S"),
+    (re.compile(r"V"), "F"),
+    (re.compile(r"DJ"), "J"),
+    (re.compile(r"(?<=[AEIOUY])H(?=[^AEIOUY]|$)"), ""),
+    (re.compile(r"W(?=[^AEIOUY]|$)"), ""),
+]
+
+
+def _normalize(name):
+    name = unicodedata.normalize("NFKD", name or "")
+    return "".join(c for c in name.upper() if "A" <= c <= "Z")
+
+
+def phonetic_key(name):
+    """
+    Phonetic key of a (single or multi words) name, None if the name has no letter
+    """
+    name = _normalize(name)
+    if not name:
+        return None
+    for pattern, replacement in RULES:
+        name = pattern.sub(replacement, name)
+    if not name:
+        return None
+    # the first letter is kept (vowels all count as A), the following vowels are dropped
+    first = "A" if name[0] in VOWELS else name[0]
+    rest = "".join(c for c in name[1:] if c not in VOWELS and c != "H")
+    key = first
+    for c in rest:
+        if c != key[-1]:
+            key += c
+    return key[:KEY_LENGTH]
@@ -0,0 +1,253 @@
+import base64
+import hashlib
+import io
+import logging
+import os
+import pathlib
+import shutil
+import uuid
+from os import path
+
+from django.core.cache import cache
+from django.utils.module_loading import import_string
+
+from insuree.apps import InsureeConfig
+
+logger = logging.getLogger(__name__)
+
+# multiple of 3 (bytes) and 4 (base64 chars) so that chunks can be encoded/decoded independently
+CHUNK_SIZE = 3 * 4 * 16 * 1024
+
+
+def get_photo_storage():
+    """
+    Instantiates the photo storage configured by insuree_photo_storage (dotted path to a PhotoStorage class)
+    """
+    return import_string(InsureeConfig.insuree_photo_storage)(InsureeConfig.insuree_photos_root_path)
+
+
+def _variant_max_side(size):
+    if size not in InsureeConfig.insuree_photo_sizes:
+        raise ValueError("Unknown photo size %s, should be one of %s" % (
+            size, ", ".join(InsureeConfig.insuree_photo_sizes.keys())))
+    return InsureeConfig.insuree_photo_sizes[size]
+
+
+def resize_photo(content, max_side):
+    """
+    Scales the image down (keeping its ratio) so that its largest side is at most max_side, as a JPEG.
+    The content is returned unchanged if it is already small enough, cannot be read or if Pillow is not installed.
+    """
+    try:
+        from PIL import Image
+    except ImportError:
+        logger.debug("Pillow is not installed, photo variants are served at full size")
+        return content
+    try:
+        with Image.open(io.BytesIO(content)) as image:
+            if max(image.size) <= max_side:
+                return content
+            # for JPEG, thumbnail() only decodes the image at the reduced scale
+            image.thumbnail((max_side, max_side))
+            output = io.BytesIO()
+            image.convert("RGB").save(output, format="JPEG", quality=85, optimize=True)
+            return output.getvalue()
+    except Exception:
+        logger.warning("Could not resize photo, serving it at full size", exc_info=True)
+        return content
+
+
+def inline_variant(photo_b64, size):
+    """
+    Resized variant of a photo stored inline (tblPhotos.photo), cached by content and size
+    """
+    max_side = _variant_max_side(size)
+    key = "insuree_photo_%s_%s" % (size, hashlib.md5(photo_b64.encode("utf-8")).hexdigest())
+    return cache.get_or_set(
+        key, lambda: resize_photo(base64.b64decode(photo_b64), max_side),
+        InsureeConfig.insuree_photo_variants_cache_timeout)
+
+
+def _decode_chunks(photo_b64, chunk_size=CHUNK_SIZE):
+    # base64 decoding ignores whitespaces, they have to be dropped before cutting in blocks of 4 chars
+    pending = ""
+    for i in range(0, len(photo_b64), chunk_size):
+        pending += "".join(photo_b64[i:i + chunk_size].split())
+        usable = len(pending) - len(pending) % 4
+        if usable:
+            yield base64.b64decode(pending[:usable])
+            pending = pending[usable:]
+    if pending:
+        yield base64.b64decode(pending)
+
+
+class PhotoStorage:
+    """
+    Stores the insuree photos as files under root, referenced in tblPhotos by their folder and filename.
+    Files are written under a <year>/<month>/<day>/<insuree id> folder, with a random file name.
+    """
+
+    def __init__(self, root):
+        self.root = root
+
+    def full_path(self, folder, filename):
+        return path.join(self.root, folder, filename)
+
+    @staticmethod
+    def insuree_folder(date, insuree_id):
+        return path.join(str(date.year), str(date.month), str(date.day), str(insuree_id))
+
+    def _create_dir(self, folder):
+        pathlib.Path(path.join(self.root, folder)).mkdir(parents=True, exist_ok=True)
+
+    def save(self, date, insuree_id, photo_b64):
+        folder = self.insuree_folder(date, insuree_id)
+        filename = str(uuid.uuid4())
+        self._create_dir(folder)
+        # decoded to a temporary file first: an invalid base64 doesn't leave a partial photo behind
+        tmp_path = self.full_path(folder, "%s.tmp" % filename)
+        try:
+            with open(tmp_path, "xb") as f:
+                for chunk in _decode_chunks(photo_b64):
+                    f.write(chunk)
+            os.replace(tmp_path, self.full_path(folder, filename))
+        finally:
+            if path.exists(tmp_path):
+                os.remove(tmp_path)
+        return folder, filename
+
+    def copy(self, date, insuree_id, original_file):
+        folder = self.insuree_folder(date, insuree_id)
+        filename = str(uuid.uuid4())
+        self._create_dir(folder)
+        shutil.copy2(original_file, self.full_path(folder, filename))
+        return folder, filename
+
+    def delete(self, folder, filename):
+        try:
+            os.remove(self.full_path(folder, filename))
+        except FileNotFoundError:
+            pass
+
+    VARIANTS_FOLDER = "_variants"
+
+    def _write_atomic(self, folder, filename, content):
+        self._create_dir(folder)
+        tmp_path = self.full_path(folder, "%s.%s.tmp" % (filename, uuid.uuid4()))
+        with open(tmp_path, "xb") as f:
+            f.write(content)
+        os.replace(tmp_path, self.full_path(folder, filename))
+
+    def variant_location(self, folder, filename, size):
+        return path.join(self.VARIANTS_FOLDER, size, folder), filename
+
+    def variant(self, folder, filename, size):
+        """
+        Location (folder, filename) of the resized variant of a photo, generated on first access
+        """
+        max_side = _variant_max_side(size)
+        variant_folder, variant_filename = self.variant_location(folder, filename, size)
+        if not path.exists(self.full_path(variant_folder, variant_filename)):
+            content = b"".join(self.iter_chunks(folder, filename))
+            self._write_atomic(variant_folder, variant_filename, resize_photo(content, max_side))
+        return variant_folder, variant_filename
+
+    def stat(self, folder, filename):
+        return os.stat(self.full_path(folder, filename))
+
+    def iter_chunks(self, folder, filename, chunk_size=CHUNK_SIZE, offset=0, length=None):
+        """
+        Reads the photo bytes by chunks, optionally only the length bytes starting at offset
+        """
+        with open(self.full_path(folder, filename), "rb") as f:
+            f.seek(offset)
+            remaining = length
+            while remaining is None or remaining > 0:
+                chunk = f.read(chunk_size if remaining is None else min(chunk_size, remaining))
+                if not chunk:
+                    break
+                if remaining is not None:
+                    remaining -= len(chunk)
+                yield chunk
+
+    def load_base64(self, folder, filename):
+        # CHUNK_SIZE being a multiple of 3, the encoded chunks can be concatenated
+        return "".join(base64.b64encode(chunk).decode("utf-8") for chunk in self.iter_chunks(folder, filename))
+
+
+class ContentAddressedPhotoStorage(PhotoStorage):
+    """
+    Photos are named after the SHA-256 of their content and stored once under <root>/_blobs.
+    The <year>/<month>/<day>/<insuree id>/<sha256> file referenced in tblPhotos is a hard link to that blob,
+    so re-submitting or renewing an unchanged photo doesn't use more disk space.
+    Falls back to a plain copy where hard links are not supported.
+    """
+    BLOBS_FOLDER = "_blobs"
+
+    def _blob_folder(self, digest):
+        return path.join(self.BLOBS_FOLDER, digest[:2], digest[2:4])
+
+    def variant_location(self, folder, filename, size):
+        if len(filename) != 64:
+            # legacy (random) file name
+            return super().variant_location(folder, filename, size)
+        return path.join(self.VARIANTS_FOLDER, size, filename[:2], filename[2:4]), filename
+
+    def _write_blob(self, chunks):
+        tmp_folder = path.join(self.BLOBS_FOLDER, "tmp")
+        self._create_dir(tmp_folder)
+        tmp_path = self.full_path(tmp_folder, str(uuid.uuid4()))
+        sha256 = hashlib.sha256()
+        try:
+            with open(tmp_path, "xb") as f:
+                for chunk in chunks:
+                    sha256.update(chunk)
+                    f.write(chunk)
+            digest = sha256.hexdigest()
+            blob_folder = self._blob_folder(digest)
+            blob_path = self.full_path(blob_folder, digest)
+            if path.exists(blob_path):
+                logger.debug("Photo %s already stored, reusing it", digest)
+            else:
+                self._create_dir(blob_folder)
+                os.replace(tmp_path, blob_path)
+            return digest, blob_path
+        finally:
+            if path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def _link(self, blob_path, folder, filename):
+        target = self.full_path(folder, filename)
+        if path.exists(target):
+            return
+        self._create_dir(folder)
+        try:
+            os.link(blob_path, target)
+        except OSError:
+            logger.debug("Could not hard link %s, copying it instead", blob_path)
+            shutil.copy2(blob_path, target)
+
+    def save(self, date, insuree_id, photo_b64):
+        digest, blob_path = self._write_blob(_decode_chunks(photo_b64))
+        folder = self.insuree_folder(date, insuree_id)
+        self._link(blob_path, folder, digest)
+        return folder, digest
+
+    def copy(self, date, insuree_id, original_file):
+        digest = path.basename(original_file)
+        blob_path = self.full_path(self._blob_folder(digest), digest)
+        if len(digest) == 64 and path.exists(blob_path):
+            # already content-addressed, no need to read it again
+            folder = self.insuree_folder(date, insuree_id)
+            self._link(blob_path, folder, digest)
+            return folder, digest
+
+        def file_chunks():
+            with open(original_file, "rb") as f:
+                while chunk := f.read(CHUNK_SIZE):
+                    yield chunk
+
+        digest, blob_path = self._write_blob(file_chunks())
+        folder = self.insuree_folder(date, insuree_id)
+        self._link(blob_path, folder, digest)
+        return folder, digest
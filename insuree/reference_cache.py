@@ -0,0 +1,53 @@
+"""
+Per process cache of the insuree reference tables, reloaded when their version stamp (Django cache) changes
+or, at the latest, after reference_cache_timeout.
+"""
+import hashlib
+import time
+import uuid
+
+from django.core.cache import cache
+
+from .apps import InsureeConfig
+from .models import Gender, Education, Profession, IdentificationType, ConfirmationType, Relation, FamilyType
+
+REFERENCE_MODELS = [Gender, Education, Profession, IdentificationType, ConfirmationType, Relation, FamilyType]
+
+_references = {}
+
+
+def _version_key(model):
+    return "insuree_reference_version_%s" % model._meta.db_table
+
+
+def reference_version(model):
+    # the stamp expires too, changing the references_etag of the tables modified outside of Django
+    return cache.get_or_set(_version_key(model), lambda: uuid.uuid4().hex, InsureeConfig.reference_cache_timeout)
+
+
+def get_references(model):
+    """
+    All the rows of the reference table, ordered by sort_order.
+    The returned instances are shared, they must not be modified.
+    """
+    version = reference_version(model)
+    cached = _references.get(model)
+    if cached is None or cached[0] != version or time.monotonic() > cached[1]:
+        cached = (version, time.monotonic() + InsureeConfig.reference_cache_timeout,
+                  list(model.objects.order_by("sort_order")))
+        _references[model] = cached
+    return cached[2]
+
+
+def references_etag():
+    """
+    Hash of the versions of all the reference tables, changes as soon as one of them is modified
+    """
+    versions = cache.get_many([_version_key(model) for model in REFERENCE_MODELS])
+    stamps = [versions.get(_version_key(model)) or reference_version(model) for model in REFERENCE_MODELS]
+    return hashlib.md5(":".join(stamps).encode("utf-8")).hexdigest()
+
+
+def invalidate_reference(sender, **kwargs):
+    cache.set(_version_key(sender), uuid.uuid4().hex, InsureeConfig.reference_cache_timeout)
+    _references.pop(sender, None)
@@ -1,9 +1,13 @@
+from datetime import date
+
+from insuree.report_cache import cached_report
 from insuree.reports import insuree_family_overview, enrolled_families, insuree_missing_photo, \
     insurees_pending_enrollment
-from insuree.reports.enrolled_families import enrolled_families_query
+from insuree.reports.enrolled_families import enrolled_families_query, enrolled_families_rows
 from insuree.reports.insuree_family_overview import insuree_family_overview_query
-from insuree.reports.insuree_missing_photo import insuree_missing_photo_query
-from insuree.reports.insurees_pending_enrollment import insurees_pending_enrollment_query
+from insuree.reports.insuree_missing_photo import insuree_missing_photo_query, insuree_missing_photo_rows
+from insuree.reports.insurees_pending_enrollment import insurees_pending_enrollment_query, \
+    insurees_pending_enrollment_rows
 
 
 # Insuree_family_overview are the same report, with native code and with the stored_procedure
@@ -14,7 +18,7 @@ report_definitions = [
         "default_report": insuree_missing_photo.template,
         "description": "Missing insuree photos",
         "module": "insuree",
-        "python_query": insuree_missing_photo_query,
+        "python_query": cached_report("insuree_missing_photo")(insuree_missing_photo_query),
         "permission": ["131215"],
     },
     {
@@ -23,7 +27,7 @@ report_definitions = [
         "default_report": insurees_pending_enrollment.template,
         "description": "Insurees pending enrollment",
         "module": "insuree",
-        "python_query": insurees_pending_enrollment_query,
+        "python_query": cached_report("insurees_pending_enrollment")(insurees_pending_enrollment_query),
         "permission": ["131215"],
     },
     {
@@ -32,7 +36,7 @@ report_definitions = [
         "default_report": insuree_family_overview.template,
         "description": "Simple claim report",
         "module": "insuree",
-        "python_query": insuree_family_overview_query,
+        "python_query": cached_report("insuree_family_overview")(insuree_family_overview_query),
         "permission": ["131215"],
     },
     {
@@ -41,7 +45,17 @@ report_definitions = [
         "default_report": enrolled_families.template,
         "description": "Enrolled families",
         "module": "insuree",
-        "python_query": enrolled_families_query,
+        "python_query": cached_report("enrolled_families")(enrolled_families_query),
         "permission": ["131215"],
     },
 ]
+
+# raw SQL reports that can also be streamed (as CSV, see views.report_csv), with a bounded memory usage,
+# and the parsers of their parameters
+streamed_reports = {
+    "insuree_missing_photo": (insuree_missing_photo_rows, {"officerId": int, "locationId": int}),
+    "insurees_pending_enrollment": (insurees_pending_enrollment_rows, {
+        "officerId": int, "locationId": int, "dateFrom": date.fromisoformat, "dateTo": date.fromisoformat}),
+    "enrolled_families": (enrolled_families_rows, {
+        "date_from": date.fromisoformat, "date_to": date.fromisoformat, "location_id": int}),
+}
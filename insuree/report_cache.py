@@ -0,0 +1,74 @@
+"""
+Cache of the insuree reports results (report_cache_timeout), keyed by a data version stamp renewed on commit
+of any write to the models the reports read. Needs a shared Django cache when several processes serve openIMIS.
+"""
+import functools
+import hashlib
+import json
+import pickle
+import uuid
+import zlib
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from .apps import InsureeConfig
+from .models import get_user_district_ids
+
+REPORT_DATA_VERSION_KEY = "insuree_report_data_version"
+# the models whose Django writes renew the data version (tables read by the reports)
+REPORT_MODELS = ("insuree.Insuree", "insuree.Family", "insuree.InsureePhoto", "insuree.InsureePolicy",
+                 "policy.Policy", "core.Officer", "location.Location")
+# the bulk service methods, which write with bulk_create/bulk_update/update (no post_save nor post_delete)
+REPORT_BULK_SIGNALS = ("insuree_service.bulk_delete", "insuree_service.bulk_remove",
+                       "insuree_service.bulk_change_family", "family_service.bulk_create",
+                       "family_service.bulk_delete")
+
+
+def report_data_version():
+    return cache.get_or_set(REPORT_DATA_VERSION_KEY, lambda: uuid.uuid4().hex, None)
+
+
+def _renew_data_version():
+    # a new version makes all the cached results unreachable, they expire on their own
+    cache.set(REPORT_DATA_VERSION_KEY, uuid.uuid4().hex, None)
+
+
+def invalidate_report_cache(sender=None, **kwargs):
+    # only once committed: a report running before would otherwise cache the previous data under the new version
+    transaction.on_commit(_renew_data_version)
+
+
+def _scope(user):
+    if not settings.ROW_SECURITY:
+        return "all"
+    return sorted(get_user_district_ids(user))
+
+
+def report_cache_key(report_name, params, user):
+    # the parameters come from the query string: empty ones are the same as missing ones
+    params = sorted((name, str(value)) for name, value in params.items() if value not in (None, ""))
+    key = json.dumps([report_name, params, _scope(user), report_data_version()], default=str)
+    return "insuree_report_%s" % hashlib.md5(key.encode("utf-8")).hexdigest()
+
+
+def cached_report(report_name):
+    """
+    Decorator of the report python_query functions, serving their results from the cache when enabled
+    """
+    def decorator(query):
+        @functools.wraps(query)
+        def wrapper(user, **params):
+            if not InsureeConfig.report_cache_timeout:
+                return query(user, **params)
+            key = report_cache_key(report_name, params, user)
+            cached = cache.get(key)
+            if cached is not None:
+                return pickle.loads(zlib.decompress(cached))
+            data = query(user, **params)
+            cache.set(key, zlib.compress(pickle.dumps(data, pickle.HIGHEST_PROTOCOL)),
+                      InsureeConfig.report_cache_timeout)
+            return data
+        return wrapper
+    return decorator
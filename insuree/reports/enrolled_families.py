@@ -1,4 +1,6 @@
-from report.services import run_stored_proc_report
+from django.conf import settings
+
+from insuree.reports.streaming import stream_query, as_dicts
 
 # If manually pasting from reportbro and you have test data, search and replace \" with \\"
 template = """
@@ -1758,13 +1760,62 @@ template = """
 """
 
 
+def enrolled_families_sql(location_id=None, start_date=None, end_date=None):
+    """
+    Native (PostgreSQL and MSSQL) version of the uspSSRSEnroledFamilies stored procedure: members of the valid families
+    enrolled (family ValidityFrom) within the dates, in the location (any level, all if none) with the status of the
+    family policy (the lowest status of its valid policies).
+    Only the given filters are added (pyodbc cannot type a NULL parameter in a "%s IS NULL" test).
+    """
+    root = '"LocationId" = %(location_id)s' if location_id else 'coalesce("ParentLocationId", 0) = 0'
+    filters = ""
+    if start_date:
+        filters += '\n  AND CAST(f."ValidityFrom" AS DATE) >= %(start_date)s'
+    if end_date:
+        filters += '\n  AND CAST(f."ValidityFrom" AS DATE) <= %(end_date)s'
+    return f"""
+WITH {"" if settings.MSSQL else "RECURSIVE"} locations AS (SELECT "LocationId", "ParentLocationId"
+                   FROM "tblLocations"
+                   WHERE "ValidityTo" IS NULL AND {root}
+                   UNION ALL
+                   SELECT l."LocationId", l."ParentLocationId"
+                   FROM "tblLocations" l
+                            INNER JOIN locations ON locations."LocationId" = l."ParentLocationId"
+                   WHERE l."ValidityTo" IS NULL),
+     policies AS (SELECT "FamilyID", MIN("PolicyStatus") AS "PolicyStatus"
+                  FROM "tblPolicy"
+                  WHERE "ValidityTo" IS NULL
+                  GROUP BY "FamilyID")
+SELECT f."FamilyID" AS "FamilyID", f."LocationId" AS "LocationId", r."LocationName" AS "RegionName",
+       d."LocationName" AS "DistrictName", w."LocationName" AS "WardName", v."LocationName" AS "VillageName",
+       i."IsHead" AS "IsHead", i."CHFID" AS "CHFID", i."LastName" AS "LastName", i."OtherNames" AS "OtherNames",
+       CAST(f."ValidityFrom" AS DATE) AS "EnrolDate", p."PolicyStatus" AS "PolicyStatus",
+       CASE p."PolicyStatus" WHEN 1 THEN 'IDLE' WHEN 2 THEN 'ACTIVE' WHEN 4 THEN 'SUSPENDED' WHEN 8 THEN 'EXPIRED'
+                             WHEN 16 THEN 'READY' END AS "PolicyStatusDesc"
+FROM "tblFamilies" f
+         INNER JOIN locations ON locations."LocationId" = f."LocationId"
+         INNER JOIN "tblInsuree" i ON i."FamilyID" = f."FamilyID"
+         INNER JOIN "tblLocations" v ON v."LocationId" = f."LocationId"
+         INNER JOIN "tblLocations" w ON w."LocationId" = v."ParentLocationId"
+         INNER JOIN "tblLocations" d ON d."LocationId" = w."ParentLocationId"
+         INNER JOIN "tblLocations" r ON r."LocationId" = d."ParentLocationId"
+         LEFT OUTER JOIN policies p ON p."FamilyID" = f."FamilyID"
+WHERE f."ValidityTo" IS NULL AND i."ValidityTo" IS NULL
+  AND v."ValidityTo" IS NULL AND w."ValidityTo" IS NULL AND d."ValidityTo" IS NULL AND r."ValidityTo" IS NULL{filters}
+ORDER BY f."LocationId", f."FamilyID", i."IsHead" DESC, i."CHFID"
+"""
+
+
+def enrolled_families_rows(date_from=None, date_to=None, location_id=None, chunk_size=None, **kwargs):
+    """
+    Streamed rows (named tuples) of the report, see stream_query
+    """
+    params = {"location_id": location_id, "start_date": date_from, "end_date": date_to}
+    return stream_query(enrolled_families_sql(**params),
+                        {key: value for key, value in params.items() if value}, chunk_size)
+
+
 def enrolled_families_query(user, date_from=None, date_to=None, location_id=None, **kwargs):
-    data = run_stored_proc_report(
-        "uspSSRSEnroledFamilies",
-        LocationId=location_id,
-        StartDate=date_from,
-        EndDate=date_to,
-    )
     return {
-        "data": data
+        "data": as_dicts(enrolled_families_rows(date_from, date_to, location_id))
     }
@@ -1699,7 +1699,7 @@ template = """
 
 
 def insuree_family_overview_query(user, date_from=None, date_to=None, **kwargs):
-    from ..models import Insuree
+    from ..models import Insuree, get_user_district_ids
     from core import datetimedelta
 
     filters = Q(legacy_id__isnull=True) & Q(family__legacy_id__isnull=True)
@@ -1711,10 +1711,8 @@ def insuree_family_overview_query(user, date_from=None, date_to=None, **kwargs):
         filters &= Q(validity_from__lte=date_to + datetimedelta(days=1))
 
     if settings.ROW_SECURITY:
-        from location.models import UserDistrict
-        dist = UserDistrict.get_user_districts(user._u)
         queryset = Insuree.objects.filter(
-            health_facility__location__id__in=[l.location_id for l in dist]
+            health_facility__location__id__in=get_user_district_ids(user)
         )
     else:
         queryset = Insuree.objects
@@ -1,7 +1,6 @@
 from django.conf import settings
-from django.db import connection
 
-from tools.utils import dictfetchall
+from insuree.reports.streaming import stream_query, as_dicts
 import logging
 logger = logging.getLogger(__name__)
 
@@ -2050,20 +2049,16 @@ ORDER BY d."DistrictName", o."Code", w."WardName", v."VillageName"
 """
 
 
-def insuree_missing_photo_query(user, officerId=0, locationId=0, **kwargs):
-    with connection.cursor() as cur:
-        try:
-            cur.execute(
-                missing_photo_sql,
-                {
-                    "officer_id": officerId,
-                    "location_id": locationId,
-                },
-            )
-            return {"data": dictfetchall(cur)}
-        except Exception as e:
-            logger.exception("Error fetching missing photo query")
-            raise e
+def insuree_missing_photo_rows(officerId=0, locationId=0, chunk_size=None, **kwargs):
+    """
+    Streamed rows (named tuples) of the report, see stream_query
+    """
+    return stream_query(missing_photo_sql, {"officer_id": officerId, "location_id": locationId}, chunk_size)
+
 
-    logger.error("Missing photo query arrived at end of function")
-    return {"data": None}
+def insuree_missing_photo_query(user, officerId=0, locationId=0, **kwargs):
+    try:
+        return {"data": as_dicts(insuree_missing_photo_rows(officerId, locationId))}
+    except Exception as e:
+        logger.exception("Error fetching missing photo query")
+        raise e
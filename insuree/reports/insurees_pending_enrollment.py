@@ -1,7 +1,6 @@
 from django.conf import settings
-from django.db import connection
 
-from tools.utils import dictfetchall
+from insuree.reports.streaming import stream_query, as_dicts
 import logging
 logger = logging.getLogger(__name__)
 
@@ -1290,26 +1289,26 @@ FROM PendingInsurees
 """
 
 
-def insurees_pending_enrollment_query(user, officerId=0, locationId=0, dateFrom=None, dateTo=None, **kwargs):
-    with connection.cursor() as cur:
-        try:
-            cur.execute(
-                insurees_pending_enrollment,
-                {
-                    "OfficerId": officerId,
-                    "LocationId": locationId,
-                    "StartDate": dateFrom,
-                    "EndDate": dateTo,
-                },
-            )
-            return {
-                "StartDate": dateFrom,
-                "EndDate": dateTo,
-                "data": dictfetchall(cur)
-            }
-        except Exception as e:
-            logger.exception("Error fetching missing photo query")
-            raise e
+def insurees_pending_enrollment_rows(officerId=0, locationId=0, dateFrom=None, dateTo=None, chunk_size=None,
+                                     **kwargs):
+    """
+    Streamed rows (named tuples) of the report, see stream_query
+    """
+    return stream_query(insurees_pending_enrollment, {
+        "OfficerId": officerId,
+        "LocationId": locationId,
+        "StartDate": dateFrom,
+        "EndDate": dateTo,
+    }, chunk_size)
+
 
-    logger.error("Pending enrollment query arrived at end of function")
-    return {"data": None}
+def insurees_pending_enrollment_query(user, officerId=0, locationId=0, dateFrom=None, dateTo=None, **kwargs):
+    try:
+        return {
+            "StartDate": dateFrom,
+            "EndDate": dateTo,
+            "data": as_dicts(insurees_pending_enrollment_rows(officerId, locationId, dateFrom, dateTo))
+        }
+    except Exception as e:
+        logger.exception("Error fetching pending enrollment query")
+        raise e
@@ -0,0 +1,42 @@
+from collections import namedtuple
+
+from django.db import connection
+
+from insuree.apps import InsureeConfig
+
+
+class StreamedRows:
+    """
+    Rows of a raw SQL report query, as named tuples, fetched chunk_size (bulk_chunk_size) rows at a time when
+    iterated: on PostgreSQL through a server-side cursor, so that only one chunk is held in memory whatever the size
+    of the report. columns (the column names as returned by the database) is set once the iteration started.
+    """
+
+    def __init__(self, sql, params, chunk_size=None):
+        self.sql = sql
+        self.params = params
+        self.chunk_size = chunk_size or InsureeConfig.bulk_chunk_size
+        self.columns = None
+
+    def __iter__(self):
+        with connection.chunked_cursor() as cur:
+            cur.execute(self.sql, self.params)
+            # the description of a server-side (psycopg2 named) cursor is only set by the first fetch
+            rows = cur.fetchmany(self.chunk_size)
+            self.columns = [column[0] for column in cur.description]
+            row_type = namedtuple("Row", self.columns, rename=True)
+            # invalid identifiers are renamed in the tuple fields
+            row_type.columns = self.columns
+            while rows:
+                for row in rows:
+                    yield row_type(*row)
+                rows = cur.fetchmany(self.chunk_size)
+
+
+def stream_query(sql, params, chunk_size=None):
+    return StreamedRows(sql, params, chunk_size)
+
+
+def as_dicts(rows):
+    # ReportBro needs the whole data as a list of dicts: the rendered reports are not memory bounded
+    return [dict(zip(row.columns, row)) for row in rows]
@@ -8,10 +8,10 @@ from django.core.exceptions import PermissionDenied
 from django.dispatch import Signal
 from graphene_django.filter import DjangoFilterConnectionField
 import graphene_django_optimizer as gql_optimizer
-from location.models import Location, UserDistrict
 
 from .apps import InsureeConfig
-from .models import FamilyMutation, InsureeMutation
+from .models import FamilyMutation, InsureeMutation, InsureeDuplicate, district_filter, parent_location_filter, \
+    get_user_district_ids
 from django.utils.translation import gettext as _
 from location.apps import LocationConfig
 from core.schema import OrderedDjangoFilterConnectionField, OfficerGQLType
@@ -21,6 +21,12 @@ from policy.models import Policy
 # We do need all queries and mutations in the namespace here.
 from .gql_queries import *  # lgtm [py/polluting-import]
 from .gql_mutations import *  # lgtm [py/polluting-import]
+from .services import validate_insuree_numbers, chunks
+from .reference_cache import get_references, references_etag
+from .pagination import KeysetOrderedConnectionField, CountStrategy
+from .search import search_insurees
+from .family_search import MEMBERS_PREFIX, HEAD_INSUREE_PREFIX, members_filter, head_insuree_filter, \
+    client_mutation_filter, family_filter
 from .signals import signal_before_insuree_policy_query, _read_signal_results, \
     signal_before_family_query, signal_before_insuree_search_query
 
@@ -29,7 +35,7 @@ def family_fk(arg):
     return arg.startswith("members_") or arg.startswith("head_insuree_")
 
 
-class FamiliesConnectionField(OrderedDjangoFilterConnectionField):
+class FamiliesConnectionField(KeysetOrderedConnectionField):
     @classmethod
     def resolve_queryset(
             cls, connection, iterable, info, args, filtering_args, filterset_class
@@ -44,17 +50,14 @@ class FamiliesConnectionField(OrderedDjangoFilterConnectionField):
             filterset_class
         )
         head_insuree_filters = {
-            k: args[k] for k in args.keys() if k.startswith("head_insuree__")}
+            k: args[k] for k in args.keys() if k.startswith(HEAD_INSUREE_PREFIX)}
         members_filters = {k: args[k]
-                           for k in args.keys() if k.startswith("members__")}
-        if len(head_insuree_filters) or len(members_filters):
-            qs = qs._next_is_sticky()
+                           for k in args.keys() if k.startswith(MEMBERS_PREFIX)}
+        # EXISTS rather than joins, a family with several matching members must only be listed once
         if len(head_insuree_filters):
-            qs = qs.filter(
-                Q(head_insuree__validity_to__isnull=True), **head_insuree_filters)
+            qs = qs.filter(head_insuree_filter(head_insuree_filters))
         if len(members_filters):
-            qs = qs.filter(Q(members__validity_to__isnull=True),
-                           **members_filters)
+            qs = qs.filter(members_filter(members_filters))
         return OrderedDjangoFilterConnectionField.orderBy(qs, args)
 
 
@@ -65,8 +68,12 @@ class Query(graphene.ObjectType):
         description="Checks that the specified family id is allowed to add more insurees (like a Policy limitation)"
     )
     insuree_genders = graphene.List(GenderGQLType)
-    insurees = OrderedDjangoFilterConnectionField(
+    insurees = KeysetOrderedConnectionField(
         InsureeGQLType,
+        keyset=graphene.Boolean(description="Keyset pagination (first/after only), for deep pages"),
+        count_strategy=CountStrategy(),
+        search=graphene.String(description="Free text search on the insuree number, names, phone, email and "
+                                           "passport, results are sorted by relevance unless orderBy is given"),
         show_history=graphene.Boolean(),
         parent_location=graphene.String(),
         parent_location_level=graphene.Int(),
@@ -81,8 +88,14 @@ class Query(graphene.ObjectType):
     family_types = graphene.List(FamilyTypeGQLType)
     confirmation_types = graphene.List(ConfirmationTypeGQLType)
     relations = graphene.List(RelationGQLType)
+    insuree_references_etag = graphene.String(
+        description="Changes whenever one of the reference lists (genders, educations, professions, "
+                    "identification types, confirmation types, relations, family types) is modified"
+    )
     families = FamiliesConnectionField(
         FamilyGQLType,
+        keyset=graphene.Boolean(description="Keyset pagination (first/after only), for deep pages"),
+        count_strategy=CountStrategy(),
         null_as_false_poverty=graphene.Boolean(),
         show_history=graphene.Boolean(),
         parent_location=graphene.String(),
@@ -105,11 +118,23 @@ class Query(graphene.ObjectType):
         orderBy=graphene.List(of_type=graphene.String),
         additional_filter=graphene.JSONString(),
     )
+    insuree_duplicates = OrderedDjangoFilterConnectionField(
+        InsureeDuplicateGQLType,
+        min_score=graphene.Float(),
+        orderBy=graphene.List(of_type=graphene.String),
+        description="Pairs of insurees likely registered twice, as found by the findduplicateinsurees command, "
+                    "highest scores first unless orderBy is given"
+    )
     insuree_number_validity = graphene.Field(
         ValidationMessageGQLType,
         insuree_number=graphene.String(required=True),
         description="Checks that the specified insuree number is valid"
     )
+    insuree_numbers_validity = graphene.List(
+        InsureeNumberValidityGQLType,
+        insuree_numbers=graphene.List(graphene.String, required=True),
+        description="Checks a batch of insuree numbers, results are in the order of insureeNumbers"
+    )
 
     def resolve_insuree_number_validity(self, info, **kwargs):
         if not info.context.user.has_perms(InsureeConfig.gql_query_insurees_perms):
@@ -120,6 +145,16 @@ class Query(graphene.ObjectType):
         else:
             return ValidationMessageGQLType(True, 0, "")
 
+    def resolve_insuree_numbers_validity(self, info, **kwargs):
+        if not info.context.user.has_perms(InsureeConfig.gql_query_insurees_perms):
+            raise PermissionDenied(_("unauthorized"))
+        insuree_numbers = kwargs['insuree_numbers']
+        return [
+            InsureeNumberValidityGQLType(insuree_number, False, errors[0]['errorCode'], errors[0]['message'])
+            if errors else InsureeNumberValidityGQLType(insuree_number, True, 0, "")
+            for insuree_number, errors in zip(insuree_numbers, validate_insuree_numbers(insuree_numbers))
+        ]
+
     def resolve_can_add_insuree(self, info, **kwargs):
         if not info.context.user.has_perms(InsureeConfig.gql_query_insuree_perms):
             raise PermissionDenied(_("unauthorized"))
@@ -146,7 +181,7 @@ class Query(graphene.ObjectType):
     def resolve_insuree_genders(self, info, **kwargs):
         if not info.context.user.has_perms(InsureeConfig.gql_query_insuree_perms):
             raise PermissionDenied(_("unauthorized"))
-        return Gender.objects.order_by('sort_order').all()
+        return get_references(Gender)
 
     def resolve_insurees(self, info, **kwargs):
         if not info.context.user.has_perms(InsureeConfig.gql_query_insurees_perms):
@@ -174,23 +209,23 @@ class Query(graphene.ObjectType):
             if parent_location_level is None:
                 raise ValueError(
                     "Missing parentLocationLevel argument when filtering on parentLocation")
-            f = "uuid"
-            for i in range(len(LocationConfig.location_types) - parent_location_level - 1):
-                f = "parent__" + f
-            current_village = "current_village__" + f
-            family_location = "family__location__" + f
-            filters += [(Q(current_village__isnull=False) & Q(**{current_village: parent_location})) |
-                        (Q(current_village__isnull=True) & Q(**{family_location: parent_location}))]
+            depth = len(LocationConfig.location_types) - parent_location_level - 1
+            filters += [(Q(current_village__isnull=False) &
+                         parent_location_filter("current_village", parent_location, depth)) |
+                        (Q(current_village__isnull=True) &
+                         parent_location_filter("family__location", parent_location, depth))]
 
         if (kwargs.get('ignore_location') == False or kwargs.get('ignore_location') is None):
             # Limit the list by the logged in user location mapping
-            user_districts = UserDistrict.get_user_districts(
-                info.context.user._u)
-
-            filters += [Q(family__location__parent__parent__in=Location.objects.filter(
-                uuid__in=user_districts.values_list('location__uuid', flat=True)))]
+            filters += [district_filter("family__location", get_user_district_ids(info.context.user))]
 
-        return gql_optimizer.query(Insuree.objects.filter(*filters).all(), info)
+        queryset = search_insurees(Insuree.objects.filter(*filters), kwargs.get("search"))
+        queryset = gql_optimizer.query(queryset.all(), info)
+        paths = selected_paths(info)
+        if "edges.node.photo" in paths and "edges.node.photo.photo" not in paths:
+            # the base64 column is only loaded when the photo content itself is requested
+            queryset = queryset.select_related("photo").defer("photo__photo")
+        return queryset
 
     def resolve_family_members(self, info, **kwargs):
         if not info.context.user.has_perms(InsureeConfig.gql_query_insuree_family_members):
@@ -204,32 +239,37 @@ class Query(graphene.ObjectType):
     def resolve_educations(self, info, **kwargs):
         if not info.context.user.has_perms(InsureeConfig.gql_query_families_perms):
             raise PermissionDenied(_("unauthorized"))
-        return Education.objects.order_by('sort_order').all()
+        return get_references(Education)
 
     def resolve_professions(self, info, **kwargs):
         if not info.context.user.has_perms(InsureeConfig.gql_query_families_perms):
             raise PermissionDenied(_("unauthorized"))
-        return Profession.objects.order_by('sort_order').all()
+        return get_references(Profession)
 
     def resolve_identification_types(self, info, **kwargs):
         if not info.context.user.has_perms(InsureeConfig.gql_query_families_perms):
             raise PermissionDenied(_("unauthorized"))
-        return IdentificationType.objects.order_by('sort_order').all()
+        return get_references(IdentificationType)
 
     def resolve_confirmation_types(self, info, **kwargs):
         if not info.context.user.has_perms(InsureeConfig.gql_query_families_perms):
             raise PermissionDenied(_("unauthorized"))
-        return ConfirmationType.objects.order_by('sort_order').all()
+        return get_references(ConfirmationType)
 
     def resolve_relations(self, info, **kwargs):
         if not info.context.user.has_perms(InsureeConfig.gql_query_families_perms):
             raise PermissionDenied(_("unauthorized"))
-        return Relation.objects.order_by('sort_order').all()
+        return get_references(Relation)
+
+    def resolve_insuree_references_etag(self, info, **kwargs):
+        if info.context.user.is_anonymous:
+            raise PermissionDenied(_("unauthorized"))
+        return references_etag()
 
     def resolve_family_types(self, info, **kwargs):
         if not info.context.user.has_perms(InsureeConfig.gql_query_families_perms):
             raise PermissionDenied(_("unauthorized"))
-        return FamilyType.objects.order_by('sort_order').all()
+        return get_references(FamilyType)
 
     def resolve_families(self, info, **kwargs):
         if not info.context.user.has_perms(InsureeConfig.gql_query_families_perms):
@@ -241,7 +281,9 @@ class Query(graphene.ObjectType):
             filters_from_signal = _family_additional_filters(
                 sender=self, additional_filter=additional_filter, user=info.context.user
             )
-            filters.extend(filters_from_signal)
+            if filters_from_signal:
+                # they may go through multi-valued relations, evaluated apart not to duplicate families
+                filters.append(family_filter(*filters_from_signal))
 
         officer = kwargs.get('officer', None)
         if officer:
@@ -258,31 +300,21 @@ class Query(graphene.ObjectType):
             filters += filter_validity(**kwargs)
         client_mutation_id = kwargs.get("client_mutation_id", None)
         if client_mutation_id:
-            filters.append(
-                Q(mutations__mutation__client_mutation_id=client_mutation_id))
+            filters.append(client_mutation_filter(client_mutation_id))
         parent_location = kwargs.get('parent_location')
         if parent_location is not None:
             parent_location_level = kwargs.get('parent_location_level')
             if parent_location_level is None:
                 raise NotImplementedError(
                     "Missing parentLocationLevel argument when filtering on parentLocation")
-            f = "uuid"
-            for i in range(len(LocationConfig.location_types) - parent_location_level - 1):
-                f = "parent__" + f
-            f = "location__" + f
-            filters += [Q(**{f: parent_location})]
+            depth = len(LocationConfig.location_types) - parent_location_level - 1
+            filters += [parent_location_filter("location", parent_location, depth)]
 
         # Limit the list by the logged in user location mapping
-        user_districts = UserDistrict.get_user_districts(
-            info.context.user._u)
+        filters += [district_filter("location", get_user_district_ids(info.context.user))]
 
-        filters += [Q(location__parent__parent__in=Location.objects.filter(
-            uuid__in=user_districts.values_list('location__uuid', flat=True)))]
-
-        # Duplicates cannot be removed with distinct, as TEXT field is not comparable
-        ids = Family.objects.filter(*filters).values_list('id')
-        dinstinct_queryset = Family.objects.filter(id__in=ids)
-        return gql_optimizer.query(dinstinct_queryset.all(), info)
+        # none of the filters joins a multi-valued relation: no duplicates to remove
+        return gql_optimizer.query(Family.objects.filter(*filters).all(), info)
 
     def resolve_insuree_officers(self, info, **kwargs):
         if not info.context.user.has_perms(InsureeConfig.gql_query_insuree_officers_perms):
@@ -310,18 +342,27 @@ class Query(graphene.ObjectType):
             if parent_location_level is None:
                 raise NotImplementedError(
                     "Missing parentLocationLevel argument when filtering on parentLocation")
-            f = "uuid"
-            for i in range(len(LocationConfig.location_types) - parent_location_level - 1):
-                f = "parent__" + f
-            current_village = "current_village__" + f
-            family_location = "family__location__" + f
-            filters += [(Q(current_village__isnull=False) & Q(**{current_village: parent_location})) |
-                        (Q(current_village__isnull=True) & Q(**{family_location: parent_location}))]
+            depth = len(LocationConfig.location_types) - parent_location_level - 1
+            filters += [(Q(current_village__isnull=False) &
+                         parent_location_filter("current_village", parent_location, depth)) |
+                        (Q(current_village__isnull=True) &
+                         parent_location_filter("family__location", parent_location, depth))]
         return gql_optimizer.query(InsureePolicy.objects.filter(*filters).all(), info)
 
 
+    def resolve_insuree_duplicates(self, info, **kwargs):
+        if not info.context.user.has_perms(InsureeConfig.gql_query_insurees_perms):
+            raise PermissionDenied(_("unauthorized"))
+        queryset = InsureeDuplicate.get_queryset(None, info.context.user)
+        min_score = kwargs.get('min_score')
+        if min_score is not None:
+            queryset = queryset.filter(score__gte=min_score)
+        return gql_optimizer.query(queryset.order_by("-score", "id"), info)
+
+
 class Mutation(graphene.ObjectType):
     create_family = CreateFamilyMutation.Field()
+    create_families = CreateFamiliesMutation.Field()
     update_family = UpdateFamilyMutation.Field()
     delete_families = DeleteFamiliesMutation.Field()
     create_insuree = CreateInsureeMutation.Field()
@@ -332,6 +373,29 @@ class Mutation(graphene.ObjectType):
     change_insuree_family = ChangeInsureeFamilyMutation.Field()
 
 
+def _log_mutation(model, mutation_model, field, uuids, mutation_log_id):
+    # one lookup (per chunk of uuids) and bulk inserts, whatever the number of impacted objects
+    uuids = [uuid for uuid in uuids if uuid]
+    if not uuids:
+        return []
+    ids = []
+    for chunk in chunks(set(uuids), InsureeConfig.bulk_chunk_size):
+        ids += model.objects.filter(uuid__in=chunk).values_list("id", flat=True)
+    mutation_model.objects.bulk_create(
+        [mutation_model(**{f"{field}_id": id, "mutation_id": mutation_log_id}) for id in ids],
+        batch_size=InsureeConfig.bulk_chunk_size,
+    )
+    return []
+
+
+def _impacted_uuids(data):
+    uuids = data.get('uuids', None)
+    if not uuids:
+        uuid = data.get('uuid', None)
+        uuids = [uuid] if uuid else []
+    return uuids
+
+
 def on_family_mutation(kwargs, k='uuid'):
     family_uuid = kwargs['data'].get('uuid', None)
     if not family_uuid:
@@ -343,17 +407,8 @@ def on_family_mutation(kwargs, k='uuid'):
 
 
 def on_families_mutation(kwargs):
-    uuids = kwargs['data'].get('uuids', [])
-    if not uuids:
-        uuid = kwargs['data'].get('uuid', None)
-        uuids = [uuid] if uuid else []
-    if not uuids:
-        return []
-    impacted_families = Family.objects.filter(uuid__in=uuids).all()
-    for family in impacted_families:
-        FamilyMutation.objects.create(
-            family=family, mutation_id=kwargs['mutation_log_id'])
-    return []
+    return _log_mutation(
+        Family, FamilyMutation, "family", _impacted_uuids(kwargs['data']), kwargs['mutation_log_id'])
 
 
 def on_insuree_mutation(kwargs, k='uuid'):
@@ -367,17 +422,8 @@ def on_insuree_mutation(kwargs, k='uuid'):
 
 
 def on_insurees_mutation(kwargs):
-    uuids = kwargs['data'].get('uuids', [])
-    if not uuids:
-        uuid = kwargs['data'].get('uuid', None)
-        uuids = [uuid] if uuid else []
-    if not uuids:
-        return []
-    impacted_insurees = Insuree.objects.filter(uuid__in=uuids).all()
-    for insuree in impacted_insurees:
-        InsureeMutation.objects.create(
-            insuree=insuree, mutation_id=kwargs['mutation_log_id'])
-    return []
+    return _log_mutation(
+        Insuree, InsureeMutation, "insuree", _impacted_uuids(kwargs['data']), kwargs['mutation_log_id'])
 
 
 def on_family_and_insurees_mutation(kwargs):
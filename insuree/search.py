@@ -0,0 +1,66 @@
+"""
+Free text search of insurees: trigram matching and ranking on PostgreSQL with pg_trgm, prefix matching elsewhere.
+"""
+import operator
+import time
+from functools import reduce
+
+from django.db import connections
+from django.db.models import Q, Case, When, Value, IntegerField, FloatField
+from django.db.models.functions import Greatest
+
+SEARCH_FIELDS = ["chf_id", "last_name", "other_names", "phone", "email", "passport"]
+RANKED_FIELDS = ["chf_id", "last_name", "other_names"]
+MAX_TERMS = 5
+
+# (seconds) the extension check is redone, an extension installed later is used without restart
+TRIGRAM_CHECK_INTERVAL = 300
+
+_trigram_available = {}
+
+
+def trigram_available(using):
+    cached = _trigram_available.get(using)
+    if cached is None or time.monotonic() > cached[1]:
+        connection = connections[using]
+        available = False
+        if connection.vendor == "postgresql":
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")
+                available = cursor.fetchone() is not None
+        cached = (available, time.monotonic() + TRIGRAM_CHECK_INTERVAL)
+        _trigram_available[using] = cached
+    return cached[0]
+
+
+def search_insurees(queryset, text):
+    """
+    Insurees matching all the terms of text (in any of SEARCH_FIELDS), ordered by relevance (search_rank)
+    """
+    terms = (text or "").split()[:MAX_TERMS]
+    if not terms:
+        return queryset
+    if trigram_available(queryset.db):
+        from django.contrib.postgres.search import TrigramSimilarity
+        lookup = "icontains"
+        ranks = [
+            Greatest(*[TrigramSimilarity(field, term) for field in RANKED_FIELDS], output_field=FloatField())
+            for term in terms
+        ]
+    else:
+        lookup = "istartswith"
+        ranks = [
+            Case(
+                When(chf_id__iexact=term, then=Value(3)),
+                When(last_name__istartswith=term, then=Value(2)),
+                When(other_names__istartswith=term, then=Value(1)),
+                default=Value(0),
+                output_field=IntegerField(),
+            )
+            for term in terms
+        ]
+    filters = [
+        reduce(operator.or_, [Q(**{f"{field}__{lookup}": term}) for field in SEARCH_FIELDS])
+        for term in terms
+    ]
+    return queryset.filter(*filters).annotate(search_rank=reduce(operator.add, ranks)).order_by("-search_rank", "id")
@@ -1,53 +1,130 @@
-import base64
 import logging
-import pathlib
-import shutil
 import uuid
-from os import path
+from copy import copy
 
 from core.apps import CoreConfig
-from django.db.models import Q
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models import Q, Prefetch
 from django.utils.translation import gettext as _
 
-from core.signals import register_service_signal
+from core.signals import register_service_signal, REGISTERED_SERVICE_SIGNALS
 from insuree.apps import InsureeConfig
-from insuree.models import InsureePhoto, PolicyRenewalDetail, Insuree, Family, InsureePolicy
+from insuree.photo_storage import get_photo_storage
+from insuree.models import InsureePhoto, PolicyRenewalDetail, Insuree, Family, InsureePolicy, LocationAncestry, \
+    invalidate_user_districts
+from location.models import Location
 
 logger = logging.getLogger(__name__)
 
 
-def create_insuree_renewal_detail(policy_renewal):
-    from core import datetime, datetimedelta
-    now = datetime.datetime.now()
+def photo_renewal_due_filter(now, prefix=""):
+    """
+    Insurees (through prefix) whose photo is missing or due for renewal: older than renewal_photo_age_adult months,
+    or renewal_photo_age_child months for children
+    """
+    from core import datetimedelta
     adult_birth_date = now - datetimedelta(years=CoreConfig.age_of_majority)
     photo_renewal_date_adult = now - datetimedelta(months=InsureeConfig.renewal_photo_age_adult)  # 60
     photo_renewal_date_child = now - datetimedelta(months=InsureeConfig.renewal_photo_age_child)  # 12
-    photos_to_renew = InsureePhoto.objects.filter(insuree__family=policy_renewal.insuree.family) \
-        .filter(insuree__validity_to__isnull=True) \
-        .filter(Q(insuree__photo_date__isnull=True)
-                | Q(insuree__photo_date__lte=photo_renewal_date_adult)
-                | (Q(insuree__photo_date__lte=photo_renewal_date_child)
-                   & Q(insuree__dob__gt=adult_birth_date)
-                   )
-                )
-    for photo in photos_to_renew:
-        detail, detail_created = PolicyRenewalDetail.objects.get_or_create(
-            policy_renewal=policy_renewal,
-            insuree_id=photo.insuree_id,
-            validity_from=now,
-            audit_user_id=0,
-        )
-        logger.debug("Photo due for renewal for insuree %s, renewal detail %s, created an entry ? %s",
-                     photo.insuree_id, detail.id, detail_created)
+    return Q(**{f"{prefix}photo_date__isnull": True}) \
+        | Q(**{f"{prefix}photo_date__lte": photo_renewal_date_adult}) \
+        | (Q(**{f"{prefix}photo_date__lte": photo_renewal_date_child})
+           & Q(**{f"{prefix}dob__gt": adult_birth_date}))
+
+
+def create_insuree_renewal_detail(policy_renewal):
+    create_insuree_renewal_details([policy_renewal])
+
+
+def create_insuree_renewal_details(policy_renewals, chunk_size=None, progress=None):
+    """
+    Creates the PolicyRenewalDetail of the family members (with a photo) whose photo is due for renewal, for
+    many policy renewals at once (a queryset, or a list of renewals or ids): each chunk of renewals costs one
+    join to find the due photos, one lookup of the details already created and one bulk insert.
+    progress, if given, is called after each chunk with the number of renewals processed and of details created.
+    Returns the number of details created.
+    """
+    from core import datetime
+    from policy.models import PolicyRenewal
+    now = datetime.datetime.now()
+    chunk_size = chunk_size or InsureeConfig.bulk_chunk_size
+    if hasattr(policy_renewals, "values_list"):
+        policy_renewals = policy_renewals.values_list("id", flat=True)
+    renewal_ids = [getattr(renewal, "id", renewal) for renewal in policy_renewals]
+    due_filter = photo_renewal_due_filter(now, "insuree__family__members__")
+    processed = created = 0
+    for chunk in chunks(renewal_ids, chunk_size):
+        due = set(PolicyRenewal.objects
+                  .filter(id__in=chunk)
+                  # a single filter() call: all the conditions apply to the same member
+                  .filter(due_filter, insuree__family__members__validity_to__isnull=True,
+                          insuree__family__members__photos__isnull=False)
+                  .values_list("id", "insuree__family__members__id")
+                  .distinct())
+        if due:
+            due -= set(PolicyRenewalDetail.objects
+                       .filter(policy_renewal_id__in=chunk)
+                       .values_list("policy_renewal_id", "insuree_id"))
+        # ignore_conflicts: the detail may have been created meanwhile, where a unique index exists
+        PolicyRenewalDetail.objects.bulk_create([
+            PolicyRenewalDetail(policy_renewal_id=renewal_id, insuree_id=insuree_id,
+                                validity_from=now, audit_user_id=0)
+            for renewal_id, insuree_id in sorted(due)
+        ], batch_size=chunk_size, ignore_conflicts=True)
+        processed += len(chunk)
+        created += len(due)
+        logger.debug("Photo renewal details: %s/%s renewals processed, %s details created",
+                     processed, len(renewal_ids), created)
+        if progress:
+            progress(processed, created)
+    return created
 
 
 def validate_insuree_number(insuree_number, uuid=None):
     query = Insuree.objects.filter(chf_id=insuree_number, validity_to__isnull=True)
     insuree = query.first()
     if insuree and insuree.uuid != uuid:
-        return [{"errorCode": InsureeConfig.validation_code_taken_insuree_number,
-                 "message": "Insuree number has to be unique, %s exists in system" % insuree_number}]
+        return insuree_number_taken(insuree_number)
+    return validate_insuree_number_format(insuree_number)
+
+
+def validate_insuree_numbers(insuree_numbers, chunk_size=None):
+    """
+    Validates a batch of insuree numbers at once: uniqueness is checked with a single chf_id__in lookup
+    (per chunk of chunk_size numbers) and the format checks are only run once per distinct number.
+    A number repeated within the batch is reported as taken from its second occurrence on.
+    Returns the list of errors of each number, in the order of insuree_numbers.
+    """
+    chunk_size = chunk_size or InsureeConfig.bulk_chunk_size
+    taken = set()
+    for chunk in chunks({number for number in insuree_numbers if number}, chunk_size):
+        taken.update(Insuree.objects
+                     .filter(chf_id__in=chunk, validity_to__isnull=True)
+                     .values_list('chf_id', flat=True))
+    format_errors = {}
+    seen = set()
+    results = []
+    for insuree_number in insuree_numbers:
+        if insuree_number in taken or (insuree_number and insuree_number in seen):
+            results.append(insuree_number_taken(insuree_number))
+        else:
+            if insuree_number not in format_errors:
+                format_errors[insuree_number] = validate_insuree_number_format(insuree_number)
+            results.append(format_errors[insuree_number])
+        seen.add(insuree_number)
+    return results
 
+
+def insuree_number_taken(insuree_number):
+    return [{"errorCode": InsureeConfig.validation_code_taken_insuree_number,
+             "message": "Insuree number has to be unique, %s exists in system" % insuree_number}]
+
+
+def validate_insuree_number_format(insuree_number):
+    """
+    Checks the insuree number against the configured validator, length and modulo, without any database lookup.
+    """
     if InsureeConfig.get_insuree_number_validator():
         return InsureeConfig.get_insuree_number_validator()(insuree_number)
     if InsureeConfig.get_insuree_number_length():
@@ -139,6 +216,47 @@ def reset_family_before_update(family):
     family.json_ext = None
 
 
+# set by every update, they don't make a change on their own
+UPDATE_BOOKKEEPING_FIELDS = ["validity_from", "audit_user_id"]
+
+
+def changed_fields(instance, updated):
+    """
+    Names of the (concrete) fields whose value differs between instance and updated
+    """
+    changed = []
+    for field in instance._meta.concrete_fields:
+        if field.primary_key or field.name in UPDATE_BOOKKEEPING_FIELDS:
+            continue
+        old, new = getattr(instance, field.attname), getattr(updated, field.attname)
+        try:
+            if field.to_python(old) == field.to_python(new):
+                continue
+        except ValidationError:
+            pass
+        changed.append(field.name)
+    return changed
+
+
+def apply_update(instance, data, reset):
+    """
+    Complete update of the instance (reset clears the non required fields, each update is 'complete') with data,
+    skipped if it changes nothing: resubmitted data (offline devices) neither adds a history row nor rewrites the row.
+    Otherwise the history is saved and only the changed columns are written. Returns the changed fields names.
+    """
+    updated = copy(instance)
+    reset(updated)
+    [setattr(updated, key, data[key]) for key in data]
+    changed = changed_fields(instance, updated)
+    if not changed:
+        return changed
+    instance.save_history()
+    reset(instance)
+    [setattr(instance, key, data[key]) for key in data]
+    instance.save(update_fields=changed + UPDATE_BOOKKEEPING_FIELDS)
+    return changed
+
+
 def handle_insuree_photo(user, now, insuree, data):
     insuree_photo = insuree.photo
     if not photo_changed(insuree_photo, data):
@@ -177,41 +295,171 @@ def photo_changed(insuree_photo, data):
         (data and insuree_photo and insuree_photo.photo != data.get('photo', None))
 
 
-def _photo_dir(file_dir, file_name):
-    root = InsureeConfig.insuree_photos_root_path
-    return path.join(root, file_dir, file_name)
+def create_file(date, insuree_id, photo_bin):
+    return get_photo_storage().save(date, insuree_id, photo_bin)
 
 
-def _create_dir(file_dir):
-    root = InsureeConfig.insuree_photos_root_path
-    pathlib.Path(path.join(root, file_dir)) \
-        .mkdir(parents=True, exist_ok=True)
+def copy_file(date, insuree_id, original_file):
+    return get_photo_storage().copy(date, insuree_id, original_file)
 
 
-def create_file(date, insuree_id, photo_bin):
-    file_dir = path.join(str(date.year), str(date.month), str(date.day), str(insuree_id))
-    file_name = str(uuid.uuid4())
+def load_photo_file(file_dir, file_name):
+    return get_photo_storage().load_base64(file_dir, file_name)
 
-    _create_dir(file_dir)
-    with open(_photo_dir(file_dir, file_name), "xb") as f:
-        f.write(base64.b64decode(photo_bin))
-        f.close()
-    return file_dir, file_name
 
+def load_photo_variant_file(file_dir, file_name, size):
+    storage = get_photo_storage()
+    return storage.load_base64(*storage.variant(file_dir, file_name, size))
 
-def copy_file(date, insuree_id, original_file):
-    file_dir = path.join(str(date.year), str(date.month), str(date.day), str(insuree_id))
-    file_name = str(uuid.uuid4())
 
-    _create_dir(file_dir)
-    shutil.copy2(original_file, _photo_dir(file_dir, file_name))
-    return file_dir, file_name
+def chunks(items, size):
+    items = list(items)
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
 
 
-def load_photo_file(file_dir, file_name):
-    photo_path = _photo_dir(file_dir, file_name)
-    with open(photo_path, "rb") as f:
-        return base64.b64encode(f.read()).decode("utf-8")
+def reload_pks(model, objs, chunk_size):
+    # Backends that cannot return rows from a bulk insert leave the pk unset,
+    # the (client generated) uuid allows to fetch them back
+    missing = [obj for obj in objs if obj.pk is None]
+    for chunk in chunks(missing, chunk_size):
+        pks = dict(model.objects.filter(uuid__in=[str(obj.uuid) for obj in chunk]).values_list('uuid', 'pk'))
+        for obj in chunk:
+            obj.pk = pks[str(obj.uuid)]
+
+
+def fetch_by_uuids(queryset, uuids, chunk_size=None):
+    """
+    Rows of the queryset matching the uuids, fetched by chunks, as a dict keyed by lower case uuid
+    (legacy rows hold upper case uuids)
+    """
+    rows = {}
+    for chunk in chunks(set(uuids), chunk_size or InsureeConfig.bulk_chunk_size):
+        for row in queryset.filter(uuid__in=chunk):
+            rows[str(row.uuid).lower()] = row
+    return rows
+
+
+def _history_copies(objs, now):
+    # same as VersionedModel.save_history, without saving
+    copies = []
+    for obj in objs:
+        histo = copy(obj)
+        histo.id = None
+        if hasattr(histo, "uuid"):
+            histo.uuid = uuid.uuid4()
+        histo.validity_to = now
+        histo.legacy_id = obj.id
+        copies.append(histo)
+    return copies
+
+
+def _bulk_save_history(model, objs, now, chunk_size):
+    model.objects.bulk_create(_history_copies(objs, now), batch_size=chunk_size)
+
+
+def _bulk_delete_history(model, objs, now, chunk_size):
+    # set-based VersionedModel.delete_history
+    _bulk_save_history(model, objs, now, chunk_size)
+    for chunk in chunks([obj.id for obj in objs], chunk_size):
+        model.objects.filter(id__in=chunk).update(validity_from=now, validity_to=now)
+    for obj in objs:
+        obj.validity_from = now
+        obj.validity_to = now
+
+
+def _send_item_signals(service, signal_name, items, results=None):
+    """
+    Sends, for each item processed in bulk, the before signal (no results) or the after signal of the per-item
+    service method registered as signal_name, so that its receivers still see every item
+    """
+    signal = REGISTERED_SERVICE_SIGNALS.get(signal_name)
+    if signal is None:
+        return
+    for i, item in enumerate(items):
+        signal_args = {"cls_": service, "data": [(item,), {}], "context": None}
+        if results is None:
+            signal.send_signal_before(sender=service, **signal_args)
+        else:
+            signal.send_signal_after(sender=service, result=results[i], **signal_args)
+
+
+def _location_ancestors(location_id):
+    # (ancestor_id, depth) of a location, including itself, following tblLocations
+    ancestors = []
+    while location_id is not None and location_id not in [a for a, _ in ancestors]:
+        ancestors.append((location_id, len(ancestors)))
+        location_id = Location.objects.filter(id=location_id).values_list("parent_id", flat=True).first()
+    return ancestors
+
+
+def rebuild_location_ancestry(chunk_size=None):
+    """
+    Recomputes insuree_LocationAncestry from tblLocations, for instance after locations were
+    created or moved outside of Django (legacy application, scripts,...)
+    """
+    chunk_size = chunk_size or InsureeConfig.bulk_chunk_size
+    parents = dict(Location.objects.values_list("id", "parent_id"))
+    rows = []
+    for location_id in parents:
+        ancestor_id, depth = location_id, 0
+        # the depth guard protects against (invalid) cycles in the hierarchy
+        while ancestor_id is not None and depth <= len(parents):
+            rows.append(LocationAncestry(location_id=location_id, ancestor_id=ancestor_id, depth=depth))
+            ancestor_id, depth = parents.get(ancestor_id), depth + 1
+    with transaction.atomic():
+        LocationAncestry.objects.all().delete()
+        LocationAncestry.objects.bulk_create(rows, batch_size=chunk_size)
+    return len(rows)
+
+
+def update_location_ancestry(location):
+    """
+    Keeps insuree_LocationAncestry in sync with a saved location: registers a new location and,
+    when its parent changed, re-attaches the location and its whole subtree to the new ancestors.
+    Costs a single query when the location didn't move.
+    """
+    current = dict(LocationAncestry.objects
+                   .filter(location_id=location.id, depth__lte=1)
+                   .values_list("depth", "ancestor_id"))
+    if 0 in current and current.get(1) == location.parent_id:
+        return
+    chunk_size = InsureeConfig.bulk_chunk_size
+    old_ancestors = list(LocationAncestry.objects
+                         .filter(location_id=location.id, depth__gt=0)
+                         .values_list("ancestor_id", flat=True))
+    subtree = [(location.id, 0)] + list(LocationAncestry.objects
+                                        .filter(ancestor_id=location.id, depth__gt=0)
+                                        .values_list("location_id", "depth"))
+    new_ancestors = []
+    if location.parent_id:
+        new_ancestors = list(LocationAncestry.objects
+                             .filter(location_id=location.parent_id)
+                             .values_list("ancestor_id", "depth")) or _location_ancestors(location.parent_id)
+    with transaction.atomic():
+        if old_ancestors:
+            for chunk in chunks([location_id for location_id, _ in subtree], chunk_size):
+                LocationAncestry.objects.filter(location_id__in=chunk, ancestor_id__in=old_ancestors).delete()
+        rows = [
+            LocationAncestry(location_id=location_id, ancestor_id=ancestor_id, depth=depth + ancestor_depth + 1)
+            for location_id, depth in subtree
+            for ancestor_id, ancestor_depth in new_ancestors
+        ]
+        if 0 not in current:
+            rows.append(LocationAncestry(location_id=location.id, ancestor_id=location.id, depth=0))
+        LocationAncestry.objects.bulk_create(rows, batch_size=chunk_size)
+
+
+def on_location_saved(sender, instance, raw=False, **kwargs):
+    if not raw:
+        update_location_ancestry(instance)
+    if instance.type == "D":
+        # superusers see all the districts
+        invalidate_user_districts()
+
+
+def on_user_district_changed(sender, **kwargs):
+    invalidate_user_districts()
 
 
 class InsureeService:
@@ -230,20 +478,18 @@ class InsureeService:
         if errors:
             raise Exception("Invalid insuree number")
         if insuree_uuid:
-            insuree = Insuree.objects.prefetch_related("photo").get(uuid=insuree_uuid)
-            insuree.save_history()
-            # reset the non required fields
-            # (each update is 'complete', necessary to be able to set 'null')
-            reset_insuree_before_update(insuree)
-            [setattr(insuree, key, data[key]) for key in data]
+            # the photo content is only loaded if a new photo has to be compared with it
+            insuree = Insuree.objects \
+                .prefetch_related(Prefetch("photo", queryset=InsureePhoto.objects.all())) \
+                .get(uuid=insuree_uuid)
+            apply_update(insuree, data, reset_insuree_before_update)
         else:
             insuree = Insuree.objects.create(**data)
-        insuree.save()
         photo = handle_insuree_photo(self.user, now, insuree, photo)
         if photo:
             insuree.photo = photo
             insuree.photo_date = photo.date
-            insuree.save()
+            insuree.save(update_fields=['photo', 'photo_date'])
         return insuree
 
     def remove(self, insuree):
@@ -263,6 +509,9 @@ class InsureeService:
 
     @register_service_signal('insuree_service.delete')
     def set_deleted(self, insuree):
+        return self._set_deleted(insuree)
+
+    def _set_deleted(self, insuree):
         try:
             insuree.delete_history()
             [ip.delete_history() for ip in insuree.insuree_policies.filter(validity_to__isnull=True)]
@@ -276,6 +525,82 @@ class InsureeService:
                     'detail': insuree.uuid}]
             }
 
+    @register_service_signal('insuree_service.bulk_delete')
+    def bulk_set_deleted(self, insurees, chunk_size=None):
+        """
+        set_deleted of several insurees (and their insuree policies) with chunked bulk history inserts and
+        validity updates, in a single transaction. The insuree_service.delete signals are still sent for each insuree.
+        If the batch fails, the insurees are deleted one by one to report the failing ones, as set_deleted does.
+        """
+        if not insurees:
+            return []
+        _send_item_signals(self, 'insuree_service.delete', insurees)
+        try:
+            with transaction.atomic():
+                self._bulk_delete(insurees, chunk_size or InsureeConfig.bulk_chunk_size)
+            results = [[] for _ in insurees]
+        except Exception:
+            logger.exception("insuree.mutation.failed_to_delete_insurees, deleting them one by one")
+            results = [self._set_deleted(insuree) for insuree in insurees]
+        _send_item_signals(self, 'insuree_service.delete', insurees, results)
+        return [error for error in results if error]
+
+    def _bulk_delete(self, insurees, chunk_size):
+        from core import datetime
+        now = datetime.datetime.now()
+        _bulk_delete_history(Insuree, insurees, now, chunk_size)
+        insuree_policies = []
+        for chunk in chunks([insuree.id for insuree in insurees], chunk_size):
+            insuree_policies += InsureePolicy.objects.filter(insuree_id__in=chunk, validity_to__isnull=True)
+        _bulk_delete_history(InsureePolicy, insuree_policies, now, chunk_size)
+
+    @register_service_signal('insuree_service.bulk_remove')
+    def bulk_remove(self, insurees, cancel_policies=False, chunk_size=None):
+        """
+        remove (and, optionally, cancel_policies) of several insurees with a constant number of queries,
+        in a single transaction
+        """
+        return self._bulk_change_family(
+            insurees, None, cancel_policies, chunk_size, "insuree.mutation.failed_to_remove_insuree")
+
+    @register_service_signal('insuree_service.bulk_change_family')
+    def bulk_change_family(self, insurees, family, cancel_policies=False, chunk_size=None):
+        """
+        Moves several insurees to the family (and, optionally, cancels their policies) with a constant number
+        of queries, in a single transaction
+        """
+        return self._bulk_change_family(
+            insurees, family, cancel_policies, chunk_size, "insuree.mutation.failed_to_change_insuree_family")
+
+    def _bulk_change_family(self, insurees, family, cancel_policies, chunk_size, error_message):
+        if not insurees:
+            return []
+        chunk_size = chunk_size or InsureeConfig.bulk_chunk_size
+        from core import datetime
+        now = datetime.datetime.now()
+        try:
+            with transaction.atomic():
+                ids = [insuree.id for insuree in insurees]
+                if cancel_policies:
+                    for chunk in chunks(ids, chunk_size):
+                        InsureePolicy.objects \
+                            .filter(insuree_id__in=chunk) \
+                            .filter(Q(expiry_date__isnull=True) | Q(expiry_date__gt=now)) \
+                            .update(expiry_date=now)
+                _bulk_save_history(Insuree, insurees, now, chunk_size)
+                for chunk in chunks(ids, chunk_size):
+                    Insuree.objects.filter(id__in=chunk).update(family=family)
+        except Exception:
+            logger.exception(error_message)
+            # the whole batch was rolled back
+            return [{
+                'title': insuree.chf_id,
+                'list': [{'message': _(error_message) % {'chfid': insuree.chf_id}, 'detail': insuree.uuid}]
+            } for insuree in insurees]
+        for insuree in insurees:
+            insuree.family = family
+        return []
+
     def cancel_policies(self, insuree):
         try:
             from core import datetime
@@ -299,31 +624,152 @@ class FamilyService:
     def __init__(self, user):
         self.user = user
 
+    @transaction.atomic
     def create_or_update(self, data):
         head_insuree_data = data.pop('head_insuree')
         head_insuree_data["head"] = True
+        family_uuid = data.pop('uuid', None)
+        family = Family.objects.get(uuid=family_uuid) if family_uuid else None
+        if family and 'family' not in head_insuree_data:
+            # the head payload doesn't carry its family: keep it, a resubmitted head is then left untouched
+            head_insuree_data.setdefault('family_id', family.id)
         head_insuree = InsureeService(self.user).create_or_update(head_insuree_data)
         data["head_insuree"] = head_insuree
-        family_uuid = data.pop('uuid', None)
-        if family_uuid:
-            family = Family.objects.get(uuid=family_uuid)
-            family.save_history()
-            # reset the non required fields
-            # (each update is 'complete', necessary to be able to set 'null')
-            reset_family_before_update(family)
-            [setattr(family, key, data[key]) for key in data]
+        if family:
+            apply_update(family, data, reset_family_before_update)
         else:
             data.pop('contribution', None)
             family = Family.objects.create(**data)
-        family.save()
-        head_insuree.family = family
-        head_insuree.save()
+        if head_insuree.family_id != family.id:
+            head_insuree.family = family
+            head_insuree.save(update_fields=['family'])
         return family
 
+    @register_service_signal('family_service.bulk_create')
+    def bulk_create(self, families_data, chunk_size=None):
+        """
+        Enroll several new families at once.
+        Each item is shaped like the create_or_update data (family fields and head_insuree),
+        with an optional 'members' list of insuree data.
+        All insuree numbers are checked upfront and every row is inserted in chunks, within a single transaction:
+        head insurees first (without family), then the families pointing to them and finally the members.
+        Returns the created families, in the order of families_data.
+        """
+        from core import datetime
+        now = datetime.datetime.now()
+        chunk_size = chunk_size or InsureeConfig.bulk_chunk_size
+        audit_user_id = self.user.id_for_audit
+
+        families, heads, members, member_families, photos = [], [], [], [], []
+        for family_data in families_data:
+            family_data = dict(family_data)
+            family_data.pop('id', None)
+            family_data.pop('contribution', None)
+            family_data.pop('client_mutation_id', None)
+            family_data.pop('client_mutation_label', None)
+            head_data = family_data.pop('head_insuree')
+            members_data = family_data.pop('members', None) or []
+            family_data['audit_user_id'] = audit_user_id
+            family_data['validity_from'] = now
+            family = Family(**family_data)
+            families.append(family)
+            heads.append(self._new_insuree(head_data, True, now, photos))
+            for member_data in members_data:
+                member = self._new_insuree(member_data, False, now, photos)
+                members.append(member)
+                member_families.append(family)
+
+        self._validate_insuree_numbers(heads + members, chunk_size)
+
+        with transaction.atomic():
+            Insuree.objects.bulk_create(heads, batch_size=chunk_size)
+            reload_pks(Insuree, heads, chunk_size)
+            for family, head in zip(families, heads):
+                family.head_insuree = head
+            Family.objects.bulk_create(families, batch_size=chunk_size)
+            reload_pks(Family, families, chunk_size)
+            for family, head in zip(families, heads):
+                head.family = family
+            Insuree.objects.bulk_update(heads, ['family'], batch_size=chunk_size)
+            for family, member in zip(member_families, members):
+                member.family = family
+            Insuree.objects.bulk_create(members, batch_size=chunk_size)
+            reload_pks(Insuree, members, chunk_size)
+            self._bulk_create_photos(photos, now, chunk_size)
+        return families
+
+    def _new_insuree(self, data, head, now, photos):
+        data = dict(data)
+        data.pop('id', None)
+        data.pop('family_id', None)
+        photo_data = data.pop('photo', None)
+        data['head'] = head
+        data['audit_user_id'] = self.user.id_for_audit
+        data['validity_from'] = now
+        insuree = Insuree(**data)
+        # bulk_create doesn't go through save()
+        insuree.update_name_keys()
+        if photo_data:
+            photos.append((insuree, photo_data))
+        return insuree
+
+    def _validate_insuree_numbers(self, insurees, chunk_size):
+        errors = validate_insuree_numbers([insuree.chf_id for insuree in insurees], chunk_size)
+        messages = [error['message'] for insuree_errors in errors for error in insuree_errors]
+        if messages:
+            raise ValidationError(messages)
+
+    def _bulk_create_photos(self, photos, now, chunk_size):
+        if not photos:
+            return
+        insuree_photos = []
+        for insuree, photo_data in photos:
+            photo_data = dict(photo_data)
+            photo_data.pop('id', None)
+            photo_data['audit_user_id'] = self.user.id_for_audit
+            photo_data['validity_from'] = now
+            insuree_photos.append(InsureePhoto(insuree=insuree, **photo_data))
+        InsureePhoto.objects.bulk_create(insuree_photos, batch_size=chunk_size)
+        reload_pks(InsureePhoto, insuree_photos, chunk_size)
+        insurees = []
+        for (insuree, photo_data), photo in zip(photos, insuree_photos):
+            insuree.photo = photo
+            insuree.photo_date = photo.date
+            insurees.append(insuree)
+        Insuree.objects.bulk_update(insurees, ['photo', 'photo_date'], batch_size=chunk_size)
+        if InsureeConfig.insuree_photos_root_path:
+            # the photos are inserted inline and only moved to files once committed: no file left by a rollback
+            transaction.on_commit(lambda: self._store_photo_files(insuree_photos, now, chunk_size))
+
+    @staticmethod
+    def _store_photo_files(insuree_photos, now, chunk_size):
+        stored = []
+        for photo in insuree_photos:
+            if not photo.photo:
+                continue
+            try:
+                photo.folder, photo.filename = create_file(now, photo.insuree_id, photo.photo)
+            except Exception:
+                # still valid inline, migrateinlinephotos can move it later
+                logger.exception("Could not store the photo %s in a file", photo.uuid)
+                continue
+            photo.photo = None
+            stored.append(photo)
+        InsureePhoto.objects.bulk_update(stored, ['folder', 'filename', 'photo'], batch_size=chunk_size)
+
     def set_deleted(self, family, delete_members):
+        return self._set_deleted(family, delete_members)
+
+    def _set_deleted(self, family, delete_members, member_results=None):
+        # member_results: the members are deleted without service signal, their results are collected instead
         try:
-            [self.handle_member_on_family_delete(member, delete_members)
-             for member in family.members.filter(validity_to__isnull=True).all()]
+            for member in family.members.filter(validity_to__isnull=True).all():
+                if member_results is None:
+                    self.handle_member_on_family_delete(member, delete_members)
+                elif delete_members:
+                    member_results[member.id] = InsureeService(self.user)._set_deleted(member)
+                else:
+                    InsureeService(self.user).remove(member)
             family.delete_history()
             return []
         except Exception as exc:
@@ -335,6 +781,47 @@ class FamilyService:
                     'detail': family.uuid}]
             }
 
+    @register_service_signal('family_service.bulk_delete')
+    def bulk_set_deleted(self, families, delete_members, chunk_size=None):
+        """
+        set_deleted of several families with chunked bulk history inserts and validity updates, in a single
+        transaction: their valid members are deleted (delete_members) or removed from the family.
+        As with set_deleted, the insuree_service.delete signals are sent for each deleted member.
+        If the batch fails, the families are deleted one by one to report the failing ones, as set_deleted does.
+        """
+        if not families:
+            return []
+        chunk_size = chunk_size or InsureeConfig.bulk_chunk_size
+        members = []
+        for chunk in chunks([family.id for family in families], chunk_size):
+            members += Insuree.objects.filter(family_id__in=chunk, validity_to__isnull=True)
+        deleted_members = members if delete_members else []
+        insuree_service = InsureeService(self.user)
+        _send_item_signals(insuree_service, 'insuree_service.delete', deleted_members)
+        member_results = {}
+        try:
+            with transaction.atomic():
+                self._bulk_delete(families, members, delete_members, chunk_size)
+            errors = []
+        except Exception:
+            logger.exception("insuree.mutation.failed_to_delete_families, deleting them one by one")
+            errors = [error for error in (self._set_deleted(family, delete_members, member_results)
+                                          for family in families) if error]
+        _send_item_signals(insuree_service, 'insuree_service.delete', deleted_members,
+                           [member_results.get(member.id, []) for member in deleted_members])
+        return errors
+
+    def _bulk_delete(self, families, members, delete_members, chunk_size):
+        from core import datetime
+        now = datetime.datetime.now()
+        if delete_members:
+            InsureeService(self.user)._bulk_delete(members, chunk_size)
+        else:
+            _bulk_save_history(Insuree, members, now, chunk_size)
+            for chunk in chunks([member.id for member in members], chunk_size):
+                Insuree.objects.filter(id__in=chunk).update(family=None)
+        _bulk_delete_history(Family, families, now, chunk_size)
+
     def handle_member_on_family_delete(self, member, delete_members):
         insuree_service = InsureeService(self.user)
         if delete_members:
@@ -1,3 +1,5 @@
+from django.test import override_settings
+
 from insuree.models import Insuree, Family, Gender, InsureePhoto
 
 
@@ -39,6 +41,37 @@ def create_test_insuree(with_family=True, is_head=False, custom_props=None, fami
     return insuree
 
 
+def override_insuree_number_settings():
+    # the tests generating their insuree numbers don't follow the configured numbering rules
+    return override_settings(INSUREE_NUMBER_VALIDATOR=None, INSUREE_NUMBER_LENGTH=None, INSUREE_NUMBER_MODULE_ROOT=None)
+
+
+def create_test_insuree_data(chf_id, custom_props=None):
+    # insuree payload of the services (InsureeService.create_or_update, FamilyService.bulk_create)
+    return {
+        "chf_id": chf_id,
+        "last_name": "Test Last",
+        "other_names": chf_id,
+        "gender_id": "M",
+        "dob": "1980-01-01",
+        "card_issued": False,
+        **(custom_props if custom_props else {})
+    }
+
+
+def create_test_families_data(count, prefix, members=2):
+    # the insuree numbers are <prefix><family index on 3 digits><member index, 0 for the head>
+    return [{
+        "head_insuree": create_test_insuree_data(f"{prefix}{i:03}0"),
+        "members": [create_test_insuree_data(f"{prefix}{i:03}{m}") for m in range(1, members + 1)],
+    } for i in range(count)]
+
+
+def create_test_families(user, count, prefix, members=2):
+    from insuree.services import FamilyService
+    return FamilyService(user).bulk_create(create_test_families_data(count, prefix, members))
+
+
 base64_blank_jpg = """
 /9j/4AAQSkZJRgABAQEAYABgAAD/2wBDAAgGBgcGBQgHBwcJCQgKDBQNDAsLDBkSEw8UHRofHh0aHBwgJC4nICIsIxwcKDcpLDAxNDQ0Hyc5PTgyPC4zNDL
 /2wBDAQkJCQwLDBgNDRgyIRwhMjIyMjIyMjIyMjIyMjIyMjIyMjIyMjIyMjIyMjIyMjIyMjIyMjIyMjIyMjIyMjIyMjL/wAARCAABAAEDASIAAhEBAxEB/8
@@ -0,0 +1,77 @@
+from core.signals import REGISTERED_SERVICE_SIGNALS
+from core.test_helpers import create_test_interactive_user
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+from insuree.gql_mutations import ChangeInsureeFamilyMutation, RemoveInsureesMutation
+from insuree.models import Insuree
+from insuree.test_helpers import create_test_families, override_insuree_number_settings
+
+
+@override_insuree_number_settings()
+class BulkChangeFamilyTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_test_interactive_user(username="testBulkChangeFamily")
+
+    def _family(self, prefix, members):
+        return create_test_families(self.user, 1, prefix, members)[0]
+
+    def _members(self, family):
+        return list(Insuree.objects.filter(family=family, head=False, validity_to__isnull=True))
+
+    def test_change_family(self):
+        family, target = self._family("71", 3), self._family("72", 0)
+        members = self._members(family)
+        errors = ChangeInsureeFamilyMutation.async_mutate(
+            self.user, family_uuid=target.uuid, insuree_uuids=[member.uuid for member in members],
+            cancel_policies=True)
+        self.assertIsNone(errors)
+        self.assertEqual(len(self._members(target)), 3)
+        self.assertFalse(self._members(family))
+        # history kept
+        self.assertEqual(Insuree.objects.filter(legacy_id__in=[m.id for m in members], family=family).count(), 3)
+
+    def test_remove(self):
+        family = self._family("73", 2)
+        uuids = [member.uuid for member in self._members(family)] + ["00000000-0000-0000-0000-000000000000"]
+        errors = RemoveInsureesMutation.async_mutate(self.user, uuids=uuids, cancel_policies=True)
+        # the unknown uuid
+        self.assertEqual(len(errors), 1)
+        self.assertFalse(self._members(family))
+        self.assertEqual(Insuree.objects.filter(chf_id__in=["730001", "730002"], family__isnull=True,
+                                                validity_to__isnull=True).count(), 2)
+
+    def test_query_count(self):
+        counts = []
+        for prefix, members in (("74", 2), ("75", 40)):
+            family, target = self._family(prefix, members), self._family(prefix + "9", 0)
+            uuids = [member.uuid for member in self._members(family)]
+            with CaptureQueriesContext(connection) as context:
+                ChangeInsureeFamilyMutation.async_mutate(
+                    self.user, family_uuid=target.uuid, insuree_uuids=uuids, cancel_policies=True)
+            counts.append(len(context.captured_queries))
+        self.assertEqual(counts[0], counts[1])
+
+    def _signals(self, name):
+        # insurees of the after signals of the service
+        sent = []
+
+        def receiver(sender, cls_, data, context, result, **kwargs):
+            sent.append(sorted(insuree.id for insuree in data[0][0]))
+        signal = REGISTERED_SERVICE_SIGNALS[name].after_service_signal
+        signal.connect(receiver, weak=False)
+        self.addCleanup(signal.disconnect, receiver)
+        return sent
+
+    def test_signals(self):
+        removed = self._signals("insuree_service.bulk_remove")
+        moved = self._signals("insuree_service.bulk_change_family")
+        family, target = self._family("76", 2), self._family("77", 0)
+        members = self._members(family)
+        ChangeInsureeFamilyMutation.async_mutate(
+            self.user, family_uuid=target.uuid, insuree_uuids=[members[0].uuid], cancel_policies=False)
+        RemoveInsureesMutation.async_mutate(self.user, uuids=[members[1].uuid], cancel_policies=False)
+        self.assertEqual(moved, [[members[0].id]])
+        self.assertEqual(removed, [[members[1].id]])
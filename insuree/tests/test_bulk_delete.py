@@ -0,0 +1,88 @@
+from core.signals import REGISTERED_SERVICE_SIGNALS
+from core.test_helpers import create_test_interactive_user
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+from insuree.gql_mutations import DeleteFamiliesMutation, DeleteInsureesMutation
+from insuree.models import Family, Insuree
+from insuree.test_helpers import create_test_families, override_insuree_number_settings
+
+
+@override_insuree_number_settings()
+class BulkDeleteTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_test_interactive_user(username="testBulkDelete")
+
+    def _deleted_signals(self):
+        # (data, result) of the insuree_service.delete after signals
+        sent = []
+
+        def receiver(sender, cls_, data, context, result, **kwargs):
+            sent.append((data[0][0].id, result))
+        signal = REGISTERED_SERVICE_SIGNALS["insuree_service.delete"].after_service_signal
+        signal.connect(receiver, weak=False)
+        self.addCleanup(signal.disconnect, receiver)
+        return sent
+
+    def _delete_families(self, families, delete_members, uuids=()):
+        return DeleteFamiliesMutation.async_mutate(
+            self.user, uuids=[family.uuid for family in families] + list(uuids), delete_members=delete_members)
+
+    def test_delete_families_and_members(self):
+        families = create_test_families(self.user, 3, "81")
+        errors = self._delete_families(families, True)
+        self.assertEqual(errors, [])
+        ids = [family.id for family in families]
+        self.assertFalse(Family.objects.filter(id__in=ids, validity_to__isnull=True))
+        self.assertEqual(Family.objects.filter(legacy_id__in=ids).count(), 3)
+        members = Insuree.objects.filter(chf_id__startswith="81")
+        self.assertFalse(members.filter(validity_to__isnull=True))
+        # one history row per deleted member
+        self.assertEqual(members.filter(legacy_id__isnull=False).count(), 9)
+
+    def test_delete_families_keep_members(self):
+        families = create_test_families(self.user, 2, "82")
+        self.assertEqual(self._delete_families(families, False), [])
+        members = Insuree.objects.filter(chf_id__startswith="82", validity_to__isnull=True)
+        self.assertEqual(members.count(), 6)
+        self.assertFalse(members.filter(family__isnull=False))
+
+    def test_unknown_family(self):
+        families = create_test_families(self.user, 1, "83")
+        errors = self._delete_families(families, True, uuids=["00000000-0000-0000-0000-000000000000"])
+        self.assertEqual(len(errors), 1)
+        self.assertFalse(Family.objects.filter(id=families[0].id, validity_to__isnull=True))
+
+    def test_delete_insurees(self):
+        family = create_test_families(self.user, 1, "84")[0]
+        members = list(Insuree.objects.filter(family=family).order_by("chf_id"))
+        errors = DeleteInsureesMutation.async_mutate(
+            self.user, uuids=[member.uuid for member in members])
+        # the head insuree cannot be deleted
+        self.assertEqual(len(errors), 1)
+        remaining = Insuree.objects.filter(chf_id__startswith="84", validity_to__isnull=True)
+        self.assertEqual([insuree.id for insuree in remaining], [family.head_insuree_id])
+
+    def test_query_count(self):
+        # the number of queries doesn't depend on the number of families
+        counts = []
+        for count, prefix in ((2, "85"), (20, "86")):
+            families = create_test_families(self.user, count, prefix)
+            with CaptureQueriesContext(connection) as context:
+                self.assertEqual(self._delete_families(families, True), [])
+            counts.append(len(context.captured_queries))
+        self.assertEqual(counts[0], counts[1])
+
+    def test_delete_signals(self):
+        # the receivers of insuree_service.delete still get every deleted insuree
+        sent = self._deleted_signals()
+        families = create_test_families(self.user, 2, "87")
+        self.assertEqual(self._delete_families(families[:1], True), [])
+        members = Insuree.objects.filter(family=families[0], legacy_id__isnull=True)
+        self.assertEqual(sorted(sent), sorted((member.id, []) for member in members))
+        sent.clear()
+        member = Insuree.objects.filter(family=families[1]).exclude(id=families[1].head_insuree_id).first()
+        self.assertEqual(DeleteInsureesMutation.async_mutate(self.user, uuids=[member.uuid]), [])
+        self.assertEqual(sent, [(member.id, [])])
@@ -0,0 +1,101 @@
+from core.models import MutationLog
+from core.test_helpers import create_test_interactive_user
+from django.apps import apps
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from graphene import Schema
+from graphene.test import Client
+
+from insuree import schema as insuree_schema
+from insuree.dataloaders import InsureeClientMutationIdLoader, FamilyClientMutationIdLoader
+from insuree.models import InsureeMutation, FamilyMutation, Profession, Education, Relation
+from insuree.services import FamilyService
+from insuree.test_helpers import create_test_insuree
+
+
+class ClientMutationIdLoaderTest(TestCase):
+    def setUp(self):
+        self.insurees = [
+            create_test_insuree(is_head=True, custom_props={"chf_id": f"loader{i}"}) for i in range(3)]
+        for i, insuree in enumerate(self.insurees[:2]):
+            pending = MutationLog.objects.create(
+                json_content="{}", client_mutation_id=f"pending{i}", status=MutationLog.RECEIVED)
+            done = MutationLog.objects.create(
+                json_content="{}", client_mutation_id=f"done{i}", status=MutationLog.SUCCESS)
+            for mutation in (pending, done):
+                InsureeMutation.objects.create(insuree=insuree, mutation=mutation)
+                FamilyMutation.objects.create(family=insuree.family, mutation=mutation)
+
+    def test_insuree_loader(self):
+        with self.assertNumQueries(1):
+            result = InsureeClientMutationIdLoader().batch_load_fn(
+                [insuree.id for insuree in self.insurees]).get()
+        self.assertEqual(result, ["pending0", "pending1", None])
+
+    def test_family_loader(self):
+        with self.assertNumQueries(1):
+            result = FamilyClientMutationIdLoader().batch_load_fn(
+                [insuree.family_id for insuree in self.insurees]).get()
+        self.assertEqual(result, ["pending0", "pending1", None])
+
+    def test_health_facility_loader(self):
+        # registered by the location module or, with the older ones, by this one
+        self.assertIn("health_facility_loader", LoaderContext(None).dataloaders)
+
+
+class LoaderContext:
+    def __init__(self, user):
+        self.user = user
+        self.dataloaders = {}
+        for app_config in apps.get_app_configs():
+            if hasattr(app_config, "set_dataloaders"):
+                app_config.set_dataloaders(self.dataloaders)
+
+
+@override_settings(ROW_SECURITY=False, INSUREE_NUMBER_VALIDATOR=None, INSUREE_NUMBER_LENGTH=None,
+                   INSUREE_NUMBER_MODULE_ROOT=None)
+class InsureesPageQueryCountTest(TestCase):
+    query = """
+    {
+      insurees(chfId_Istartswith: "DL", ignoreLocation: true, first: %s) {
+        edges { node {
+          chfId gender { code } relationship { id } profession { id } education { id } typeOfId { code }
+          healthFacility { id } currentVillage { id } photo { id } clientMutationId
+          family { uuid familyType { code } confirmationType { code } location { id } headInsuree { chfId } }
+        } }
+      }
+    }
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_test_interactive_user(username="testInsureesDataloaders")
+        members = {
+            "gender_id": "M",
+            "dob": "1980-01-01",
+            "card_issued": False,
+            "last_name": "Loader",
+            "other_names": "Page",
+            "profession": Profession.objects.first(),
+            "education": Education.objects.first(),
+            "relationship": Relation.objects.first(),
+        }
+        FamilyService(cls.user).bulk_create([
+            {"head_insuree": {**members, "chf_id": "DL%05d" % i}} for i in range(500)])
+
+    def setUp(self):
+        self.client = Client(Schema(query=insuree_schema.Query))
+
+    def _count_queries(self, page_size):
+        with CaptureQueriesContext(connection) as queries:
+            result = self.client.execute(self.query % page_size, context=LoaderContext(self.user))
+        self.assertIsNone(result.get("errors"))
+        self.assertEqual(len(result["data"]["insurees"]["edges"]), page_size)
+        return len(queries)
+
+    def test_constant_query_count(self):
+        # warm up the reference tables cache
+        self._count_queries(10)
+        counts = [self._count_queries(page_size) for page_size in (10, 100, 500)]
+        self.assertEqual(len(set(counts)), 1, counts)
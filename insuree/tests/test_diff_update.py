@@ -0,0 +1,89 @@
+import datetime
+
+from core.test_helpers import create_test_interactive_user
+from django.test import TestCase
+
+from insuree.models import Family, Insuree
+from insuree.services import FamilyService, InsureeService
+from insuree.test_helpers import create_test_insuree_data, override_insuree_number_settings
+
+
+@override_insuree_number_settings()
+class DiffUpdateTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_test_interactive_user(username="testDiffUpdate")
+
+    @staticmethod
+    def _data(**kwargs):
+        return create_test_insuree_data("DIFF0001", custom_props={
+            "last_name": "Diff",
+            "other_names": "Update",
+            "dob": datetime.date(1980, 1, 1),
+            "head": False,
+            "phone": "123",
+            **kwargs,
+        })
+
+    def setUp(self):
+        self.insuree = InsureeService(self.user).create_or_update(self._data())
+
+    def _history(self):
+        return Insuree.objects.filter(legacy_id=self.insuree.id).count()
+
+    def test_resubmitted(self):
+        InsureeService(self.user).create_or_update(self._data(uuid=self.insuree.uuid))
+        self.assertEqual(self._history(), 0)
+
+    def test_changed(self):
+        InsureeService(self.user).create_or_update(self._data(uuid=self.insuree.uuid, last_name="Changed"))
+        self.assertEqual(self._history(), 1)
+        self.insuree.refresh_from_db()
+        self.assertEqual(self.insuree.last_name, "Changed")
+        self.assertEqual(self.insuree.phone, "123")
+
+    def test_reset(self):
+        # each update is complete: a missing optional field is cleared
+        data = self._data(uuid=self.insuree.uuid)
+        data.pop("phone")
+        InsureeService(self.user).create_or_update(data)
+        self.assertEqual(self._history(), 1)
+        self.insuree.refresh_from_db()
+        self.assertIsNone(self.insuree.phone)
+
+
+@override_insuree_number_settings()
+class FamilyDiffUpdateTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_test_interactive_user(username="testFamilyDiffUpdate")
+
+    def _data(self, **kwargs):
+        # like the family mutation payload: the head insuree doesn't carry its family
+        return {
+            "audit_user_id": self.user.id_for_audit,
+            "validity_from": datetime.datetime(2020, 1, 1),
+            "poverty": False,
+            "head_insuree": {**DiffUpdateTest._data(chf_id="DIFF0002", head=True), **kwargs.pop("head", {})},
+            **kwargs,
+        }
+
+    def test_resubmitted(self):
+        family = FamilyService(self.user).create_or_update(self._data())
+        head = family.head_insuree
+        for _ in range(2):
+            FamilyService(self.user).create_or_update(self._data(uuid=family.uuid, head={"uuid": head.uuid}))
+        self.assertEqual(Family.objects.filter(legacy_id=family.id).count(), 0)
+        self.assertEqual(Insuree.objects.filter(legacy_id=head.id).count(), 0)
+        head.refresh_from_db()
+        self.assertEqual(head.family_id, family.id)
+
+    def test_changed_head(self):
+        family = FamilyService(self.user).create_or_update(self._data())
+        head = family.head_insuree
+        FamilyService(self.user).create_or_update(
+            self._data(uuid=family.uuid, head={"uuid": head.uuid, "last_name": "Changed"}))
+        self.assertEqual(Family.objects.filter(legacy_id=family.id).count(), 0)
+        self.assertEqual(Insuree.objects.filter(legacy_id=head.id).count(), 1)
+        head.refresh_from_db()
+        self.assertEqual((head.last_name, head.family_id), ("Changed", family.id))
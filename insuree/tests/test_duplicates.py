@@ -0,0 +1,85 @@
+from core import datetime
+from core.test_helpers import create_test_interactive_user
+from django.test import TestCase, override_settings
+from location.test_helpers import create_test_location
+
+from insuree.duplicates import find_duplicates, recompute_name_keys, save_duplicates, score_pair
+from insuree.models import Insuree, InsureeDuplicate
+from insuree.phonetic import phonetic_key
+from insuree.test_helpers import create_test_insuree
+
+
+class PhoneticKeyTest(TestCase):
+    def test_same_key(self):
+        for names in [("Mohamed", "Muhammad"), ("Philippe", "Filip"), ("Nguyen", "Ngyuen"), ("Smith", "Smyth"),
+                      ("Katherine", "Catherine"), ("Ousmane", "Usman"), ("Élodie", "Elodie")]:
+            self.assertEqual(phonetic_key(names[0]), phonetic_key(names[1]), names)
+
+    def test_different_key(self):
+        self.assertNotEqual(phonetic_key("Smith"), phonetic_key("Doe"))
+
+    def test_empty(self):
+        self.assertIsNone(phonetic_key(None))
+        self.assertIsNone(phonetic_key(" - "))
+
+
+class DuplicatesTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_test_interactive_user(username="testInsureeDuplicates")
+
+    def setUp(self):
+        self.village = create_test_location("V", custom_props={"code": "DUP-V"})
+        self.insuree = create_test_insuree(
+            custom_props={"chf_id": "DUP001", "last_name": "Mohamed", "other_names": "Ousmane", "dob": "1980-03-01"},
+            family_custom_props={"location": self.village})
+        self.duplicate = create_test_insuree(
+            custom_props={"chf_id": "DUP002", "last_name": "Muhammad", "other_names": "Usman", "dob": "1980-03-01"},
+            family_custom_props={"location": self.village})
+        # same name, born another year
+        self.other = create_test_insuree(
+            custom_props={"chf_id": "DUP003", "last_name": "Mohamed", "other_names": "Ousmane", "dob": "1990-03-01"},
+            family_custom_props={"location": self.village})
+
+    def _pairs(self, **kwargs):
+        ids = {self.insuree.id, self.duplicate.id, self.other.id}
+        return [pair for pair in find_duplicates(processes=1, **kwargs) if pair[0] in ids or pair[1] in ids]
+
+    def test_keys_saved(self):
+        self.insuree.refresh_from_db()
+        self.assertEqual(self.insuree.last_name_key, phonetic_key("Muhammad"))
+        self.insuree.last_name = "Smith"
+        self.insuree.save(update_fields=["last_name"])
+        self.insuree.refresh_from_db()
+        self.assertEqual(self.insuree.last_name_key, phonetic_key("Smith"))
+
+    def test_score(self):
+        row = {"last_name": "Smith", "other_names": "John", "dob": "1980-01-01", "gender_id": "M"}
+        self.assertEqual(score_pair(row, dict(row)), 1.0)
+        self.assertLess(score_pair(row, {**row, "last_name": "Doe", "other_names": "Jane"}), 0.5)
+
+    def test_find_duplicates(self):
+        pairs = self._pairs(min_score=0.5)
+        self.assertEqual([pair[:2] for pair in pairs], [(self.insuree.id, self.duplicate.id)])
+        self.assertFalse(self._pairs(min_score=0.5, max_block_size=1))
+
+    def test_recompute_keys(self):
+        Insuree.objects.filter(id=self.duplicate.id).update(last_name_key=None, other_names_key=None)
+        self.assertFalse(self._pairs(min_score=0.5))
+        self.assertGreaterEqual(recompute_name_keys(), 1)
+        self.assertEqual(len(self._pairs(min_score=0.5)), 1)
+
+    def test_save_duplicates(self):
+        pairs = self._pairs(min_score=0.5)
+        # inserted by chunks
+        self.assertEqual(save_duplicates(iter(pairs), datetime.datetime.now(), chunk_size=1), len(pairs))
+        duplicates = InsureeDuplicate.objects.filter(insuree=self.insuree)
+        self.assertEqual([duplicate.duplicate_id for duplicate in duplicates], [self.duplicate.id])
+
+    def test_deleted_excluded(self):
+        save_duplicates(self._pairs(min_score=0.5), datetime.datetime.now())
+        queryset = InsureeDuplicate.objects.filter(insuree=self.insuree)
+        with override_settings(ROW_SECURITY=False):
+            self.assertEqual(InsureeDuplicate.get_queryset(queryset, self.user).count(), 1)
+            self.duplicate.delete_history()
+            self.assertFalse(InsureeDuplicate.get_queryset(queryset, self.user))
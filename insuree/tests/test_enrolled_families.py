@@ -0,0 +1,73 @@
+from django.test import TestCase
+from location.test_helpers import create_test_location
+
+from insuree.reports.enrolled_families import enrolled_families_query
+from insuree.test_helpers import create_test_insuree
+
+
+class EnrolledFamiliesReportTest(TestCase):
+    def setUp(self):
+        self.region = create_test_location("R", custom_props={"code": "ENR-R", "name": "Enrol region"})
+        self.district = create_test_location("D", custom_props={"code": "ENR-D", "parent": self.region})
+        self.ward = create_test_location("W", custom_props={"code": "ENR-W", "parent": self.district})
+        self.village = create_test_location("V", custom_props={"code": "ENR-V", "name": "Enrol village",
+                                                               "parent": self.ward})
+        self.head = create_test_insuree(is_head=True, custom_props={"chf_id": "ENR001"},
+                                        family_custom_props={"location": self.village})
+        create_test_insuree(with_family=False, custom_props={"chf_id": "ENR002", "family": self.head.family})
+
+    def _rows(self, **params):
+        return enrolled_families_query(None, location_id=self.region.id, **params)["data"]
+
+    def test_rows(self):
+        rows = self._rows(date_from="2018-01-01", date_to="2020-12-31")
+        self.assertEqual([row["CHFID"] for row in rows], ["ENR001", "ENR002"])
+        self.assertEqual(rows[0]["FamilyID"], self.head.family_id)
+        self.assertEqual(rows[0]["RegionName"], "Enrol region")
+        self.assertEqual(rows[0]["VillageName"], "Enrol village")
+        self.assertTrue(rows[0]["IsHead"])
+        self.assertEqual(str(rows[0]["EnrolDate"]), "2019-01-01")
+        self.assertIsNone(rows[0]["PolicyStatus"])
+
+    def test_filters(self):
+        self.assertFalse(self._rows(date_from="2020-01-01"))
+        self.assertEqual(len(self._rows()), 2)
+        other_region = create_test_location("R", custom_props={"code": "ENR-R2"})
+        self.assertFalse(enrolled_families_query(None, location_id=other_region.id)["data"])
+        # no location: every root location
+        self.assertIn("ENR001", [row["CHFID"] for row in enrolled_families_query(None)["data"]])
+        self.assertEqual(len(self._rows(date_from="2019-01-01", date_to="2019-01-01")), 2)
+
+    def _policy(self, product, head, status, valid=True):
+        from policy.models import Policy
+        from policy.test_helpers import create_test_policy
+        policy = create_test_policy(product, head, link=False, valid=valid, custom_props={"status": status})
+        # whatever the policy values computed by the helper
+        Policy.objects.filter(id=policy.id).update(status=status)
+        return policy
+
+    def test_policy_status(self):
+        from policy.models import Policy
+        from product.test_helpers import create_test_product
+        product = create_test_product("ENRP1")
+        # lowest status of the valid policies, the history one (IDLE) is ignored
+        self._policy(product, self.head, Policy.STATUS_EXPIRED)
+        self._policy(product, self.head, Policy.STATUS_ACTIVE)
+        self._policy(product, self.head, Policy.STATUS_IDLE, valid=False)
+        statuses = {}
+        for i, status in enumerate((Policy.STATUS_IDLE, Policy.STATUS_SUSPENDED, Policy.STATUS_READY)):
+            head = create_test_insuree(is_head=True, custom_props={"chf_id": f"ENR1{i}0"},
+                                       family_custom_props={"location": self.village})
+            self._policy(product, head, status)
+            statuses[head.chf_id] = status
+        rows = {row["CHFID"]: row for row in self._rows()}
+        self.assertEqual(len(rows), 5)
+        for chf_id in ("ENR001", "ENR002"):
+            self.assertEqual(rows[chf_id]["PolicyStatus"], Policy.STATUS_ACTIVE)
+            self.assertEqual(rows[chf_id]["PolicyStatusDesc"], "ACTIVE")
+        self.assertEqual({chf_id: (rows[chf_id]["PolicyStatus"], rows[chf_id]["PolicyStatusDesc"])
+                          for chf_id in statuses}, {
+            "ENR100": (Policy.STATUS_IDLE, "IDLE"),
+            "ENR110": (Policy.STATUS_SUSPENDED, "SUSPENDED"),
+            "ENR120": (Policy.STATUS_READY, "READY"),
+        })
@@ -0,0 +1,60 @@
+import os
+import tempfile
+from unittest import mock
+
+from core.test_helpers import create_test_interactive_user
+from django.core.exceptions import ValidationError
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+from insuree.apps import InsureeConfig
+from insuree.models import Insuree, InsureePhoto
+from insuree.services import FamilyService
+from insuree.test_helpers import base64_blank_jpg, create_test_families_data, override_insuree_number_settings
+
+
+@override_insuree_number_settings()
+class FamilyBulkCreateTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_test_interactive_user(username="testBulkEnrollment")
+
+    def test_bulk_create(self):
+        families = FamilyService(self.user).bulk_create(create_test_families_data(3, "91"))
+        self.assertEqual(len(families), 3)
+        for family in families:
+            family.refresh_from_db()
+            self.assertTrue(family.head_insuree.head)
+            self.assertEqual(family.head_insuree.family_id, family.id)
+            self.assertEqual(family.members.filter(validity_to__isnull=True).count(), 3)
+
+    def test_bulk_create_query_count(self):
+        with CaptureQueriesContext(connection) as small:
+            FamilyService(self.user).bulk_create(create_test_families_data(2, "92"))
+        with CaptureQueriesContext(connection) as large:
+            FamilyService(self.user).bulk_create(create_test_families_data(20, "93"))
+        self.assertEqual(len(small), len(large))
+
+    def test_bulk_create_duplicate_number(self):
+        data = create_test_families_data(2, "94")
+        data[1]["members"][0]["chf_id"] = data[0]["head_insuree"]["chf_id"]
+        with self.assertRaises(ValidationError):
+            FamilyService(self.user).bulk_create(data)
+        self.assertFalse(Insuree.objects.filter(chf_id__startswith="94").exists())
+
+    def test_bulk_create_photo_files(self):
+        root = tempfile.TemporaryDirectory()
+        self.addCleanup(root.cleanup)
+        data = create_test_families_data(1, "95")
+        data[0]["head_insuree"]["photo"] = {"photo": base64_blank_jpg, "date": "2020-01-01", "officer_id": 1}
+        with mock.patch.object(InsureeConfig, "insuree_photos_root_path", root.name):
+            with self.captureOnCommitCallbacks() as callbacks:
+                family = FamilyService(self.user).bulk_create(data)[0]
+            # nothing written before the commit
+            self.assertFalse([name for _, _, names in os.walk(root.name) for name in names])
+            for callback in callbacks:
+                callback()
+        photo = InsureePhoto.objects.with_photo().get(insuree_id=family.head_insuree_id)
+        self.assertIsNone(photo.photo)
+        self.assertTrue(os.path.exists(os.path.join(root.name, photo.folder, photo.filename)))
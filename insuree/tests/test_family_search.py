@@ -0,0 +1,34 @@
+from django.db.models import Q
+from django.test import TestCase
+
+from insuree.family_search import members_filter, head_insuree_filter, family_filter
+from insuree.models import Family
+from insuree.test_helpers import create_test_insuree
+
+
+class FamilySearchTest(TestCase):
+    def setUp(self):
+        self.head = create_test_insuree(is_head=True, custom_props={"chf_id": "search0", "last_name": "Twin"})
+        for i in (1, 2):
+            create_test_insuree(with_family=False, custom_props={
+                "chf_id": f"search{i}", "last_name": "Twin", "family": self.head.family})
+
+    def test_members_filter_no_duplicates(self):
+        families = Family.objects.filter(members_filter({"members__last_name": "Twin"}))
+        self.assertEqual(list(families), [self.head.family])
+        self.assertFalse(Family.objects.filter(members_filter({"members__last_name": "Nobody"})))
+
+    def test_members_filter_same_member(self):
+        # both conditions have to be met by the same member
+        self.assertFalse(Family.objects.filter(members_filter(
+            {"members__chf_id": "search1", "members__other_names": "Nobody"})))
+
+    def test_head_insuree_filter(self):
+        self.assertEqual(
+            list(Family.objects.filter(head_insuree_filter({"head_insuree__chf_id": "search0"}))),
+            [self.head.family])
+        self.assertFalse(Family.objects.filter(head_insuree_filter({"head_insuree__chf_id": "search1"})))
+
+    def test_family_filter(self):
+        families = Family.objects.filter(family_filter(Q(members__last_name="Twin")))
+        self.assertEqual(families.count(), 1)
@@ -7,10 +7,13 @@ from core.forms import User
 
 from graphene import Schema
 from graphene.test import Client
-from insuree import schema as insuree_schema
-from insuree.models import Insuree
+from insuree import schema as insuree_schema, views
+from insuree.gql_queries import PhotoGQLType
+from insuree.models import Insuree, InsureePhoto
 from insuree.test_helpers import create_test_insuree
 from core.services import create_or_update_interactive_user, create_or_update_core_user
+from core.test_helpers import create_test_interactive_user
+from rest_framework.test import APIRequestFactory, force_authenticate
 
 from insuree.services import validate_insuree_number
 from unittest.mock import ANY
@@ -68,6 +71,37 @@ class InsureePhotoTest(TestCase):
         except Exception as e:
             raise e
 
+    def test_photo_content_deferred(self):
+        self.__call_photo_mutation()
+        photo = InsureePhoto.objects.get(id=self.insuree.photo_id)
+        self.assertIn("photo", photo.get_deferred_fields())
+        photo = InsureePhoto.objects.with_photo().get(id=self.insuree.photo_id)
+        self.assertEqual(photo.get_deferred_fields(), set())
+        self.assertEqual(photo.photo, self.photo_base64)
+        insuree = Insuree.objects.select_related("photo").defer("photo__photo").get(id=self.insuree.id)
+        self.assertIn("photo", insuree.photo.get_deferred_fields())
+
+    def test_photo_url_deferred(self):
+        self.__call_photo_mutation()
+        photo = InsureePhoto.objects.get(id=self.insuree.photo_id)
+        info = mock.Mock(context=self.BaseTestContext(self._TEST_USER))
+        url = PhotoGQLType.resolve_url(photo, info)
+        self.assertIn(str(photo.uuid), url)
+        # the url doesn't load the photo content
+        self.assertIn("photo", photo.get_deferred_fields())
+        photo.photo = None
+        self.assertIsNone(PhotoGQLType.resolve_url(photo, info))
+
+    def test_photo_view_permission_denied(self):
+        self.__call_photo_mutation()
+        photo = InsureePhoto.objects.get(id=self.insuree.photo_id)
+        request = APIRequestFactory().get("/photos/%s/" % photo.uuid)
+        force_authenticate(request, user=create_test_interactive_user(username="photo_noright", roles=[1]))
+        self.assertEqual(views.photo(request, photo.uuid).status_code, 403)
+        request = APIRequestFactory().get("/photos/%s/" % photo.uuid)
+        force_authenticate(request, user=self._TEST_USER)
+        self.assertEqual(views.photo(request, photo.uuid).status_code, 200)
+
     @mock.patch('insuree.services.InsureeConfig')
     @mock.patch('insuree.services.create_file')
     def test_add_photo_save_files(self, create_file, insuree_config):
@@ -0,0 +1,43 @@
+from unittest import mock
+
+from django.db import DEFAULT_DB_ALIAS
+from django.test import TestCase
+
+from insuree.models import Insuree
+from insuree.search import search_insurees, trigram_available
+from insuree.test_helpers import create_test_insuree
+
+
+class InsureeSearchTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        create_test_insuree(custom_props={"chf_id": "SRCH001", "last_name": "Smithson", "other_names": "John"})
+        create_test_insuree(custom_props={"chf_id": "SRCH002", "last_name": "Smith", "other_names": "Jane"})
+        create_test_insuree(custom_props={"chf_id": "SRCH003", "last_name": "Doe", "other_names": "Smith"})
+
+    def _search(self, text):
+        queryset = Insuree.objects.filter(chf_id__startswith="SRCH")
+        return [insuree.chf_id for insuree in search_insurees(queryset, text)]
+
+    def test_all_terms_required(self):
+        self.assertEqual(self._search("smith jane"), ["SRCH002"])
+
+    def test_ranking(self):
+        results = self._search("smith")
+        self.assertEqual(set(results), {"SRCH001", "SRCH002", "SRCH003"})
+        self.assertLess(results.index("SRCH002"), results.index("SRCH003"))
+
+    def test_insuree_number(self):
+        self.assertEqual(self._search("SRCH003")[0], "SRCH003")
+
+    def test_empty(self):
+        self.assertEqual(len(self._search("  ")), 3)
+
+    def test_trigram_check_refreshed(self):
+        trigram_available(DEFAULT_DB_ALIAS)
+        with self.assertNumQueries(0):
+            trigram_available(DEFAULT_DB_ALIAS)
+        # checked again after TRIGRAM_CHECK_INTERVAL (on PostgreSQL)
+        with mock.patch("insuree.search.time.monotonic", return_value=10 ** 12):
+            available = trigram_available(DEFAULT_DB_ALIAS)
+        self.assertEqual(trigram_available(DEFAULT_DB_ALIAS), available)
@@ -1,6 +1,7 @@
 from django.test import TestCase
 
-from insuree.services import validate_insuree_number
+from insuree.services import validate_insuree_number, validate_insuree_numbers
+from insuree.test_helpers import create_test_insuree
 
 
 class InsureeValidationTest(TestCase):
@@ -59,3 +60,18 @@ class InsureeValidationTest(TestCase):
             self.assertEqual(len(validate_insuree_number("12345")), 1)
             self.assertEqual(len(validate_insuree_number("1234561")), 0)
             self.assertEqual(len(validate_insuree_number("1234560")), 1)
+
+    def test_batch(self):
+        create_test_insuree(with_family=False, custom_props={"chf_id": "1234567"})
+        with self.settings(
+                INSUREE_NUMBER_VALIDATOR=None,
+                INSUREE_NUMBER_LENGTH=7,
+                INSUREE_NUMBER_MODULE_ROOT=5):
+            with self.assertNumQueries(1):
+                results = validate_insuree_numbers(["1234561", "1234567", "12345", "1234561", "1234560"])
+            self.assertEqual(len(results), 5)
+            self.assertEqual(results[0], [])
+            self.assertEqual(results[1][0]["errorCode"], 1)
+            self.assertEqual(results[2][0]["errorCode"], 3)
+            self.assertEqual(results[3][0]["errorCode"], 1)
+            self.assertEqual(results[4][0]["errorCode"], 4)
@@ -0,0 +1,131 @@
+from unittest import mock
+
+from core.test_helpers import create_test_interactive_user
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from graphene import Schema
+from graphene.test import Client
+
+from insuree import schema as insuree_schema
+from insuree.apps import InsureeConfig
+from insuree.models import Insuree
+from insuree.pagination import count_queryset, KeysetOrderedConnectionField
+from insuree.test_helpers import create_test_insuree
+
+
+class BaseTestContext:
+    def __init__(self, user):
+        self.user = user
+
+
+@override_settings(ROW_SECURITY=False)
+class KeysetPaginationTest(TestCase):
+    query = """
+    {
+      insurees(chfId_Istartswith: "KS", ignoreLocation: true, orderBy: ["lastName", "-dob"], %s) {
+        edges { node { chfId } }
+        pageInfo { hasNextPage endCursor }
+      }
+    }
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_test_interactive_user(username="testKeysetPagination")
+        # duplicates on last name and dob, the primary key breaks the ties
+        for i, (last_name, dob) in enumerate([
+                ("B", "1980-01-01"), ("A", "1990-01-01"), ("B", "1980-01-01"), ("A", "1970-01-01"),
+                ("C", "1980-01-01"), ("B", "1985-01-01"), ("A", "1990-01-01")]):
+            create_test_insuree(custom_props={"chf_id": f"KS{i}", "last_name": last_name, "dob": dob})
+
+    def setUp(self):
+        self.client = Client(Schema(query=insuree_schema.Query))
+
+    def _execute(self, args):
+        result = self.client.execute(self.query % args, context=BaseTestContext(self.user))
+        self.assertIsNone(result.get("errors"))
+        return result["data"]["insurees"]
+
+    def test_same_order_as_offset_pagination(self):
+        expected = [edge["node"]["chfId"] for edge in self._execute("first: 10")["edges"]]
+        self.assertEqual(len(expected), 7)
+        chf_ids, after = [], None
+        while True:
+            page = self._execute("keyset: true, first: 3" + (f', after: "{after}"' if after else ""))
+            chf_ids += [edge["node"]["chfId"] for edge in page["edges"]]
+            if not page["pageInfo"]["hasNextPage"]:
+                break
+            after = page["pageInfo"]["endCursor"]
+        self.assertEqual(chf_ids, expected)
+
+    def test_nulls_same_order_as_offset_pagination(self):
+        Insuree.objects.filter(chf_id__in=["KS1", "KS4"]).update(phone="123")
+        Insuree.objects.filter(chf_id="KS2").update(phone="456")
+        query = self.query.replace('orderBy: ["lastName", "-dob"]', "orderBy: [%s]")
+        # the id breaks the ties, for the offset pagination as well
+        for order in ('"phone", "id"', '"-phone", "id"'):
+            def execute(args):
+                result = self.client.execute(query % (order, args), context=BaseTestContext(self.user))
+                self.assertIsNone(result.get("errors"))
+                return result["data"]["insurees"]
+            expected = [edge["node"]["chfId"] for edge in execute("first: 10")["edges"]]
+            chf_ids, after = [], None
+            while True:
+                page = execute("keyset: true, first: 2" + (f', after: "{after}"' if after else ""))
+                chf_ids += [edge["node"]["chfId"] for edge in page["edges"]]
+                if not page["pageInfo"]["hasNextPage"]:
+                    break
+                after = page["pageInfo"]["endCursor"]
+            self.assertEqual(chf_ids, expected)
+
+    def test_invalid_cursor(self):
+        result = self.client.execute(
+            self.query % 'keyset: true, first: 3, after: "bm9wZQ=="', context=BaseTestContext(self.user))
+        self.assertIsNotNone(result.get("errors"))
+
+    def test_max_limit(self):
+        connection = insuree_schema.Query._meta.fields["insurees"].type
+        queryset = Insuree.objects.filter(chf_id__startswith="KS").order_by("last_name")
+        with self.assertRaises(ValueError):
+            KeysetOrderedConnectionField._keyset_connection(connection, {"keyset": True, "first": 6}, queryset, 5)
+        page = KeysetOrderedConnectionField._keyset_connection(connection, {"keyset": True}, queryset, 5)
+        self.assertEqual(len(page.edges), 5)
+        result = self.client.execute(
+            self.query % "keyset: true, first: 1000000", context=BaseTestContext(self.user))
+        self.assertIsNotNone(result.get("errors"))
+
+    def test_count_strategy(self):
+        result = self.client.execute("""
+        {
+          insurees(chfId_Istartswith: "KS", ignoreLocation: true, first: 2, countStrategy: CACHED) {
+            totalCount
+            edges { node { chfId } }
+            pageInfo { hasNextPage }
+          }
+        }
+        """, context=BaseTestContext(self.user))
+        self.assertIsNone(result.get("errors"))
+        self.assertEqual(result["data"]["insurees"]["totalCount"], 7)
+        self.assertEqual(len(result["data"]["insurees"]["edges"]), 2)
+        self.assertTrue(result["data"]["insurees"]["pageInfo"]["hasNextPage"])
+
+    def test_count_strategy_max_limit(self):
+        connection = insuree_schema.Query._meta.fields["insurees"].type
+        queryset = Insuree.objects.filter(chf_id__startswith="KS").order_by("last_name")
+        with self.assertRaises(ValueError):
+            KeysetOrderedConnectionField._offset_connection(
+                connection, {"first": 6, "count_strategy": "cached"}, queryset, 5)
+        page = KeysetOrderedConnectionField._offset_connection(
+            connection, {"count_strategy": "cached"}, queryset, 5)
+        self.assertEqual(len(page.edges), 5)
+
+    @mock.patch.object(InsureeConfig, "total_count_exact_threshold", 3)
+    def test_cached_count(self):
+        cache.clear()
+        queryset = Insuree.objects.filter(chf_id__startswith="KS")
+        self.assertEqual(count_queryset(queryset, "cached"), 7)
+        Insuree.objects.filter(chf_id="KS0").update(chf_id="XS0")
+        # only the bounded count runs, the total comes from the cache
+        with self.assertNumQueries(1):
+            self.assertEqual(count_queryset(queryset, "cached"), 7)
+        self.assertEqual(count_queryset(queryset, "exact"), 6)
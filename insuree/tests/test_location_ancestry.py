@@ -0,0 +1,50 @@
+from unittest import mock
+
+from django.test import TestCase
+from location.test_helpers import create_test_location
+
+from insuree.apps import InsureeConfig
+from insuree.models import LocationAncestry, Family, district_filter, parent_location_filter
+from insuree.services import rebuild_location_ancestry
+from insuree.test_helpers import create_test_insuree
+
+
+class LocationAncestryTest(TestCase):
+    def setUp(self):
+        self.region = create_test_location("R", custom_props={"code": "ANC-R"})
+        self.district = create_test_location("D", custom_props={"code": "ANC-D1", "parent": self.region})
+        self.other_district = create_test_location("D", custom_props={"code": "ANC-D2", "parent": self.region})
+        self.ward = create_test_location("W", custom_props={"code": "ANC-W", "parent": self.district})
+        self.village = create_test_location("V", custom_props={"code": "ANC-V", "parent": self.ward})
+
+    def _ancestors(self, location):
+        return dict(LocationAncestry.objects.filter(location=location).values_list("depth", "ancestor_id"))
+
+    def test_created_locations(self):
+        self.assertEqual(self._ancestors(self.village), {
+            0: self.village.id, 1: self.ward.id, 2: self.district.id, 3: self.region.id})
+
+    def test_moved_location(self):
+        self.ward.parent = self.other_district
+        self.ward.save()
+        self.assertEqual(self._ancestors(self.village), {
+            0: self.village.id, 1: self.ward.id, 2: self.other_district.id, 3: self.region.id})
+        self.assertEqual(self._ancestors(self.ward), {
+            0: self.ward.id, 1: self.other_district.id, 2: self.region.id})
+
+    def test_rebuild(self):
+        expected = self._ancestors(self.village)
+        LocationAncestry.objects.filter(location=self.village).delete()
+        rebuild_location_ancestry()
+        self.assertEqual(self._ancestors(self.village), expected)
+
+    def test_filters(self):
+        insuree = create_test_insuree(
+            custom_props={"chf_id": "ancestry1"}, family_custom_props={"location": self.village})
+        for use_location_ancestry in (False, True):
+            with mock.patch.object(InsureeConfig, "use_location_ancestry", use_location_ancestry):
+                families = Family.objects.filter(district_filter("location", [self.district.id]))
+                self.assertEqual(list(families), [insuree.family])
+                self.assertFalse(Family.objects.filter(district_filter("location", [self.other_district.id])))
+                families = Family.objects.filter(parent_location_filter("location", self.region.uuid, 3))
+                self.assertEqual(list(families), [insuree.family])
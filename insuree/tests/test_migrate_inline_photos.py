@@ -0,0 +1,97 @@
+import base64
+import json
+import os
+import tempfile
+from io import StringIO
+from unittest import mock
+
+from django.core.management import call_command
+from django.test import TestCase
+
+from insuree.apps import InsureeConfig
+from insuree.models import InsureePhoto
+from insuree.photo_storage import get_photo_storage
+from insuree.test_helpers import base64_blank_jpg, create_test_insuree, create_test_photo
+
+
+class MigrateInlinePhotosTest(TestCase):
+    def setUp(self):
+        self.root = tempfile.TemporaryDirectory()
+        patcher = mock.patch.object(InsureeConfig, "insuree_photos_root_path", self.root.name)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(self.root.cleanup)
+        # only the photos of the test are inline
+        InsureePhoto.objects.update(photo=None)
+        self.photos = []
+        for i in range(3):
+            insuree = create_test_insuree(custom_props={"chf_id": f"MIGR{i}"})
+            self.photos.append(create_test_photo(insuree.id, 1, custom_props={"chf_id": f"MIGR{i}"}))
+        self.checkpoint_file = os.path.join(self.root.name, "_migration", "inline_photos.json")
+
+    def _migrate(self, **options):
+        out, err = StringIO(), StringIO()
+        call_command("migrateinlinephotos", chunk_size=2, stdout=out, stderr=err, **options)
+        return out.getvalue(), err.getvalue()
+
+    def _checkpoint(self):
+        with open(self.checkpoint_file) as f:
+            return json.load(f)
+
+    def _files(self):
+        return [os.path.join(folder, name) for folder, _, names in os.walk(self.root.name) for name in names
+                if "_migration" not in folder]
+
+    def _assert_migrated(self, photo):
+        photo = InsureePhoto.objects.with_photo().get(id=photo.id)
+        self.assertIsNone(photo.photo)
+        self.assertEqual(
+            base64.b64decode(get_photo_storage().load_base64(photo.folder, photo.filename)),
+            base64.b64decode(base64_blank_jpg))
+
+    def test_migrate(self):
+        self._migrate()
+        for photo in self.photos:
+            self._assert_migrated(photo)
+        self.assertEqual(self._checkpoint()["migrated"], 3)
+        # nothing left to migrate
+        self.assertIn("Done, 0 photos", self._migrate()[0])
+
+    def test_invalid_base64(self):
+        InsureePhoto.objects.filter(id=self.photos[1].id).update(photo="abcde")
+        out, err = self._migrate()
+        self.assertIn("Photo %s is not valid base64" % self.photos[1].id, err)
+        self.assertEqual(InsureePhoto.objects.with_photo().get(id=self.photos[1].id).photo, "abcde")
+        self._assert_migrated(self.photos[0])
+        self._assert_migrated(self.photos[2])
+        self.assertEqual(self._checkpoint()["migrated"], 2)
+        # one file per migrated photo: no partial file left by the invalid one
+        self.assertEqual(len(self._files()), 2)
+
+    def test_resume(self):
+        self._migrate(max_rows=1)
+        self._assert_migrated(self.photos[0])
+        self.assertIsNotNone(InsureePhoto.objects.with_photo().get(id=self.photos[1].id).photo)
+        checkpoint = self._checkpoint()
+        self.assertEqual((checkpoint["last_id"], checkpoint["migrated"]), (self.photos[0].id, 1))
+        out, _ = self._migrate()
+        self.assertIn("Resuming after photo %s (1 already migrated)" % self.photos[0].id, out)
+        for photo in self.photos:
+            self._assert_migrated(photo)
+        self.assertEqual(self._checkpoint()["migrated"], 3)
+
+    def test_photo_without_insuree(self):
+        InsureePhoto.objects.filter(id=self.photos[1].id).update(insuree=None)
+        out, err = self._migrate()
+        self.assertIn("Photo %s has no insuree" % self.photos[1].id, err)
+        self.assertIsNotNone(InsureePhoto.objects.with_photo().get(id=self.photos[1].id).photo)
+        self._assert_migrated(self.photos[0])
+        self.assertEqual(len(self._files()), 2)
+
+    def test_files_deleted_on_failure(self):
+        with mock.patch.object(InsureePhoto.objects, "bulk_update", side_effect=RuntimeError("failed")):
+            with self.assertRaises(RuntimeError):
+                self._migrate()
+        # the rows are still inline and the files written for them are gone
+        self.assertIsNotNone(InsureePhoto.objects.with_photo().get(id=self.photos[0].id).photo)
+        self.assertEqual(self._files(), [])
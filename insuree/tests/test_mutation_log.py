@@ -0,0 +1,48 @@
+from core.models import MutationLog
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+from insuree.gql_mutations import DeleteInsureesMutation, ChangeInsureeFamilyMutation, UpdateInsureeMutation
+from insuree.models import Insuree, InsureeMutation, FamilyMutation
+from insuree.schema import on_mutation
+from insuree.test_helpers import create_test_insuree
+
+
+class MutationLogTest(TestCase):
+    def _log(self, sender, data):
+        mutation_log = MutationLog.objects.create(json_content="{}", status=MutationLog.RECEIVED)
+        with CaptureQueriesContext(connection) as context:
+            on_mutation(sender, data=data, mutation_log_id=mutation_log.id)
+        return mutation_log, len(context.captured_queries)
+
+    def test_query_count(self):
+        head = create_test_insuree(is_head=True, custom_props={"chf_id": "LOG000"})
+        insurees = [create_test_insuree(with_family=False, custom_props={"chf_id": f"LOG{i:03}", "family": head.family})
+                    for i in range(1, 21)]
+        counts = []
+        for size in (2, 20):
+            mutation_log, count = self._log(DeleteInsureesMutation, {
+                "uuid": head.family.uuid, "uuids": [insuree.uuid for insuree in insurees[:size]]})
+            counts.append(count)
+            self.assertEqual(InsureeMutation.objects.filter(mutation=mutation_log).count(), size)
+            self.assertEqual(FamilyMutation.objects.filter(mutation=mutation_log).count(), 1)
+        self.assertEqual(counts[0], counts[1])
+
+    def test_single_uuid(self):
+        # the single object handlers are unchanged: the uuid key only, an unknown uuid fails
+        insuree = create_test_insuree(custom_props={"chf_id": "LOG100"})
+        mutation_log, _ = self._log(UpdateInsureeMutation, {"uuid": insuree.uuid})
+        self.assertEqual(InsureeMutation.objects.get(mutation=mutation_log).insuree_id, insuree.id)
+        with self.assertRaises(Insuree.DoesNotExist):
+            self._log(UpdateInsureeMutation, {"uuid": "00000000-0000-0000-0000-000000000000"})
+        mutation_log, _ = self._log(ChangeInsureeFamilyMutation, {
+            "family_uuid": insuree.family.uuid, "insuree_uuid": insuree.uuid})
+        self.assertFalse(FamilyMutation.objects.filter(mutation=mutation_log))
+        self.assertFalse(InsureeMutation.objects.filter(mutation=mutation_log))
+
+    def test_unknown_uuids_skipped(self):
+        insuree = create_test_insuree(custom_props={"chf_id": "LOG200"})
+        mutation_log, _ = self._log(DeleteInsureesMutation, {
+            "uuids": [insuree.uuid, "00000000-0000-0000-0000-000000000000"]})
+        self.assertEqual(InsureeMutation.objects.get(mutation=mutation_log).insuree_id, insuree.id)
@@ -0,0 +1,78 @@
+import base64
+import datetime
+import os
+import tempfile
+
+from django.test import TestCase
+
+from insuree.photo_storage import ContentAddressedPhotoStorage, PhotoStorage
+from insuree.test_helpers import base64_blank_jpg
+
+
+class ContentAddressedPhotoStorageTest(TestCase):
+    def setUp(self):
+        self.root = tempfile.TemporaryDirectory()
+        self.storage = ContentAddressedPhotoStorage(self.root.name)
+        self.date = datetime.date(2022, 6, 21)
+
+    def tearDown(self):
+        self.root.cleanup()
+
+    def test_save_and_load(self):
+        folder, filename = self.storage.save(self.date, 1, base64_blank_jpg)
+        self.assertEqual(len(filename), 64)
+        self.assertEqual(
+            base64.b64decode(self.storage.load_base64(folder, filename)),
+            base64.b64decode(base64_blank_jpg))
+
+    def test_deduplication(self):
+        folder1, filename1 = self.storage.save(self.date, 1, base64_blank_jpg)
+        folder2, filename2 = self.storage.save(self.date, 2, base64_blank_jpg)
+        self.assertEqual(filename1, filename2)
+        self.assertNotEqual(folder1, folder2)
+        stat1 = os.stat(self.storage.full_path(folder1, filename1))
+        stat2 = os.stat(self.storage.full_path(folder2, filename2))
+        self.assertEqual(stat1.st_ino, stat2.st_ino)
+
+    def test_copy(self):
+        folder, filename = self.storage.save(self.date, 1, base64_blank_jpg)
+        renewal_date = datetime.date(2023, 6, 21)
+        copy_folder, copy_filename = self.storage.copy(
+            renewal_date, 1, self.storage.full_path(folder, filename))
+        self.assertEqual(copy_filename, filename)
+        self.assertEqual(
+            os.stat(self.storage.full_path(copy_folder, copy_filename)).st_ino,
+            os.stat(self.storage.full_path(folder, filename)).st_ino)
+
+    def test_partial_read(self):
+        folder, filename = self.storage.save(self.date, 1, base64_blank_jpg)
+        content = base64.b64decode(base64_blank_jpg)
+        chunks = self.storage.iter_chunks(folder, filename, chunk_size=7, offset=10, length=20)
+        self.assertEqual(b"".join(chunks), content[10:30])
+
+    def test_variant(self):
+        folder1, filename1 = self.storage.save(self.date, 1, base64_blank_jpg)
+        folder2, filename2 = self.storage.save(self.date, 2, base64_blank_jpg)
+        variant = self.storage.variant(folder1, filename1, "thumbnail")
+        self.assertEqual(variant, self.storage.variant(folder2, filename2, "thumbnail"))
+        # a 1x1 image is already smaller than any thumbnail
+        self.assertEqual(
+            base64.b64decode(self.storage.load_base64(*variant)),
+            base64.b64decode(base64_blank_jpg))
+        with self.assertRaises(ValueError):
+            self.storage.variant(folder1, filename1, "huge")
+
+
+class PhotoStorageTest(TestCase):
+    def setUp(self):
+        self.root = tempfile.TemporaryDirectory()
+        self.storage = PhotoStorage(self.root.name)
+
+    def tearDown(self):
+        self.root.cleanup()
+
+    def test_invalid_base64(self):
+        with self.assertRaises(ValueError):
+            self.storage.save(datetime.date(2022, 6, 21), 1, "abcde")
+        # no partial file left behind
+        self.assertEqual([name for _, _, names in os.walk(self.root.name) for name in names], [])
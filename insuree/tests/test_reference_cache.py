@@ -0,0 +1,29 @@
+from unittest import mock
+
+from django.test import TestCase
+
+from insuree.models import Profession
+from insuree.reference_cache import get_references, references_etag
+
+
+class ReferenceCacheTest(TestCase):
+    def test_cached(self):
+        professions = get_references(Profession)
+        with self.assertNumQueries(0):
+            self.assertEqual(get_references(Profession), professions)
+
+    def test_invalidated_on_save(self):
+        etag = references_etag()
+        count = len(get_references(Profession))
+        Profession.objects.create(id=999, profession="Cached", sort_order=999)
+        self.assertNotEqual(references_etag(), etag)
+        self.assertEqual(len(get_references(Profession)), count + 1)
+        self.assertIn("Cached", [profession.profession for profession in get_references(Profession)])
+
+    def test_expired(self):
+        get_references(Profession)
+        # written outside of Django: the version isn't renewed, the copy is reloaded once expired
+        Profession.objects.bulk_create([Profession(id=998, profession="Legacy", sort_order=998)])
+        self.assertNotIn("Legacy", [profession.profession for profession in get_references(Profession)])
+        with mock.patch("insuree.reference_cache.time.monotonic", return_value=10 ** 12):
+            self.assertIn("Legacy", [profession.profession for profession in get_references(Profession)])
@@ -0,0 +1,79 @@
+from io import StringIO
+
+from core import datetime, datetimedelta
+from django.core.management import call_command
+from django.test import TestCase
+
+from insuree.models import Insuree, PolicyRenewalDetail
+from insuree.services import photo_renewal_due_filter, create_insuree_renewal_details
+from insuree.test_helpers import create_test_insuree, create_test_photo
+
+
+class PhotoRenewalDueTest(TestCase):
+    def test_due(self):
+        now = datetime.datetime.now()
+        child_dob = (now - datetimedelta(years=5)).date()
+        recent, old = now - datetimedelta(months=1), now - datetimedelta(months=36)
+        missing = create_test_insuree(custom_props={"chf_id": "RNW001", "photo_date": None})
+        create_test_insuree(custom_props={"chf_id": "RNW002", "photo_date": old})  # adult, not yet due
+        child_old = create_test_insuree(custom_props={"chf_id": "RNW003", "dob": child_dob, "photo_date": old})
+        create_test_insuree(custom_props={"chf_id": "RNW004", "dob": child_dob, "photo_date": recent})
+        due = Insuree.objects.filter(photo_renewal_due_filter(now), chf_id__startswith="RNW")
+        self.assertEqual({insuree.id for insuree in due}, {missing.id, child_old.id})
+
+
+class RenewalDetailsTest(TestCase):
+    def setUp(self):
+        from policy.models import PolicyRenewal
+        from policy.test_helpers import create_test_policy
+        from product.test_helpers import create_test_product
+        product = create_test_product("RNWD1")
+        recent = datetime.datetime.now() - datetimedelta(months=1)
+        self.renewals, self.expected = [], set()
+        for i in range(3):
+            head = create_test_insuree(is_head=True, custom_props={"chf_id": f"RNWD{i}0", "photo_date": None})
+            create_test_photo(head.id, 1)
+            due = create_test_insuree(
+                with_family=False, custom_props={"chf_id": f"RNWD{i}1", "family": head.family, "photo_date": None})
+            create_test_photo(due.id, 1)
+            # without photo
+            create_test_insuree(with_family=False, custom_props={"chf_id": f"RNWD{i}2", "family": head.family})
+            # photo not due
+            recent_photo = create_test_insuree(
+                with_family=False, custom_props={"chf_id": f"RNWD{i}3", "family": head.family, "photo_date": recent})
+            create_test_photo(recent_photo.id, 1)
+            policy = create_test_policy(product, head)
+            renewal = PolicyRenewal.objects.create(
+                insuree=head, policy=policy, new_product=product, renewal_prompt_date="2023-01-01",
+                renewal_date="2023-02-01", validity_from="2023-01-01", audit_user_id=-1)
+            self.renewals.append(renewal)
+            self.expected |= {(renewal.id, head.id), (renewal.id, due.id)}
+
+    def _details(self):
+        return set(PolicyRenewalDetail.objects
+                   .filter(policy_renewal__in=self.renewals)
+                   .values_list("policy_renewal_id", "insuree_id"))
+
+    def test_create(self):
+        # already created: not duplicated
+        existing = min(self.expected)
+        PolicyRenewalDetail.objects.create(
+            policy_renewal_id=existing[0], insuree_id=existing[1], validity_from="2023-01-01", audit_user_id=0)
+        progress = []
+        created = create_insuree_renewal_details(
+            self.renewals, chunk_size=2, progress=lambda *args: progress.append(args))
+        self.assertEqual(created, 5)
+        self.assertEqual(self._details(), self.expected)
+        self.assertEqual(PolicyRenewalDetail.objects.filter(policy_renewal__in=self.renewals).count(), 6)
+        self.assertEqual(progress, [(2, 3), (3, 5)])
+        self.assertEqual(create_insuree_renewal_details(self.renewals, chunk_size=2), 0)
+
+    def test_command(self):
+        out = StringIO()
+        call_command("createrenewaldetails", chunk_size=2, stdout=out)
+        self.assertEqual(self._details(), self.expected)
+        self.assertIn("renewals,", out.getvalue())
+        out = StringIO()
+        call_command("createrenewaldetails", chunk_size=2, stdout=out)
+        self.assertIn("Created 0 photo renewal details", out.getvalue())
+        self.assertEqual(PolicyRenewalDetail.objects.filter(policy_renewal__in=self.renewals).count(), 6)
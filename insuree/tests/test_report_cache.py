@@ -0,0 +1,62 @@
+from unittest import mock
+
+from core.test_helpers import create_test_interactive_user
+from django.test import TestCase
+
+from insuree.apps import InsureeConfig
+from insuree.report_cache import cached_report, invalidate_report_cache, report_cache_key, report_data_version
+from insuree.services import InsureeService
+from insuree.test_helpers import create_test_insuree
+
+
+class ReportCacheTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_test_interactive_user(username="testReportCache")
+
+    def setUp(self):
+        self.calls = []
+
+        def query(user, **params):
+            self.calls.append(params)
+            return {"data": [{"count": len(self.calls)}]}
+        self.report = cached_report("test_report")(query)
+
+    def test_disabled(self):
+        with mock.patch.object(InsureeConfig, "report_cache_timeout", 0):
+            self.report(self.user, locationId="1")
+            self.report(self.user, locationId="1")
+        self.assertEqual(len(self.calls), 2)
+
+    def test_cached(self):
+        with mock.patch.object(InsureeConfig, "report_cache_timeout", 60):
+            first = self.report(self.user, locationId="1", officerId="")
+            # empty parameters are ignored
+            self.assertEqual(self.report(self.user, locationId="1"), first)
+            self.assertEqual(len(self.calls), 1)
+            self.report(self.user, locationId="2")
+            self.assertEqual(len(self.calls), 2)
+
+    def test_invalidated(self):
+        with mock.patch.object(InsureeConfig, "report_cache_timeout", 60):
+            key = report_cache_key("test_report", {"locationId": "1"}, self.user)
+            self.report(self.user, locationId="1")
+            with self.captureOnCommitCallbacks(execute=True):
+                invalidate_report_cache()
+                # not before the write is committed
+                self.assertEqual(report_cache_key("test_report", {"locationId": "1"}, self.user), key)
+            self.assertNotEqual(report_cache_key("test_report", {"locationId": "1"}, self.user), key)
+            self.report(self.user, locationId="1")
+        self.assertEqual(len(self.calls), 2)
+
+    def test_invalidated_by_writes(self):
+        insuree = create_test_insuree(custom_props={"chf_id": "RPTCACHE1"})
+        version = report_data_version()
+        with self.captureOnCommitCallbacks(execute=True):
+            insuree.save()
+        self.assertNotEqual(report_data_version(), version)
+        # bulk writes send no post_save, the service signal renews the version
+        version = report_data_version()
+        with self.captureOnCommitCallbacks(execute=True):
+            InsureeService(self.user).bulk_set_deleted([insuree])
+        self.assertNotEqual(report_data_version(), version)
@@ -0,0 +1,93 @@
+from unittest import mock
+
+from core.test_helpers import create_test_interactive_user
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from insuree import views
+from insuree.reports.streaming import stream_query, as_dicts
+from insuree.test_helpers import create_test_insuree
+
+
+class ReportStreamingTest(TestCase):
+    sql = 'SELECT "CHFID" AS chf_id, "LastName" AS last_name FROM "tblInsuree" ' \
+          'WHERE "CHFID" LIKE %(prefix)s ORDER BY "CHFID"'
+
+    def setUp(self):
+        for i in range(5):
+            create_test_insuree(custom_props={"chf_id": f"STRM{i}", "last_name": f"Stream{i}"})
+
+    def test_stream(self):
+        with CaptureQueriesContext(connection) as context:
+            streamed = stream_query(self.sql, {"prefix": "STRM%"}, chunk_size=2)
+            rows = iter(streamed)
+            # lazy: nothing is executed before the rows are consumed
+            self.assertEqual(len(context.captured_queries), 0)
+            first = next(rows)
+            self.assertEqual(len(context.captured_queries), 1)
+        rows = [first, *rows]
+        self.assertEqual(streamed.columns, ["chf_id", "last_name"])
+        self.assertEqual([row.chf_id for row in rows], [f"STRM{i}" for i in range(5)])
+        self.assertEqual(tuple(rows[0]), ("STRM0", "Stream0"))
+        self.assertEqual(rows[0].columns, ["chf_id", "last_name"])
+
+    def test_as_dicts(self):
+        rows = as_dicts(stream_query(self.sql, {"prefix": "STRM1%"}))
+        self.assertEqual(rows, [{"chf_id": "STRM1", "last_name": "Stream1"}])
+
+
+class ReportCsvTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_test_interactive_user(username="testReportCsv")
+        cls.noright_user = create_test_interactive_user(username="testReportCsvNoRight", roles=[1])
+
+    def setUp(self):
+        for i in range(3):
+            create_test_insuree(custom_props={"chf_id": f"CSV{i}", "last_name": f"Csv{i}"})
+
+    def _get(self, user, report_name, params=None):
+        request = APIRequestFactory().get(f"/insuree/reports/{report_name}.csv", params or {"prefix": "CSV%"})
+        force_authenticate(request, user=user)
+        return views.report_csv(request, report_name=report_name)
+
+    @staticmethod
+    def _rows(prefix, **kwargs):
+        return stream_query(ReportStreamingTest.sql, {"prefix": prefix}, chunk_size=2)
+
+    def _report(self):
+        return mock.patch.dict(
+            "insuree.report.streamed_reports", {"insuree_missing_photo": (self._rows, {"prefix": str})})
+
+    def test_unknown_report(self):
+        self.assertEqual(self._get(self.user, "insuree_family_overview").status_code, 404)
+        self.assertEqual(self._get(self.user, "no_such_report").status_code, 404)
+
+    def test_permission_denied(self):
+        with self._report():
+            self.assertEqual(self._get(self.noright_user, "insuree_missing_photo").status_code, 403)
+
+    def test_csv(self):
+        with self._report():
+            response = self._get(self.user, "insuree_missing_photo")
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response["Content-Type"], "text/csv")
+            self.assertIn('filename="insuree_missing_photo.csv"', response["Content-Disposition"])
+            content = b"".join(response.streaming_content).decode()
+        self.assertEqual(content.splitlines(), ["chf_id,last_name", "CSV0,Csv0", "CSV1,Csv1", "CSV2,Csv2"])
+
+    def test_empty(self):
+        with self._report():
+            response = self._get(self.user, "insuree_missing_photo", {"prefix": "NONE%"})
+            content = b"".join(response.streaming_content).decode()
+        self.assertEqual(content.splitlines(), ["chf_id,last_name"])
+
+    def test_invalid_parameters(self):
+        with self._report():
+            self.assertEqual(self._get(self.user, "insuree_missing_photo", {"other": "1"}).status_code, 400)
+        response = self._get(self.user, "insuree_missing_photo", {"locationId": "abc"})
+        self.assertEqual(response.status_code, 400)
+        response = self._get(self.user, "enrolled_families", {"date_from": "2020-13-01"})
+        self.assertEqual(response.status_code, 400)
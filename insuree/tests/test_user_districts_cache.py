@@ -0,0 +1,33 @@
+from core.test_helpers import create_test_interactive_user
+from django.test import TestCase
+from location.models import UserDistrict
+from location.test_helpers import create_test_location
+
+from insuree.models import get_user_district_ids
+
+
+class UserDistrictsCacheTest(TestCase):
+    def setUp(self):
+        region = create_test_location("R", custom_props={"code": "UDC-R"})
+        self.district1 = create_test_location("D", custom_props={"code": "UDC-D1", "parent": region})
+        self.district2 = create_test_location("D", custom_props={"code": "UDC-D2", "parent": region})
+        self.user = create_test_interactive_user(username="testUserDistrictsCache", roles=[1])
+        self._assign(self.district1)
+
+    def _assign(self, district):
+        UserDistrict.objects.create(
+            user=self.user.i_user, location=district, validity_from="2019-06-01", audit_user_id=-1)
+
+    def test_cached(self):
+        self.assertEqual(get_user_district_ids(self.user), [self.district1.id])
+        with self.assertNumQueries(0):
+            self.assertEqual(get_user_district_ids(self.user), [self.district1.id])
+            # another request (fresh user object) is served by the Django cache
+            del self.user._u._insuree_district_ids
+            self.assertEqual(get_user_district_ids(self.user), [self.district1.id])
+
+    def test_invalidated_on_change(self):
+        self.assertEqual(get_user_district_ids(self.user), [self.district1.id])
+        # the same (long-lived) user object
+        self._assign(self.district2)
+        self.assertEqual(sorted(get_user_district_ids(self.user)), sorted([self.district1.id, self.district2.id]))
@@ -1 +1,7 @@
-urlpatterns = []
\ No newline at end of file
+from django.urls import path
+from insuree import views
+
+urlpatterns = [
+    path("photos/<str:photo_uuid>/", views.photo, name="insuree_photo"),
+    path("reports/<str:report_name>.csv", views.report_csv, name="insuree_report_csv"),
+]
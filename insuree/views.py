@@ -1 +1,174 @@
-# Create your views here.
+import base64
+import csv
+import hashlib
+import re
+from os import path
+
+from django.http import HttpResponse, HttpResponseNotModified, StreamingHttpResponse, Http404, \
+    HttpResponseBadRequest
+from django.utils.http import http_date, parse_http_date_safe, quote_etag
+from rest_framework.decorators import api_view
+from rest_framework.exceptions import PermissionDenied
+
+from .apps import InsureeConfig
+from .models import Insuree, InsureePhoto
+from .photo_storage import get_photo_storage, inline_variant
+
+RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+def _content_type(head):
+    if head.startswith(b"\xff\xd8"):
+        return "image/jpeg"
+    if head.startswith(b"\x89PNG"):
+        return "image/png"
+    if head.startswith(b"GIF8"):
+        return "image/gif"
+    return "application/octet-stream"
+
+
+def _byte_range(range_header, size):
+    """
+    Parses a single "bytes=start-end" range, returns (offset, length), None to serve the whole content
+    or False if the range cannot be satisfied. Multiple ranges are not supported (whole content is served).
+    """
+    match = RANGE_RE.match(range_header or "")
+    if not match or size == 0:
+        return None
+    start, end = match.groups()
+    if not start and not end:
+        return None
+    if not start:
+        # suffix range: last <end> bytes
+        length = min(int(end), size)
+        return (size - length, length) if length else False
+    start = int(start)
+    end = min(int(end), size - 1) if end else size - 1
+    if start >= size or end < start:
+        return False
+    return start, end - start + 1
+
+
+def _not_modified(request, etag, last_modified):
+    if_none_match = request.headers.get("If-None-Match")
+    if if_none_match:
+        return etag in [tag.strip() for tag in if_none_match.split(",")] or if_none_match.strip() == "*"
+    if_modified_since = parse_http_date_safe(request.headers.get("If-Modified-Since", ""))
+    return if_modified_since is not None and last_modified is not None and last_modified <= if_modified_since
+
+
+@api_view(["GET"])
+def photo(request, photo_uuid):
+    """
+    Streams the photo bytes, with ETag/Last-Modified validation and (single) Range support.
+    The optional size query parameter selects a resized variant (see insuree_photo_sizes).
+    """
+    # checked at request time: the rights are only configured once the app is ready
+    if not request.user.has_perms(InsureeConfig.gql_query_insuree_photo_perms):
+        raise PermissionDenied()
+    size = request.GET.get("size")
+    if size and size not in InsureeConfig.insuree_photo_sizes:
+        return HttpResponseBadRequest("Unknown photo size %s" % size)
+    insuree_photo = InsureePhoto.objects \
+        .filter(uuid=photo_uuid, insuree__in=Insuree.get_queryset(None, request.user)) \
+        .first()
+    if insuree_photo is None:
+        raise Http404()
+
+    storage = None
+    if insuree_photo.filename and InsureeConfig.insuree_photos_root_path:
+        storage = get_photo_storage()
+        folder, filename = insuree_photo.folder, insuree_photo.filename
+        try:
+            if size:
+                folder, filename = storage.variant(folder, filename, size)
+            stat = storage.stat(folder, filename)
+        except FileNotFoundError:
+            raise Http404()
+        content_length = stat.st_size
+        last_modified = int(stat.st_mtime)
+        # files are never overwritten, their path identifies their content
+        etag = quote_etag(hashlib.md5(path.join(folder, filename).encode("utf-8")).hexdigest())
+        head = b"".join(storage.iter_chunks(folder, filename, length=8))
+    elif insuree_photo.photo:
+        content = inline_variant(insuree_photo.photo, size) if size else base64.b64decode(insuree_photo.photo)
+        content_length = len(content)
+        last_modified = int(insuree_photo.validity_from.timestamp()) if insuree_photo.validity_from else None
+        etag = quote_etag(hashlib.md5(content).hexdigest())
+        head = content[:8]
+    else:
+        raise Http404()
+
+    headers = {"ETag": etag, "Accept-Ranges": "bytes", "Cache-Control": "private, max-age=86400"}
+    if last_modified is not None:
+        headers["Last-Modified"] = http_date(last_modified)
+    if _not_modified(request, etag, last_modified):
+        response = HttpResponseNotModified()
+        for key, value in headers.items():
+            response[key] = value
+        return response
+
+    byte_range = _byte_range(request.headers.get("Range"), content_length)
+    if byte_range is False:
+        response = HttpResponse(status=416)
+        response["Content-Range"] = "bytes */%s" % content_length
+        return response
+    offset, length = byte_range if byte_range else (0, content_length)
+
+    if storage:
+        response = StreamingHttpResponse(
+            storage.iter_chunks(folder, filename, offset=offset, length=length),
+            content_type=_content_type(head))
+    else:
+        response = HttpResponse(content[offset:offset + length], content_type=_content_type(head))
+    if byte_range:
+        response.status_code = 206
+        response["Content-Range"] = "bytes %s-%s/%s" % (offset, offset + length - 1, content_length)
+    response["Content-Length"] = str(length)
+    for key, value in headers.items():
+        response[key] = value
+    return response
+
+
+class _Echo:
+    # csv writer "file" returning the written line instead of storing it
+    def write(self, value):
+        return value
+
+
+def _csv_lines(rows):
+    writer = csv.writer(_Echo())
+    iterator = iter(rows)
+    first = next(iterator, None)
+    # the header comes from the cursor description, also written for an empty report
+    yield writer.writerow(rows.columns)
+    if first is not None:
+        yield writer.writerow(first)
+    for row in iterator:
+        yield writer.writerow(row)
+
+
+@api_view(["GET"])
+def report_csv(request, report_name):
+    """
+    Streams the rows of a raw SQL report (see report.streamed_reports) as CSV, without ReportBro rendering:
+    rows are fetched and sent by chunks, the memory usage doesn't depend on the size of the report.
+    The query parameters are the ones of the report (officerId, locationId,...), others are rejected.
+    """
+    from .report import report_definitions, streamed_reports
+    if report_name not in streamed_reports:
+        raise Http404()
+    rows, parsers = streamed_reports[report_name]
+    definition = next(definition for definition in report_definitions if definition["name"] == report_name)
+    if not request.user.has_perms(definition["permission"]):
+        raise PermissionDenied()
+    unknown = sorted(set(request.GET) - set(parsers))
+    if unknown:
+        return HttpResponseBadRequest("Unknown parameters: %s" % ", ".join(unknown))
+    try:
+        params = {name: parsers[name](value) for name, value in request.GET.items() if value != ""}
+    except ValueError as exc:
+        return HttpResponseBadRequest("Invalid parameter: %s" % exc)
+    response = StreamingHttpResponse(_csv_lines(rows(**params)), content_type="text/csv")
+    response["Content-Disposition"] = 'attachment; filename="%s.csv"' % report_name
+    return response